@@ -1,11 +1,15 @@
 import streamlit as st
-import geopandas as gpd
-import json
-from keplergl import KeplerGl
-from streamlit_keplergl import keplergl_static
 from navigation import load_sidebar
+from twinning.mapview import MapLayer, map_geometry, map_view
+from twinning.pagestate import page_mode, prefetch, set_page_mode
+from twinning.scenarios import S2_S1, S3_S2, step_matrix
+from twinning.schemes import SCHEME_LABELS, scheme_classes
+from twinning.timing import PageRun, timed_fragment
 
-CARTO_DARK = "https://basemaps.cartocdn.com/gl/dark-matter-gl-style/style.json"
+PAGE = "Emissions comparison"
+
+# Server time of this run (twinning.timing)
+page_run = PageRun(PAGE)
 
 # ============================================================
 # --- PAGE SETUP & STYLE ---
@@ -79,8 +83,8 @@ div[data-testid="stSlider"] div[data-testid="stTickBar"] > div:last-child > div
 # ============================================================
 # --- INITIALIZE NAVIGATION STATE ---
 # ============================================================
-if "mode" not in st.session_state:
-    st.session_state.mode = "S3_S2"  # default page
+# This page's own comparison, restorable from ?mode= (twinning.pagestate)
+mode = page_mode(PAGE)
 
 # ============================================================
 # --- SHARED UTILITIES ---
@@ -105,47 +109,20 @@ def make_color_legend(title, colors, labels, reverse=False):
     st.markdown(html, unsafe_allow_html=True)
 
 
-def get_color(value, thresholds, palette, reverse=False):
-    """Assign colors by threshold range. If reverse=True, lowest values = brightest colors."""
-    if reverse:
-        palette = list(reversed(palette))
-    if value <= thresholds[0]: return palette[0]
-    elif value <= thresholds[1]: return palette[1]
-    elif value <= thresholds[2]: return palette[2]
-    elif value <= thresholds[3]: return palette[3]
-    elif value <= thresholds[4]: return palette[4]
-    elif value <= thresholds[5]: return palette[5]
-    elif value <= thresholds[6]: return palette[6]
-    else: return palette[-1]
-
-
-
-# <<< CACHING ADDED HERE
-@st.cache_data(show_spinner="Loading dataset...")
-def load_dataset(path: str) -> gpd.GeoDataFrame:
-    """
-    Load a GeoPackage, reproject to WGS84 if needed, and
-    precompute geometry_json so we don't redo this every rerun.
-    This result is cached per 'path'.
-    """
-    gdf = gpd.read_file(path)
-
-    # Ensure WGS84 for kepler.gl
-    if gdf.crs and gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(4326)
+COLOR_PALETTE = ["#3B0A45", "#78001E", "#B52F0D", "#D65E00", "#E98000", "#F3A300", "#FFD400"]
 
-    # Precompute geometry_json once (doesn't depend on slider/thresholds)
-    if "geometry_json" not in gdf.columns:
-        gdf = gdf.copy()
-        gdf["geometry_json"] = gdf["geometry"].apply(
-            lambda geom: json.dumps(geom.__geo_interface__)
-        )
+# Class breaks: the page's own thresholds, or a scheme computed from the data
+scheme = st.sidebar.selectbox("Classification", list(SCHEME_LABELS), format_func=SCHEME_LABELS.get, key="scheme")
 
-    return gdf
-# <<< END CACHING
+# Move the remote-working slider in the browser: the maps recolour without reruns
+client_slider = st.sidebar.toggle("Slider in the browser", key="client_slider")
+SLIDER_LABEL = "Remote-working population, %"
 
+# Draw the grid as an image, one pixel per cell: a much smaller first load
+raster_grid = st.sidebar.toggle("Grid as image", key="raster_grid")
 
-COLOR_PALETTE = ["#3B0A45", "#78001E", "#B52F0D", "#D65E00", "#E98000", "#F3A300", "#FFD400"]
+# Only the tiles in view instead of every feature (needs `python -m twinning.tiles`)
+vector_tiles = st.sidebar.toggle("Vector tiles", key="vector_tiles")
 
 # ============================================================
 # --- MANUAL THRESHOLDS (EDIT THESE) ---
@@ -166,224 +143,128 @@ PERC_THRESHOLDS_S2S1 = [2.5, 5, 11, 18, 25, 35, 45]
 # ============================================================
 # --- PAGE 1: S3 vs S2 (mostly negative, lowest = brightest) ---
 # ============================================================
-if st.session_state.mode == "S3_S2":
+if mode == "S3_S2":
     st.markdown("<h3>Difference in the amount of CO2 emissions at the selected percentage of the remote-working population VS at the remote-working population percentage in S3</h3>", unsafe_allow_html=True)
 
     if st.button("S2 vs S1 comparison"):
-        st.session_state.mode = "S2_S1"
+        set_page_mode(PAGE, "S2_S1")
         st.rerun()
 
-    gdf = load_dataset("Datasets/Grid maps/s2_s3_emissions_diff.gpkg")
-    gdf["absolute_change"] = gdf["absolute_change"] / 1000
-
-    # Use manual thresholds (ABS + PERC)
-    thresholds_abs = ABS_THRESHOLDS_S3S2
-    # Convert percent thresholds to fractions for internal use
-    thresholds_perc = [v / 100.0 for v in PERC_THRESHOLDS_S3S2]
-
-    col_slider, _, opacity_slider, _ = st.columns([0.35, 0.15, 0.35, 0.15])
-    with col_slider:
-        st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
-        slider_val = st.slider("slider_s3s2", 24.0, 47.3, 47.3, 0.1, format="%.1f", label_visibility="collapsed")
-    with opacity_slider:
-        st.markdown("<p style='font-weight:600; margin-bottom:6px;'>Opacity</p>", unsafe_allow_html=True)
-        opacity_val = st.slider("opacity_s3s2", float(0), float(1), float(0.8), float(0.01), label_visibility="collapsed")
-
-    factor = (47.3 - slider_val) / (47.3 - 24.0)
-    gdf["Absolute change in the amount of CO2 emissions, kg"] = (gdf["absolute_change"] * (1 - factor)).round(1)
-    gdf["Percentage change numeric"] = gdf["percentage_change"] * (1 - factor) * 100  # numeric %
-    gdf["Percentage change formatted"] = gdf["Percentage change numeric"].map(lambda v: f"{v:.1f}%")
-
-    # Lowest = brightest for S3 vs S2
-    gdf["color_abs_hex"] = gdf["Absolute change in the amount of CO2 emissions, kg"].apply(
-        lambda v: get_color(v, thresholds_abs, COLOR_PALETTE, reverse=True)
-    )
-    gdf["color_perc_hex"] = (gdf["percentage_change"] * (1 - factor)).apply(
-        lambda v: get_color(v, thresholds_perc, COLOR_PALETTE, reverse=True)
-    )
-
-    gdf["geometry_json"] = gdf["geometry"].apply(lambda g: json.dumps(g.__geo_interface__))
-
-    df_abs = gdf[["Absolute change in the amount of CO2 emissions, kg", "geometry_json"]].copy()
-    df_abs["Colour code"] = gdf["color_abs_hex"]
-
-    df_perc = gdf[["Percentage change formatted", "geometry_json"]].copy()
-    df_perc["Colour code"] = gdf["color_perc_hex"]
-
-    kepler_config = lambda data_id: {
-        "version": "v1",
-        "config": {
-            "mapState": {
-                "latitude": 60.259889999999984,
-                "longitude": 25.2,
-                "zoom": 8.6,
-                "bearing": 0,
-                "pitch": 0,
-            },
-            "mapStyle": {
-                # Use custom style instead of the built-in "dark"
-                "styleType": "carto_dark",
-                "mapStyles": [
-                    {
-                        "id": "carto_dark",
-                        "label": "Carto Dark",
-                        "url": CARTO_DARK,  # style.json URL
-                    }
-                ],
-            },
-            "visState": {
-                "layers": [{
-                    "id": f"{data_id}_layer",
-                    "type": "geojson",
-                    "config": {
-                        "dataId": data_id,
-                        "columns": {"geojson": "geometry_json"},
-                        "isVisible": True,
-                        "visConfig": {
-                            "opacity": opacity_val,
-                            "filled": True,
-                            "colorRange": {"colors": COLOR_PALETTE},
-                        },
-                    },
-                    "visualChannels": {
-                        "colorField": {"name": "Colour code", "type": "string"},
-                        "colorScale": "ordinal",
-                    },
-                }],
-            },
-            "options": {
-                "centerMap": False,   # <- don't auto-fit to data bounds
-                "readOnly": False,    # or True if you don't want the user to pan/zoom
-            },
-        },
-    }
-
-    col1, col2 = st.columns(2)
-    with col1:
-        st.markdown("**Absolute Change**")
-        map_abs = KeplerGl(height=380, data={"absolute_change": df_abs}, config=kepler_config("absolute_change"))
-        keplergl_static(map_abs, height=380, width=560)
-        make_color_legend(
-            "Legend: Absolute change in the amount of CO2 emissions, kg",
-            COLOR_PALETTE[::-1], [f"≤ {v:.1f}" for v in thresholds_abs], reverse=False
-        )
-    with col2:
-        st.markdown("**Percentage Change**")
-        map_perc = KeplerGl(height=380, data={"percentage_change": df_perc}, config=kepler_config("percentage_change"))
-        keplergl_static(map_perc, height=380, width=560)
-        make_color_legend(
-            "Legend: Percentage change in the amount of CO2 emissions (%)",
-            COLOR_PALETTE[::-1], [f"≤ {v:.1f}%" for v in PERC_THRESHOLDS_S3S2], reverse=False
-        )
+    path = "Datasets/Grid maps/s2_s3_emissions_diff.gpkg"
+
+    # Sliders, maps and legends rerun on their own when one of their widgets changes
+    @timed_fragment(PAGE)
+    def maps_s3s2():
+        # Use manual thresholds (ABS + PERC)
+        thresholds_abs = ABS_THRESHOLDS_S3S2
+        # Convert percent thresholds to fractions for internal use
+        thresholds_perc = [v / 100.0 for v in PERC_THRESHOLDS_S3S2]
+
+        col_slider, _, opacity_slider, _ = st.columns([0.35, 0.15, 0.35, 0.15])
+        with col_slider:
+            st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
+            if client_slider:
+                slider_val = S3_S2.full  # where the maps' own sliders start
+                st.caption("Drag the slider on the maps")
+            else:
+                slider_val = st.slider("slider_s3s2", S3_S2.minimum, S3_S2.maximum, S3_S2.full, S3_S2.step, format="%.1f", label_visibility="collapsed")
+        with opacity_slider:
+            st.markdown("<p style='font-weight:600; margin-bottom:6px;'>Opacity</p>", unsafe_allow_html=True)
+            opacity_val = st.slider("opacity_s3s2", float(0), float(1), float(0.8), float(0.01), label_visibility="collapsed")
+
+        thresholds_abs, classes_abs = scheme_classes(path, "absolute_change", scheme, tuple(COLOR_PALETTE), tuple(thresholds_abs), reverse=True, unit=1000)
+        matrix_abs = step_matrix(path, "absolute_change", S3_S2, thresholds_abs, unit=1000, decimals=1, nan_as_max=True)
+        thresholds_perc, classes_perc = scheme_classes(path, "percentage_change", scheme, tuple(COLOR_PALETTE), tuple(thresholds_perc), "≤ {:.1%}", reverse=True)
+        matrix_perc = step_matrix(path, "percentage_change", S3_S2, thresholds_perc, nan_as_max=True)
+        geometry = map_geometry(path, raster=raster_grid, tiles=vector_tiles)
+
+        col1, col2 = st.columns(2)
+        col1.markdown("**Absolute Change**")
+        col2.markdown("**Percentage Change**")
+        # One map component for both views: one copy of the grid, panning together
+        map_view(geometry, [
+            MapLayer("Absolute change in the amount of CO2 emissions, kg", matrix_abs, classes_abs),
+            MapLayer("Percentage change", matrix_perc, classes_perc, scale=100, suffix="%"),
+        ], slider_val, opacity_val, client=client_slider, slider_label=SLIDER_LABEL, key="emissions_maps")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            make_color_legend(
+                "Legend: Absolute change in the amount of CO2 emissions, kg",
+                classes_abs.colours, classes_abs.labels
+            )
+        with col2:
+            make_color_legend(
+                "Legend: Percentage change in the amount of CO2 emissions (%)",
+                classes_perc.colours, classes_perc.labels
+            )
+
+    maps_s3s2()
+
+    # The other comparison is a click away: load it in the background
+    prefetch("Datasets/Grid maps/s1_s2_emissions_diff.gpkg", shown=path)
 
 # ============================================================
 # --- PAGE 2: S2 vs S1 (mostly positive, highest = brightest) ---
 # ============================================================
-elif st.session_state.mode == "S2_S1":
+elif mode == "S2_S1":
     st.markdown("<h3>Difference in the amount of CO2 emissions at the selected percentage of the remote-working population VS at the remote-working population percentage in S3</h3>", unsafe_allow_html=True)
 
     if st.button("Back to S3 vs S2"):
-        st.session_state.mode = "S3_S2"
+        set_page_mode(PAGE, "S3_S2")
         st.rerun()
 
-    gdf = load_dataset("Datasets/Grid maps/s1_s2_emissions_diff.gpkg")
-    gdf["absolute_change"] = gdf["absolute_change"] / 1000
-
-    # Use manual thresholds (ABS + PERC)
-    thresholds_abs = ABS_THRESHOLDS_S2S1
-    thresholds_perc = [v / 100.0 for v in PERC_THRESHOLDS_S2S1]
-
-    col_slider, _, opacity_slider, _ = st.columns([0.35, 0.15, 0.35, 0.15])
-    with col_slider:
-        st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
-        slider_val = st.slider("slider_s2s1", 0.0, 24.0, 0.0, 0.1, format="%.1f", label_visibility="collapsed")
-    with opacity_slider:
-        st.markdown("<p style='font-weight:600; margin-bottom:6px;'>Opacity</p>", unsafe_allow_html=True)
-        opacity_val = st.slider("opacity_s3s2", float(0), float(1), float(0.8), float(0.01), label_visibility="collapsed")
-
-    factor = slider_val / 24.0
-    gdf["Absolute change in the amount of CO2 emissions, kg"] = (gdf["absolute_change"] * (1 - factor)).round(1)
-    gdf["Percentage change numeric"] = gdf["percentage_change"] * (1 - factor) * 100
-    gdf["Percentage change formatted"] = gdf["Percentage change numeric"].map(lambda v: f"{v:.1f}%")
-
-    # Highest = brightest for S2 vs S1
-    gdf["color_abs_hex"] = gdf["Absolute change in the amount of CO2 emissions, kg"].apply(
-        lambda v: get_color(v, thresholds_abs, COLOR_PALETTE)
-    )
-    gdf["color_perc_hex"] = (gdf["percentage_change"] * (1 - factor)).apply(
-        lambda v: get_color(v, thresholds_perc, COLOR_PALETTE)
-    )
-
-    gdf["geometry_json"] = gdf["geometry"].apply(lambda g: json.dumps(g.__geo_interface__))
-
-    df_abs = gdf[["Absolute change in the amount of CO2 emissions, kg", "geometry_json"]].copy()
-    df_abs["Colour code"] = gdf["color_abs_hex"]
-
-    df_perc = gdf[["Percentage change formatted", "geometry_json"]].copy()
-    df_perc["Colour code"] = gdf["color_perc_hex"]
-
-    kepler_config = lambda data_id: {
-        "version": "v1",
-        "config": {
-            "mapState": {
-                "latitude": 60.259889999999984,
-                "longitude": 25.2,
-                "zoom": 8.6,
-                "bearing": 0,
-                "pitch": 0,
-            },
-            "mapStyle": {
-                # Use custom style instead of the built-in "dark"
-                "styleType": "carto_dark",
-                "mapStyles": [
-                    {
-                        "id": "carto_dark",
-                        "label": "Carto Dark",
-                        "url": CARTO_DARK,  # style.json URL
-                    }
-                ],
-            },
-            "visState": {
-                "layers": [{
-                    "id": f"{data_id}_layer",
-                    "type": "geojson",
-                    "config": {
-                        "dataId": data_id,
-                        "columns": {"geojson": "geometry_json"},
-                        "isVisible": True,
-                        "visConfig": {
-                            "opacity": opacity_val,
-                            "filled": True,
-                            "colorRange": {"colors": COLOR_PALETTE},
-                        },
-                    },
-                    "visualChannels": {
-                        "colorField": {"name": "Colour code", "type": "string"},
-                        "colorScale": "ordinal",
-                    },
-                }],
-            },
-            "options": {
-                "centerMap": False,   # <- don't auto-fit to data bounds
-                "readOnly": False,    # or True if you don't want the user to pan/zoom
-            },
-        },
-    }
-
-    col1, col2 = st.columns(2)
-    with col1:
-        st.markdown("**Absolute Change**")
-        map_abs = KeplerGl(height=380, data={"absolute_change": df_abs}, config=kepler_config("absolute_change"))
-        keplergl_static(map_abs, height=380, width=560)
-        make_color_legend(
-            "Legend: Absolute change in the amount of CO2 emissions, kg",
-            COLOR_PALETTE, [f"≤ {v:.1f}" for v in thresholds_abs]
-        )
-    with col2:
-        st.markdown("**Percentage Change**")
-        map_perc = KeplerGl(height=380, data={"percentage_change": df_perc}, config=kepler_config("percentage_change"))
-        keplergl_static(map_perc, height=380, width=560)
-        make_color_legend(
-            "Legend: Percentage change in the amount of CO2 emissions (%)",
-            COLOR_PALETTE, [f"≤ {v:.1f}%" for v in PERC_THRESHOLDS_S2S1]
-        )
+    path = "Datasets/Grid maps/s1_s2_emissions_diff.gpkg"
+
+    # Sliders, maps and legends rerun on their own when one of their widgets changes
+    @timed_fragment(PAGE)
+    def maps_s2s1():
+        # Use manual thresholds (ABS + PERC)
+        thresholds_abs = ABS_THRESHOLDS_S2S1
+        thresholds_perc = [v / 100.0 for v in PERC_THRESHOLDS_S2S1]
+
+        col_slider, _, opacity_slider, _ = st.columns([0.35, 0.15, 0.35, 0.15])
+        with col_slider:
+            st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
+            if client_slider:
+                slider_val = S2_S1.full  # where the maps' own sliders start
+                st.caption("Drag the slider on the maps")
+            else:
+                slider_val = st.slider("slider_s2s1", S2_S1.minimum, S2_S1.maximum, S2_S1.full, S2_S1.step, format="%.1f", label_visibility="collapsed")
+        with opacity_slider:
+            st.markdown("<p style='font-weight:600; margin-bottom:6px;'>Opacity</p>", unsafe_allow_html=True)
+            opacity_val = st.slider("opacity_s3s2", float(0), float(1), float(0.8), float(0.01), label_visibility="collapsed")
+
+        thresholds_abs, classes_abs = scheme_classes(path, "absolute_change", scheme, tuple(COLOR_PALETTE), tuple(thresholds_abs), unit=1000)
+        matrix_abs = step_matrix(path, "absolute_change", S2_S1, thresholds_abs, unit=1000, decimals=1, nan_as_max=True)
+        thresholds_perc, classes_perc = scheme_classes(path, "percentage_change", scheme, tuple(COLOR_PALETTE), tuple(thresholds_perc), "≤ {:.1%}")
+        matrix_perc = step_matrix(path, "percentage_change", S2_S1, thresholds_perc, nan_as_max=True)
+        geometry = map_geometry(path, raster=raster_grid, tiles=vector_tiles)
+
+        col1, col2 = st.columns(2)
+        col1.markdown("**Absolute Change**")
+        col2.markdown("**Percentage Change**")
+        # One map component for both views: one copy of the grid, panning together
+        map_view(geometry, [
+            MapLayer("Absolute change in the amount of CO2 emissions, kg", matrix_abs, classes_abs),
+            MapLayer("Percentage change", matrix_perc, classes_perc, scale=100, suffix="%"),
+        ], slider_val, opacity_val, client=client_slider, slider_label=SLIDER_LABEL, key="emissions_maps")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            make_color_legend(
+                "Legend: Absolute change in the amount of CO2 emissions, kg",
+                classes_abs.colours, classes_abs.labels
+            )
+        with col2:
+            make_color_legend(
+                "Legend: Percentage change in the amount of CO2 emissions (%)",
+                classes_perc.colours, classes_perc.labels
+            )
+
+    maps_s2s1()
+
+    # The other comparison is a click away: load it in the background
+    prefetch("Datasets/Grid maps/s2_s3_emissions_diff.gpkg", shown=path)
+
+page_run.done()
@@ -1,11 +1,16 @@
 import streamlit as st
-import geopandas as gpd
-import json
-from keplergl import KeplerGl
-from streamlit_keplergl import keplergl_static
 from navigation import load_sidebar
+from twinning.datasets import load_dataset
+from twinning.mapview import MapLayer, map_geometry, map_view
+from twinning.pagestate import page_mode, prefetch, set_page_mode
+from twinning.scenarios import S2_S1, S3_S2, step_matrix
+from twinning.schemes import SCHEME_LABELS, scheme_classes
+from twinning.timing import PageRun, timed_fragment
 
-CARTO_DARK = "https://basemaps.cartocdn.com/gl/dark-matter-gl-style/style.json"
+PAGE = "Remote workers comparison"
+
+# Server time of this run (twinning.timing)
+page_run = PageRun(PAGE)
 
 
 # ============================================================
@@ -80,8 +85,8 @@ div[data-testid="stSlider"] div[data-testid="stTickBar"] > div:last-child > div
 # ============================================================
 # --- INITIALIZE NAVIGATION STATE ---
 # ============================================================
-if "mode" not in st.session_state:
-    st.session_state.mode = "S3_S2"   # default page
+# This page's own comparison, restorable from ?mode= (twinning.pagestate)
+mode = page_mode(PAGE)
 
 # ============================================================
 # --- SHARED UTILITIES ---
@@ -105,281 +110,130 @@ def make_color_legend(title, colors, labels, reverse=False):
     st.markdown(html, unsafe_allow_html=True)
 
 
-def get_color(value, thresholds, palette, reverse=False):
-    if reverse:
-        if value <= thresholds[0]: return palette[-1]
-        elif value <= thresholds[1]: return palette[-2]
-        elif value <= thresholds[2]: return palette[-3]
-        elif value <= thresholds[3]: return palette[-4]
-        elif value <= thresholds[4]: return palette[-5]
-        elif value <= thresholds[5]: return palette[-6]
-        else: return palette[0]
-    else:
-        if value <= thresholds[0]: return palette[0]
-        elif value <= thresholds[1]: return palette[1]
-        elif value <= thresholds[2]: return palette[2]
-        elif value <= thresholds[3]: return palette[3]
-        elif value <= thresholds[4]: return palette[4]
-        elif value <= thresholds[5]: return palette[5]
-        elif value <= thresholds[6]: return palette[6]
-        else: return palette[-1]
-
-
-# <<< CACHING ADDED HERE
-@st.cache_data(show_spinner="Loading dataset...")
-def load_dataset(path: str) -> gpd.GeoDataFrame:
-    """
-    Load a GeoPackage, reproject to WGS84 if needed, and
-    precompute geometry_json so we don't redo this every rerun.
-    This result is cached per 'path'.
-    """
-    gdf = gpd.read_file(path)
+COLOR_PALETTE = ["#3B0A45", "#78001E", "#B52F0D", "#D65E00", "#E98000", "#F3A300", "#FFD400"]
 
-    # Ensure WGS84 for kepler.gl
-    if gdf.crs and gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(4326)
+# Class breaks: the page's own thresholds, or a scheme computed from the data
+scheme = st.sidebar.selectbox("Classification", list(SCHEME_LABELS), format_func=SCHEME_LABELS.get, key="scheme")
 
-    # Precompute geometry_json once (doesn't depend on slider/thresholds)
-    if "geometry_json" not in gdf.columns:
-        gdf = gdf.copy()
-        gdf["geometry_json"] = gdf["geometry"].apply(
-            lambda geom: json.dumps(geom.__geo_interface__)
-        )
+# Move the remote-working slider in the browser: the maps recolour without reruns
+client_slider = st.sidebar.toggle("Slider in the browser", key="client_slider")
+SLIDER_LABEL = "Remote-working population, %"
 
-    return gdf
-# <<< END CACHING
+# Draw the grid as an image, one pixel per cell: a much smaller first load
+raster_grid = st.sidebar.toggle("Grid as image", key="raster_grid")
 
-COLOR_PALETTE = ["#3B0A45", "#78001E", "#B52F0D", "#D65E00", "#E98000", "#F3A300", "#FFD400"]
+# Only the tiles in view instead of every feature (needs `python -m twinning.tiles`)
+vector_tiles = st.sidebar.toggle("Vector tiles", key="vector_tiles")
 
 # ============================================================
 # --- PAGE 1: S3 vs S2 ---
 # ============================================================
-if st.session_state.mode == "S3_S2":
+if mode == "S3_S2":
     st.markdown("<h3>Difference in the number of remote workers at the selected percentage of the remote-working population VS at the remote-working population percentage in S3</h3>", unsafe_allow_html=True)
 
     # Centered button right under title
     if st.button("S2 vs S1 comparison"):
-        st.session_state.mode = "S2_S1"
+        set_page_mode(PAGE, "S2_S1")
         st.rerun()
 
-    gdf = load_dataset("Datasets/Grid maps/s2_s3_remote_workers_diff.gpkg")
-
-    quantiles_abs = [0.25, 0.4, 0.6, 0.74, 0.8, 0.9, 0.97]
-    thresholds_abs = gdf["absolute_change"].quantile(quantiles_abs).tolist()
-    thresholds_perc = [0.15, 0.25, 0.4, 0.6, 0.85, 1, 1.15]
-
-    # --- Slider layout below button ---
-    col_slider, _, opacity_slider, _ = st.columns([0.35, 0.15, 0.35, 0.15])
-    with col_slider:
-        st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
-        slider_val = st.slider("slider_s3s2", 24.0, 47.3, 47.3, 0.1, format="%.1f", label_visibility="collapsed")
-    with opacity_slider:
-        st.markdown("<p style='font-weight:600; margin-bottom:6px;'>Opacity</p>", unsafe_allow_html=True)
-        opacity_val = st.slider("opacity_s3s2", float(0), float(1), float(0.8), float(0.01), label_visibility="collapsed")
-
-    # --- Data transformation ---
-    factor = (47.3 - slider_val) / (47.3 - 24.0)
-    gdf["Absolute change in the number of remote workers"] = (gdf["absolute_change"] * (1 - factor)).round(1)
-    gdf["Percentage change in the number of remote workers (%)"] = gdf["percentage_change"] * (1 - factor)
-    gdf["color_abs_hex"] = gdf["Absolute change in the number of remote workers"].apply(lambda v: get_color(v, thresholds_abs, COLOR_PALETTE))
-    gdf["color_perc_hex"] = gdf["Percentage change in the number of remote workers (%)"].apply(lambda v: get_color(v, thresholds_perc, COLOR_PALETTE))
-    gdf["geometry_json"] = gdf["geometry"].apply(lambda g: json.dumps(g.__geo_interface__))
-    gdf["Percentage change in the number of remote workers (%)"] = (gdf["Percentage change in the number of remote workers (%)"] * 100).round(1).astype(str) + " %"
-
-    df_abs = gdf[["Absolute change in the number of remote workers", "geometry_json"]].copy()
-    df_abs["Colour code"] = gdf["color_abs_hex"]
-    df_perc = gdf[["Percentage change in the number of remote workers (%)", "geometry_json"]].copy()
-    df_perc["Colour code"] = gdf["color_perc_hex"]
-
-    # --- Kepler Configs ---
-    kepler_config_abs = {
-        "version": "v1",
-        "config": {
-            "mapState": {
-                "latitude": 60.259889999999984,
-                "longitude": 25.2,
-                "zoom": 8.6,
-                "bearing": 0,
-                "pitch": 0
-            },
-            "mapStyle": {
-                "styleType": "carto_dark",
-                "mapStyles": [
-                    {
-                        "id": "carto_dark",
-                        "label": "Carto Dark",
-                        "url": CARTO_DARK,
-                    }
-                ],
-            },
-            "visState": {
-                "layers": [{
-                    "id": "abs_layer",
-                    "type": "geojson",
-                    "config": {
-                        "dataId": "absolute_change",
-                        "columns": {"geojson": "geometry_json"},
-                        "isVisible": True,
-                        "visConfig": {
-                            "opacity": opacity_val,
-                            "filled": True,
-                            "colorRange": {"colors": COLOR_PALETTE}
-                        }
-                    },
-                    "visualChannels": {
-                        "colorField": {"name": "Colour code", "type": "string"},
-                        "colorScale": "ordinal"
-                    },
-                }]
-            },
-            "options": {
-                "centerMap": False,
-                "readOnly": False
-            }
-        }
-    }
-
-    kepler_config_perc = {
-        "version": "v1",
-        "config": {
-            "mapState": {
-                "latitude": 60.259889999999984,
-                "longitude": 25.2,
-                "zoom": 8.6,
-                "bearing": 0,
-                "pitch": 0
-            },
-            "mapStyle": {
-                "styleType": "carto_dark",
-                "mapStyles": [
-                    {
-                        "id": "carto_dark",
-                        "label": "Carto Dark",
-                        "url": CARTO_DARK,
-                    }
-                ],
-            },
-            "visState": {
-                "layers": [{
-                    "id": "perc_layer",
-                    "type": "geojson",
-                    "config": {
-                        "dataId": "percentage_change",
-                        "columns": {"geojson": "geometry_json"},
-                        "isVisible": True,
-                        "visConfig": {
-                            "opacity": opacity_val,
-                            "filled": True,
-                            "colorRange": {"colors": COLOR_PALETTE}
-                        }
-                    },
-                    "visualChannels": {
-                        "colorField": {"name": "Colour code", "type": "string"},
-                        "colorScale": "ordinal"
-                    },
-                }]
-            },
-            "options": {
-                "centerMap": False,
-                "readOnly": False
-            }
-        }
-    }
-
-    # --- Two maps side by side ---
-    col1, col2 = st.columns(2)
-    with col1:
-        st.markdown("**Absolute Change**")
-        map_abs = KeplerGl(height=380, data={"absolute_change": df_abs}, config=kepler_config_abs)
-        keplergl_static(map_abs, height=380, width=560)
-        make_color_legend("Legend: Absolute change in the number of remote workers",
-                          COLOR_PALETTE, [f"≤ {v:.1f}" for v in thresholds_abs] + ["> max"])
-    with col2:
-        st.markdown("**Percentage Change**")
-        map_perc = KeplerGl(height=380, data={"percentage_change": df_perc}, config=kepler_config_perc)
-        keplergl_static(map_perc, height=380, width=560)
-        make_color_legend("Legend: Percentage change in the number of remote workers (%)",
-                          COLOR_PALETTE, [f"≤ {v*100:.0f}%" for v in thresholds_perc] + ["> max"])
+    path = "Datasets/Grid maps/s2_s3_remote_workers_diff.gpkg"
+
+    # Sliders, maps and legends rerun on their own when one of their widgets changes
+    @timed_fragment(PAGE)
+    def maps_s3s2():
+        quantiles_abs = [0.25, 0.4, 0.6, 0.74, 0.8, 0.9, 0.97]
+        thresholds_abs = load_dataset(path).quantiles("absolute_change", quantiles_abs)
+        thresholds_perc = [0.15, 0.25, 0.4, 0.6, 0.85, 1, 1.15]
+
+        # --- Slider layout below button ---
+        col_slider, _, opacity_slider, _ = st.columns([0.35, 0.15, 0.35, 0.15])
+        with col_slider:
+            st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
+            if client_slider:
+                slider_val = S3_S2.full  # where the maps' own sliders start
+                st.caption("Drag the slider on the maps")
+            else:
+                slider_val = st.slider("slider_s3s2", S3_S2.minimum, S3_S2.maximum, S3_S2.full, S3_S2.step, format="%.1f", label_visibility="collapsed")
+        with opacity_slider:
+            st.markdown("<p style='font-weight:600; margin-bottom:6px;'>Opacity</p>", unsafe_allow_html=True)
+            opacity_val = st.slider("opacity_s3s2", float(0), float(1), float(0.8), float(0.01), label_visibility="collapsed")
+
+        # --- Data transformation (precomputed step matrices) ---
+        thresholds_abs, classes_abs = scheme_classes(path, "absolute_change", scheme, tuple(COLOR_PALETTE), tuple(thresholds_abs))
+        matrix_abs = step_matrix(path, "absolute_change", S3_S2, thresholds_abs, decimals=1, nan_as_max=True)
+        thresholds_perc, classes_perc = scheme_classes(path, "percentage_change", scheme, tuple(COLOR_PALETTE), tuple(thresholds_perc), "≤ {:.0%}")
+        matrix_perc = step_matrix(path, "percentage_change", S3_S2, thresholds_perc, nan_as_max=True)
+        geometry = map_geometry(path, raster=raster_grid, tiles=vector_tiles)
+
+        col1, col2 = st.columns(2)
+        col1.markdown("**Absolute Change**")
+        col2.markdown("**Percentage Change**")
+        # One map component for both views: one copy of the grid, panning together
+        map_view(geometry, [
+            MapLayer("Absolute change in the number of remote workers", matrix_abs, classes_abs),
+            MapLayer("Percentage change in the number of remote workers (%)", matrix_perc, classes_perc, scale=100, suffix=" %"),
+        ], slider_val, opacity_val, client=client_slider, slider_label=SLIDER_LABEL, key="remote_maps")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            make_color_legend("Legend: Absolute change in the number of remote workers",
+                              classes_abs.colours, classes_abs.labels)
+        with col2:
+            make_color_legend("Legend: Percentage change in the number of remote workers (%)",
+                              classes_perc.colours, classes_perc.labels)
+
+    maps_s3s2()
+
+    # The other comparison is a click away: load it in the background
+    prefetch("Datasets/Grid maps/s1_s2_remote_workers_diff.gpkg", shown=path)
 
 # ============================================================
 # --- PAGE 2: S2 vs S1 ---
 # ============================================================
-elif st.session_state.mode == "S2_S1":
+elif mode == "S2_S1":
     st.markdown("<h3>Difference in the number of remote workers at the selected percentage of the remote-working population VS at the remote-working population percentage in S2</h3>", unsafe_allow_html=True)
 
     # Centered back button
     if st.button("Back to S3 vs S2"):
-        st.session_state.mode = "S3_S2"
+        set_page_mode(PAGE, "S3_S2")
         st.rerun()
 
-    gdf = load_dataset("Datasets/Grid maps/s1_s2_remote_workers_diff.gpkg")
-    quantiles_abs = [0.05, 0.15, 0.25, 0.4, 0.6, 0.8, 0.95]
-    thresholds_abs = gdf["absolute_change"].quantile(quantiles_abs).tolist()
-
-    col_slider, _, opacity_slider, _ = st.columns([0.35, 0.15, 0.35, 0.15])
-    with col_slider:
-        st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
-        slider_val = st.slider("slider_s2s1", 0.0, 24.0, 0.0, 0.1, format="%.1f", label_visibility="collapsed")
-    with opacity_slider:
-        st.markdown("<p style='font-weight:600; margin-bottom:6px;'>Opacity</p>", unsafe_allow_html=True)
-        opacity_val = st.slider("opacity_s3s2", float(0), float(1), float(0.8), float(0.01), label_visibility="collapsed")
-
-    factor = slider_val / 24.0
-    gdf["Absolute change in the number of remote workers"] = (gdf["absolute_change"] * (1 - factor)).round(1)
-    gdf["color_abs_hex"] = gdf["Absolute change in the number of remote workers"].apply(
-        lambda v: get_color(v, thresholds_abs, COLOR_PALETTE, reverse=True))
-    gdf["geometry_json"] = gdf["geometry"].apply(lambda g: json.dumps(g.__geo_interface__))
-    df_abs = gdf[["Absolute change in the number of remote workers", "geometry_json"]].copy()
-    df_abs["Colour code"] = gdf["color_abs_hex"]
-
-    kepler_config_abs = {
-        "version": "v1",
-        "config": {
-            "mapState": {
-                "latitude": 60.259889999999984,
-                "longitude": 25.2,
-                "zoom": 8.6,
-                "bearing": 0,
-                "pitch": 0
-            },
-            "mapStyle": {
-                "id": "carto_dark",
-                "label": "Carto Dark",
-                "url": CARTO_DARK,  # style.json URL
-            },
-            "visState": {
-                "layers": [{
-                    "id": "abs_layer",
-                    "type": "geojson",
-                    "config": {
-                        "dataId": "absolute_change",
-                        "columns": {"geojson": "geometry_json"},
-                        "isVisible": True,
-                        "visConfig": {
-                            "opacity": opacity_val,
-                            "filled": True,
-                            "colorRange": {"colors": COLOR_PALETTE}
-                        }
-                    },
-                    "visualChannels": {
-                        "colorField": {"name": "Colour code", "type": "string"},
-                        "colorScale": "ordinal"
-                    },
-                }]
-            },
-            "options": {
-                "centerMap": False,   # <- prevents auto-fit to bounds
-                "readOnly": False     # set True if you want to lock panning/zoom
-            }
-        }
-    }
-
-    col1, col2 = st.columns([0.45, 0.55])
-    with col1:
-        st.markdown("**Absolute Change**")
-        map_abs = KeplerGl(height=380, data={"absolute_change": df_abs}, config=kepler_config_abs)
-        keplergl_static(map_abs, height=380, width=560)
-        make_color_legend("Legend: Absolute change in the number of remote workers",
-                          COLOR_PALETTE, [f"≤ {v:.1f}" for v in thresholds_abs] + ["> max"])
-    with col2:
-        st.empty()
+    path = "Datasets/Grid maps/s1_s2_remote_workers_diff.gpkg"
+    # Sliders, maps and legends rerun on their own when one of their widgets changes
+    @timed_fragment(PAGE)
+    def maps_s2s1():
+        quantiles_abs = [0.05, 0.15, 0.25, 0.4, 0.6, 0.8, 0.95]
+        thresholds_abs = load_dataset(path).quantiles("absolute_change", quantiles_abs)
+
+        col_slider, _, opacity_slider, _ = st.columns([0.35, 0.15, 0.35, 0.15])
+        with col_slider:
+            st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
+            if client_slider:
+                slider_val = S2_S1.full  # where the maps' own sliders start
+                st.caption("Drag the slider on the maps")
+            else:
+                slider_val = st.slider("slider_s2s1", S2_S1.minimum, S2_S1.maximum, S2_S1.full, S2_S1.step, format="%.1f", label_visibility="collapsed")
+        with opacity_slider:
+            st.markdown("<p style='font-weight:600; margin-bottom:6px;'>Opacity</p>", unsafe_allow_html=True)
+            opacity_val = st.slider("opacity_s3s2", float(0), float(1), float(0.8), float(0.01), label_visibility="collapsed")
+
+        thresholds_abs, classes_abs = scheme_classes(path, "absolute_change", scheme, tuple(COLOR_PALETTE), tuple(thresholds_abs), reverse=True)
+        matrix_abs = step_matrix(path, "absolute_change", S2_S1, thresholds_abs, decimals=1, nan_as_max=True)
+        geometry = map_geometry(path, raster=raster_grid, tiles=vector_tiles)
+
+        col1, col2 = st.columns([0.45, 0.55])
+        with col1:
+            st.markdown("**Absolute Change**")
+            map_view(geometry, [MapLayer("Absolute change in the number of remote workers", matrix_abs, classes_abs)], slider_val, opacity_val, client=client_slider,
+                     slider_label=SLIDER_LABEL, key="remote_maps")
+            make_color_legend("Legend: Absolute change in the number of remote workers",
+                              classes_abs.colours, classes_abs.labels)
+        with col2:
+            st.empty()
+
+    maps_s2s1()
+
+    # The other comparison is a click away: load it in the background
+    prefetch("Datasets/Grid maps/s2_s3_remote_workers_diff.gpkg", shown=path)
+
+page_run.done()
@@ -1,14 +1,15 @@
 import streamlit as st
-import geopandas as gpd
-import pandas as pd
-import numpy as np
-import json
-from keplergl import KeplerGl
-from streamlit_keplergl import keplergl_static
 from navigation import load_sidebar
+from twinning.mapview import MapLayer, map_geometry, map_view
+from twinning.pagestate import page_mode, prefetch, set_page_mode
+from twinning.scenarios import S2_S1, S3_S2, step_matrix
+from twinning.schemes import SCHEME_LABELS, scheme_classes
+from twinning.timing import PageRun, timed_fragment
 
-CARTO_DARK = "https://basemaps.cartocdn.com/gl/dark-matter-gl-style/style.json"
+PAGE = "Transit passengers comparison"
 
+# Server time of this run (twinning.timing)
+page_run = PageRun(PAGE)
 
 # ============================================================
 # --- PAGE SETUP & STYLE ---
@@ -58,8 +59,8 @@ div[data-testid="stSlider"] div[data-testid="stTickBar"] > div:last-child > div
 # ============================================================
 # --- NAV STATE ---
 # ============================================================
-if "mode" not in st.session_state:
-    st.session_state.mode = "S3_S2"  # default page
+# This page's own comparison, restorable from ?mode= (twinning.pagestate)
+mode = page_mode(PAGE)
 
 # ============================================================
 # --- YOUR HARD-CODED THRESHOLDS (EDIT THESE) ---
@@ -114,255 +115,135 @@ def make_color_legend(title, colors, labels, reverse=False):
     html += "</div></div>"
     st.markdown(html, unsafe_allow_html=True)
 
-def get_color(value, thresholds, palette, reverse=False, default="#888888"):
-    if pd.isna(value):
-        return default
-    if reverse:
-        palette = list(reversed(palette))
-    if value <= thresholds[0]: return palette[0]
-    elif value <= thresholds[1]: return palette[1]
-    elif value <= thresholds[2]: return palette[2]
-    elif value <= thresholds[3]: return palette[3]
-    elif value <= thresholds[4]: return palette[4]
-    elif value <= thresholds[5]: return palette[5]
-    elif value <= thresholds[6]: return palette[6]
-    else: return palette[-1]
-
-
-# <<< CACHING ADDED HERE
-@st.cache_data(show_spinner="Loading dataset...")
-def load_dataset(path: str) -> gpd.GeoDataFrame:
-    """
-    Load a GeoPackage, reproject to WGS84 if needed, and
-    precompute geometry_json so we don't redo this every rerun.
-    This result is cached per 'path'.
-    """
-    gdf = gpd.read_file(path)
-
-    # Ensure WGS84 for kepler.gl
-    if gdf.crs and gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(4326)
-
-    # Precompute geometry_json once (doesn't depend on slider/thresholds)
-    if "geometry_json" not in gdf.columns:
-        gdf = gdf.copy()
-        gdf["geometry_json"] = gdf["geometry"].apply(
-            lambda geom: json.dumps(geom.__geo_interface__)
-        )
-
-    return gdf
-# <<< END CACHING
 
 COLOR_PALETTE = ["#3B0A45", "#78001E", "#B52F0D", "#D65E00", "#E98000", "#F3A300", "#FFD400"]
 
-def kepler_config_lines(data_id, palette):
-    return {
-        "version": "v1",
-        "config": {
-            "mapState": {
-                "latitude": 60.259889999999984,
-                "longitude": 25.2,
-                "zoom": 8.6,
-                "bearing": 0,
-                "pitch": 0
-            },
-            "mapStyle": {
-                "id": "carto_dark",
-                "label": "Carto Dark",
-                "url": CARTO_DARK,  # style.json URL
-            },
-            "visState": {
-                "layers": [{
-                    "id": f"{data_id}_layer",
-                    "type": "geojson",
-                    "config": {
-                        "dataId": data_id,
-                        "label": data_id,
-                        "columns": {"geojson": "geometry_json"},
-                        "isVisible": True,
-                        "visConfig": {
-                            "opacity": 0.9,
-                            "stroked": True,
-                            "filled": False,
-                            "thickness": 0.3,
-                            "colorRange": {"colors": palette},
-                            "strokeColorRange": {"colors": palette},
-                        },
-                    },
-                    "visualChannels": {
-                        "strokeColorField": {"name": "Colour code", "type": "string"},
-                        "strokeColorScale": "ordinal",
-                    }
-                }]
-            },
-            "options": {
-                "centerMap": False,   # ✅ prevents auto-scaling to data bounds
-                "readOnly": False     # set True if you want fixed, non-movable map
-            }
-        }
-    }
+# Road width in pixels. kepler.gl drew the roads (thickness 0.3) 0.3 * 8 * 2^(14 - zoom)
+# metres wide, about one pixel at this latitude at every zoom up to 14
+LINE_WIDTH = 1
 
+# Class breaks: the page's own thresholds, or a scheme computed from the data
+scheme = st.sidebar.selectbox("Classification", list(SCHEME_LABELS), format_func=SCHEME_LABELS.get, key="scheme")
+
+# Only the tiles in view instead of every feature (needs `python -m twinning.tiles`)
+vector_tiles = st.sidebar.toggle("Vector tiles", key="vector_tiles")
 
 # ============================================================
 # --- PAGE 1: S3 vs S2 (mostly negative, lowest = brightest) ---
 # ============================================================
-if st.session_state.mode == "S3_S2":
+if mode == "S3_S2":
     st.markdown("<h3>Difference in the number of transit passengers at the selected percentage of the remote-working population VS at the remote-working population percentage in S3</h3>", unsafe_allow_html=True)
 
     if st.button("S2 vs S1 comparison"):
-        st.session_state.mode = "S2_S1"
+        set_page_mode(PAGE, "S2_S1")
         st.rerun()
 
-    gdf = load_dataset("Datasets/Traffic changes/s2_s3_transit_difference_rebounds_abs_change.gpkg")
-
-    if "percentage_change" in gdf.columns:
-        gdf["percentage_change"] = gdf["percentage_change"].astype(float)
-
-    # --- Create 2 datasets and drop NaNs instead of fillna ---
-    gdf_abs = gdf.dropna(subset=["absolute_change"]).copy()
-    gdf_perc = gdf.dropna(subset=["percentage_change"]).copy()
-
-    # Use manual percentage thresholds for S3–S2
-    thresholds_perc = CUSTOM_THRESHOLDS_PERC_S3S2
-
-    col_slider, _, _, _ = st.columns([0.35, 0.08, 0.07, 0.5])
-    with col_slider:
-        st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
-        slider_val = st.slider("slider_s3s2", 24.0, 47.3, 47.3, 0.1, format="%.1f", label_visibility="collapsed")
-
-    factor = (47.3 - slider_val) / (47.3 - 24.0)
-
-    # Derived fields (ABS dataset)
-    gdf_abs["Absolute change in the number of transit passengers"] = (
-        gdf_abs["absolute_change"] * (1 - factor)
-    ).round(1)
-
-    # Derived fields (PERC dataset)
-    gdf_perc["Percentage change numeric"] = gdf_perc["percentage_change"] * (1 - factor) * 100
-    gdf_perc["Percentage change formatted"] = gdf_perc["Percentage change numeric"].map(
-        lambda v: f"{v:.1f}%"
-    )
-
-    # Color by absolute change using custom thresholds (lowest = brightest)
-    thresholds_abs = CUSTOM_THRESHOLDS_ABS_S3S2
-    gdf_abs["color_abs_hex"] = gdf_abs["Absolute change in the number of transit passengers"].apply(
-        lambda v: get_color(v, thresholds_abs, COLOR_PALETTE, reverse=True)
-    )
-
-    # Color by percentage change using custom thresholds (lowest = brightest)
-    gdf_perc["color_perc_hex"] = (gdf_perc["percentage_change"] * (1 - factor)).apply(
-        lambda v: get_color(v, thresholds_perc, COLOR_PALETTE, reverse=True)
-    )
-
-    # GeoJSON string per row
-    gdf_abs["geometry_json"] = gdf_abs["geometry"].apply(lambda geom: json.dumps(geom.__geo_interface__))
-    gdf_perc["geometry_json"] = gdf_perc["geometry"].apply(lambda geom: json.dumps(geom.__geo_interface__))
-
-    # Two views: absolute / percentage
-    df_abs = gdf_abs[["Absolute change in the number of transit passengers", "geometry_json"]].copy()
-    df_abs["Colour code"] = gdf_abs["color_abs_hex"]
-
-    df_perc = gdf_perc[["Percentage change formatted", "geometry_json"]].copy()
-    df_perc["Colour code"] = gdf_perc["color_perc_hex"]
-
-    cfg_abs = kepler_config_lines("absolute_change", COLOR_PALETTE)
-    cfg_perc = kepler_config_lines("percentage_change", COLOR_PALETTE)
-
-    col1, col2 = st.columns(2)
-    with col1:
-        st.markdown("**Absolute Change**")
-        map_abs = KeplerGl(height=380, data={"absolute_change": df_abs}, config=cfg_abs)
-        keplergl_static(map_abs, height=380, width=560)
-        make_color_legend(
-            "Legend: Absolute change in the number of transit passengers",
-            COLOR_PALETTE[::-1], [f"≤ {v:.1f}" for v in thresholds_abs]
-        )
-    with col2:
-        st.markdown("**Percentage Change**")
-        map_perc = KeplerGl(height=380, data={"percentage_change": df_perc}, config=cfg_perc)
-        keplergl_static(map_perc, height=380, width=560)
-        make_color_legend(
-            "Legend: Percentage change in the number of transit passengers (%)",
-            COLOR_PALETTE[::-1], [f"≤ {v*100:.1f}%" for v in thresholds_perc]
-        )
+    path = "Datasets/Traffic changes/s2_s3_transit_difference_rebounds_abs_change.gpkg"
+
+    # Sliders, maps and legends rerun on their own when one of their widgets changes
+    @timed_fragment(PAGE)
+    def maps_s3s2():
+        # Use manual percentage thresholds for S3–S2
+        thresholds_perc = CUSTOM_THRESHOLDS_PERC_S3S2
+
+        col_slider, _, _, _ = st.columns([0.35, 0.08, 0.07, 0.5])
+        with col_slider:
+            st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
+            slider_val = st.slider("slider_s3s2", S3_S2.minimum, S3_S2.maximum, S3_S2.full, S3_S2.step, format="%.1f", label_visibility="collapsed")
+
+        thresholds_abs = CUSTOM_THRESHOLDS_ABS_S3S2
+
+        # Whole step matrices: the map component picks the row
+        thresholds_abs, classes_abs = scheme_classes(path, "absolute_change", scheme, tuple(COLOR_PALETTE), tuple(thresholds_abs), reverse=True)
+        matrix_abs = step_matrix(path, "absolute_change", S3_S2, thresholds_abs, decimals=1)
+        thresholds_perc, classes_perc = scheme_classes(path, "percentage_change", scheme, tuple(COLOR_PALETTE), tuple(thresholds_perc), "≤ {:.1%}", reverse=True)
+        matrix_perc = step_matrix(path, "percentage_change", S3_S2, thresholds_perc)
+        geometry = map_geometry(path, tiles=vector_tiles)
+
+        col1, col2 = st.columns(2)
+        col1.markdown("**Absolute Change**")
+        col2.markdown("**Percentage Change**")
+        # One map component for both views; lines without a value are not drawn (the old dropna)
+        map_view(geometry, [
+            MapLayer("Absolute change in the number of transit passengers", matrix_abs, classes_abs),
+            MapLayer("Percentage change", matrix_perc, classes_perc, scale=100, suffix="%"),
+        ], slider_val, opacity=0.9, hide_no_data=True, line_width=LINE_WIDTH,
+                 key="transit_maps")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            make_color_legend(
+                "Legend: Absolute change in the number of transit passengers",
+                classes_abs.colours, classes_abs.labels
+            )
+        with col2:
+            make_color_legend(
+                "Legend: Percentage change in the number of transit passengers (%)",
+                classes_perc.colours, classes_perc.labels
+            )
+
+    maps_s3s2()
+
+    # The other comparison is a click away: load it in the background
+    prefetch("Datasets/Traffic changes/s1_s2_transit_difference_rebounds_abs_change.gpkg", shown=path)
 
 # ============================================================
 # --- PAGE 2: S2 vs S1 (mostly positive, highest = brightest) ---
 # ============================================================
-elif st.session_state.mode == "S2_S1":
+elif mode == "S2_S1":
     st.markdown("<h3>Difference in the number of transit passengers at the selected percentage of the remote-working population VS at the remote-working population percentage in S2</h3>", unsafe_allow_html=True)
 
     if st.button("Back to S3 vs S2"):
-        st.session_state.mode = "S3_S2"
+        set_page_mode(PAGE, "S3_S2")
         st.rerun()
 
-    gdf = load_dataset("Datasets/Traffic changes/s1_s2_transit_difference_rebounds_abs_change.gpkg")
-
-    if "percentage_change" in gdf.columns:
-        gdf["percentage_change"] = gdf["percentage_change"].astype(float)
-
-    # --- Create 2 datasets and drop NaNs instead of fillna ---
-    gdf_abs = gdf.dropna(subset=["absolute_change"]).copy()
-    gdf_perc = gdf.dropna(subset=["percentage_change"]).copy()
-
-    # Use manual percentage thresholds for S2–S1
-    thresholds_perc = CUSTOM_THRESHOLDS_PERC_S2S1
-
-    col_slider, _, _, _ = st.columns([0.35, 0.08, 0.07, 0.5])
-    with col_slider:
-        st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
-        slider_val = st.slider("slider_s2s1", 0.0, 24.0, 0.0, 0.1, format="%.1f", label_visibility="collapsed")
-
-    factor = slider_val / 24.0
-
-    # Derived fields (ABS dataset)
-    gdf_abs["Absolute change in the number of transit passengers"] = (
-        gdf_abs["absolute_change"] * (1 - factor)
-    ).round(1)
-
-    # Derived fields (PERC dataset)
-    gdf_perc["Percentage change numeric"] = gdf_perc["percentage_change"] * (1 - factor) * 100
-    gdf_perc["Percentage change formatted"] = gdf_perc["Percentage change numeric"].map(
-        lambda v: f"{v:.1f}%"
-    )
-
-    # Color by absolute change using custom thresholds (highest = brightest)
-    thresholds_abs = CUSTOM_THRESHOLDS_ABS_S2S1
-    gdf_abs["color_abs_hex"] = gdf_abs["Absolute change in the number of transit passengers"].apply(
-        lambda v: get_color(v, thresholds_abs, COLOR_PALETTE, reverse=False)
-    )
-
-    # Color by percentage change using custom thresholds (highest = brightest)
-    gdf_perc["color_perc_hex"] = (gdf_perc["percentage_change"] * (1 - factor)).apply(
-        lambda v: get_color(v, thresholds_perc, COLOR_PALETTE)
-    )
-
-    gdf_abs["geometry_json"] = gdf_abs["geometry"].apply(lambda geom: json.dumps(geom.__geo_interface__))
-    gdf_perc["geometry_json"] = gdf_perc["geometry"].apply(lambda geom: json.dumps(geom.__geo_interface__))
-
-    df_abs = gdf_abs[["Absolute change in the number of transit passengers", "geometry_json"]].copy()
-    df_abs["Colour code"] = gdf_abs["color_abs_hex"]
-
-    df_perc = gdf_perc[["Percentage change formatted", "geometry_json"]].copy()
-    df_perc["Colour code"] = gdf_perc["color_perc_hex"]
-
-    cfg_abs = kepler_config_lines("absolute_change", COLOR_PALETTE)
-    cfg_perc = kepler_config_lines("percentage_change", COLOR_PALETTE)
-
-    col1, col2 = st.columns(2)
-    with col1:
-        st.markdown("**Absolute Change**")
-        map_abs = KeplerGl(height=380, data={"absolute_change": df_abs}, config=cfg_abs)
-        keplergl_static(map_abs, height=380, width=560)
-        make_color_legend(
-            "Legend: Absolute change in the number of transit passengers",
-            COLOR_PALETTE, [f"≤ {v:.1f}" for v in thresholds_abs]
-        )
-    with col2:
-        st.markdown("**Percentage Change**")
-        map_perc = KeplerGl(height=380, data={"percentage_change": df_perc}, config=cfg_perc)
-        keplergl_static(map_perc, height=380, width=560)
-        make_color_legend(
-            "Legend: Percentage change in the number of transit passengers (%)",
-            COLOR_PALETTE, [f"≤ {v*100:.1f}%" for v in thresholds_perc]
-        )
+    path = "Datasets/Traffic changes/s1_s2_transit_difference_rebounds_abs_change.gpkg"
+
+    # Sliders, maps and legends rerun on their own when one of their widgets changes
+    @timed_fragment(PAGE)
+    def maps_s2s1():
+        # Use manual percentage thresholds for S2–S1
+        thresholds_perc = CUSTOM_THRESHOLDS_PERC_S2S1
+
+        col_slider, _, _, _ = st.columns([0.35, 0.08, 0.07, 0.5])
+        with col_slider:
+            st.markdown("<p style='font-weight:600; margin-bottom:6px;'>The percentage of remote working population</p>", unsafe_allow_html=True)
+            slider_val = st.slider("slider_s2s1", S2_S1.minimum, S2_S1.maximum, S2_S1.full, S2_S1.step, format="%.1f", label_visibility="collapsed")
+
+        thresholds_abs = CUSTOM_THRESHOLDS_ABS_S2S1
+
+        # Whole step matrices: the map component picks the row
+        thresholds_abs, classes_abs = scheme_classes(path, "absolute_change", scheme, tuple(COLOR_PALETTE), tuple(thresholds_abs))
+        matrix_abs = step_matrix(path, "absolute_change", S2_S1, thresholds_abs, decimals=1)
+        thresholds_perc, classes_perc = scheme_classes(path, "percentage_change", scheme, tuple(COLOR_PALETTE), tuple(thresholds_perc), "≤ {:.1%}")
+        matrix_perc = step_matrix(path, "percentage_change", S2_S1, thresholds_perc)
+        geometry = map_geometry(path, tiles=vector_tiles)
+
+        col1, col2 = st.columns(2)
+        col1.markdown("**Absolute Change**")
+        col2.markdown("**Percentage Change**")
+        # One map component for both views; lines without a value are not drawn (the old dropna)
+        map_view(geometry, [
+            MapLayer("Absolute change in the number of transit passengers", matrix_abs, classes_abs),
+            MapLayer("Percentage change", matrix_perc, classes_perc, scale=100, suffix="%"),
+        ], slider_val, opacity=0.9, hide_no_data=True, line_width=LINE_WIDTH,
+                 key="transit_maps")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            make_color_legend(
+                "Legend: Absolute change in the number of transit passengers",
+                classes_abs.colours, classes_abs.labels
+            )
+        with col2:
+            make_color_legend(
+                "Legend: Percentage change in the number of transit passengers (%)",
+                classes_perc.colours, classes_perc.labels
+            )
+
+    maps_s2s1()
+
+    # The other comparison is a click away: load it in the background
+    prefetch("Datasets/Traffic changes/s2_s3_transit_difference_rebounds_abs_change.gpkg", shown=path)
+
+page_run.done()
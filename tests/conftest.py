@@ -0,0 +1,35 @@
+# tests/conftest.py
+"""
+Shared fixtures. Run from the repository root:
+
+    python -m pytest -q
+
+Tests that need a dataset which is not in the checkout (the traffic
+GeoPackages are distributed separately) are skipped.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+GRID_DIR = ROOT / "Datasets" / "Grid maps"
+TRAFFIC_DIR = ROOT / "Datasets" / "Traffic changes"
+
+
+def require(path: Path) -> Path:
+    """`path`, or skip the test if the dataset is not in the checkout."""
+    if not path.exists():
+        pytest.skip(f"{path.relative_to(ROOT)} not in this checkout")
+    return path
+
+
+@pytest.fixture
+def no_disk_cache(monkeypatch):
+    """Build everything in memory; tests must not fill Datasets/compiled/cache."""
+    from twinning.datasets import DISK_CACHE
+
+    monkeypatch.setattr(DISK_CACHE, "enabled", False)
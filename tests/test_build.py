@@ -0,0 +1,110 @@
+# tests/test_build.py
+"""
+The build step (twinning.build): a compiled Arrow file reads back as the
+GeoPackage it was built from, also after later files grew the shared grid
+table; its stored quantiles are pandas', and a stale copy is ignored in
+favour of the GeoPackage.
+"""
+import shutil
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+import twinning.datasets
+from conftest import GRID_DIR
+from twinning.build import QUANTILE_LEVELS, compile_dataset
+from twinning.datasets import METRIC_COLUMNS, find_compiled, load_dataset, read_compiled, read_dataset
+from twinning.grid import GRID_FILE, read_grid
+
+
+@pytest.fixture
+def grid_paths():
+    paths = sorted(GRID_DIR.glob("*.gpkg"))
+    if len(paths) < 2:
+        pytest.skip("grid datasets not in this checkout")
+    return paths
+
+
+@pytest.fixture
+def compiled_dir(tmp_path, monkeypatch, no_disk_cache):
+    """Compile into (and look for compiled copies in) a temporary directory."""
+    out = tmp_path / "compiled"
+    monkeypatch.setattr(twinning.datasets, "COMPILED_DIR", out)
+    return out
+
+
+def _assert_same_dataset(compiled, original):
+    for name in ("ykr_id",) + METRIC_COLUMNS:
+        # NaN and inf in the same places
+        np.testing.assert_array_equal(compiled[name], original[name])
+    assert compiled.crs == original.crs
+    # Joined to its cells through the shared grid table
+    assert shapely.equals_exact(np.asarray(compiled.geometry), np.asarray(original.geometry)).all()
+
+
+def test_compiled_reads_back_as_the_geopackage(grid_paths, compiled_dir):
+    path = str(grid_paths[0])
+    target = compile_dataset(path, compiled_dir)
+    assert (compiled_dir / GRID_FILE).exists()
+
+    original = read_dataset(path)
+    compiled = read_compiled(target)
+    assert sorted(compiled.columns) == sorted(("ykr_id",) + METRIC_COLUMNS)
+    _assert_same_dataset(compiled, original)
+    assert np.isnan(original["percentage_change"]).any() or np.isinf(original["percentage_change"]).any()
+
+
+def test_stored_quantiles_are_pandas(grid_paths, compiled_dir):
+    path = str(grid_paths[0])
+    compiled = read_compiled(compile_dataset(path, compiled_dir))
+    original = read_dataset(path)
+    for name in METRIC_COLUMNS:
+        with np.errstate(invalid="ignore"):
+            expected = [pd.Series(original[name]).quantile(i / 100) for i in range(101)]
+        np.testing.assert_array_equal(compiled.meta["quantiles"][name], expected)
+        np.testing.assert_array_equal(compiled.quantiles(name, QUANTILE_LEVELS[::10]), expected[::10])
+
+
+def test_changed_source_falls_back_to_the_geopackage(grid_paths, compiled_dir, tmp_path):
+    path = tmp_path / grid_paths[0].name
+    shutil.copy(grid_paths[0], path)
+    compile_dataset(path, compiled_dir)
+    assert find_compiled(path) is not None
+    assert load_dataset(str(path)).meta
+
+    # Same name, other contents: the compiled copy no longer matches
+    shutil.copy(grid_paths[1], path)
+    assert find_compiled(path) is None
+    dataset = load_dataset(str(path))
+    assert not dataset.meta
+    _assert_same_dataset(dataset, read_dataset(str(grid_paths[1])))
+
+
+def test_other_format_falls_back_to_the_geopackage(grid_paths, compiled_dir, tmp_path, monkeypatch):
+    path = str(shutil.copy(grid_paths[0], tmp_path))
+    compile_dataset(path, compiled_dir)
+    assert find_compiled(path) is not None
+
+    monkeypatch.setattr(twinning.datasets, "COMPILED_FORMAT", twinning.datasets.COMPILED_FORMAT + 1)
+    assert find_compiled(path) is None
+    assert not load_dataset(path).meta
+
+
+def test_grid_merge_keeps_earlier_files_joined(grid_paths, compiled_dir, tmp_path):
+    # Two files over different (overlapping) cells, compiled one after the other
+    source = gpd.read_file(grid_paths[0])
+    half = len(source) // 2
+    first, second = tmp_path / "first.gpkg", tmp_path / "second.gpkg"
+    source.iloc[: half + 100].to_file(first)
+    source.iloc[half:].iloc[::-1].to_file(second)
+
+    first_target = compile_dataset(first, compiled_dir)
+    compile_dataset(second, compiled_dir)
+
+    ids = np.union1d(read_dataset(str(first))["ykr_id"], read_dataset(str(second))["ykr_id"])
+    np.testing.assert_array_equal(read_grid(compiled_dir / GRID_FILE).ids, ids)
+    # The grid table grew under the first file: its rows still join to their own cells
+    _assert_same_dataset(read_compiled(first_target), read_dataset(str(first)))
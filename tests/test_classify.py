@@ -0,0 +1,273 @@
+# tests/test_classify.py
+"""
+Golden tests for twinning.classify against the per-page `get_color` it
+replaced.
+
+The `get_color_*` functions below are the pages' own, copied verbatim from
+the last revision before the shared classifier. Every map is listed with
+the thresholds, palette direction and NaN handling its page uses, and the
+colours the page now draws (step matrix codes through the map's
+ClassPalette) are compared with the old per-row pipeline: on edge values
+around every threshold, and on the real datasets at sampled slider steps.
+"""
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import GRID_DIR, TRAFFIC_DIR, require
+from twinning.classify import NO_DATA, NO_DATA_COLOUR, ClassPalette, classify
+from twinning.datasets import read_dataset
+from twinning.scenarios import S2_S1, S3_S2, build_step_matrix
+
+
+# ==============================================================
+# The pages' get_color, verbatim
+# ==============================================================
+# Emissions comparison, On-site workers comparison
+def get_color_grid(value, thresholds, palette, reverse=False):
+    """Assign colors by threshold range. If reverse=True, lowest values = brightest colors."""
+    if reverse:
+        palette = list(reversed(palette))
+    if value <= thresholds[0]: return palette[0]
+    elif value <= thresholds[1]: return palette[1]
+    elif value <= thresholds[2]: return palette[2]
+    elif value <= thresholds[3]: return palette[3]
+    elif value <= thresholds[4]: return palette[4]
+    elif value <= thresholds[5]: return palette[5]
+    elif value <= thresholds[6]: return palette[6]
+    else: return palette[-1]
+
+
+# Remote workers comparison
+def get_color_remote(value, thresholds, palette, reverse=False):
+    if reverse:
+        if value <= thresholds[0]: return palette[-1]
+        elif value <= thresholds[1]: return palette[-2]
+        elif value <= thresholds[2]: return palette[-3]
+        elif value <= thresholds[3]: return palette[-4]
+        elif value <= thresholds[4]: return palette[-5]
+        elif value <= thresholds[5]: return palette[-6]
+        else: return palette[0]
+    else:
+        if value <= thresholds[0]: return palette[0]
+        elif value <= thresholds[1]: return palette[1]
+        elif value <= thresholds[2]: return palette[2]
+        elif value <= thresholds[3]: return palette[3]
+        elif value <= thresholds[4]: return palette[4]
+        elif value <= thresholds[5]: return palette[5]
+        elif value <= thresholds[6]: return palette[6]
+        else: return palette[-1]
+
+
+# Car passengers comparison
+def get_color_car(value, thresholds, palette, reverse=False, default="#888888"):
+    if pd.isna(value):
+        return default
+    if reverse:
+        palette = list(reversed(palette))
+    if value <= thresholds[0]:
+        return palette[0]
+    elif value <= thresholds[1]:
+        return palette[1]
+    elif value <= thresholds[2]:
+        return palette[2]
+    elif value <= thresholds[3]:
+        return palette[3]
+    elif value <= thresholds[4]:
+        return palette[4]
+    elif value <= thresholds[5]:
+        return palette[5]
+    elif value <= thresholds[6]:
+        return palette[6]
+    else:
+        return palette[-1]
+
+
+# Transit passengers comparison
+def get_color_transit(value, thresholds, palette, reverse=False, default="#888888"):
+    if pd.isna(value):
+        return default
+    if reverse:
+        palette = list(reversed(palette))
+    if value <= thresholds[0]: return palette[0]
+    elif value <= thresholds[1]: return palette[1]
+    elif value <= thresholds[2]: return palette[2]
+    elif value <= thresholds[3]: return palette[3]
+    elif value <= thresholds[4]: return palette[4]
+    elif value <= thresholds[5]: return palette[5]
+    elif value <= thresholds[6]: return palette[6]
+    else: return palette[-1]
+
+
+# ==============================================================
+# Every map, as its page draws it
+# ==============================================================
+COLOR_PALETTE = ["#3B0A45", "#78001E", "#B52F0D", "#D65E00", "#E98000", "#F3A300", "#FFD400"]
+
+
+class Map(NamedTuple):
+    page: str
+    get_color: Callable
+    path: object
+    column: str
+    scenario: object
+    thresholds: list = None      # manual thresholds, or
+    levels: list = None          # quantile levels of the column
+    reverse: bool = False
+    unit: int = 1
+    decimals: int = None         # 1 for the rounded absolute maps
+    nan_as_max: bool = True      # grid pages; the traffic pages drop NaN rows
+
+    @property
+    def id(self):
+        return f"{self.path.stem}-{self.column}"
+
+
+def _grid(name):
+    return GRID_DIR / f"{name}.gpkg"
+
+
+def _traffic(name):
+    return TRAFFIC_DIR / f"{name}_difference_rebounds_abs_change.gpkg"
+
+
+MAPS = [
+    # Emissions comparison
+    Map("emissions", get_color_grid, _grid("s2_s3_emissions_diff"), "absolute_change", S3_S2,
+        thresholds=[-32.0, -22.0, -12.0, -6.0, -3.0, -0.5, 2], reverse=True, unit=1000, decimals=1),
+    Map("emissions", get_color_grid, _grid("s2_s3_emissions_diff"), "percentage_change", S3_S2,
+        thresholds=[v / 100.0 for v in [-40, -30, -22, -15, -8, -2, 5]], reverse=True),
+    Map("emissions", get_color_grid, _grid("s1_s2_emissions_diff"), "absolute_change", S2_S1,
+        thresholds=[2, 4, 8, 13.0, 21.0, 30.0, 41], unit=1000, decimals=1),
+    Map("emissions", get_color_grid, _grid("s1_s2_emissions_diff"), "percentage_change", S2_S1,
+        thresholds=[v / 100.0 for v in [2.5, 5, 11, 18, 25, 35, 45]]),
+    # Remote workers comparison
+    Map("remote", get_color_remote, _grid("s2_s3_remote_workers_diff"), "absolute_change", S3_S2,
+        levels=[0.25, 0.4, 0.6, 0.74, 0.8, 0.9, 0.97], decimals=1),
+    Map("remote", get_color_remote, _grid("s2_s3_remote_workers_diff"), "percentage_change", S3_S2,
+        thresholds=[0.15, 0.25, 0.4, 0.6, 0.85, 1, 1.15]),
+    Map("remote", get_color_remote, _grid("s1_s2_remote_workers_diff"), "absolute_change", S2_S1,
+        levels=[0.05, 0.15, 0.25, 0.4, 0.6, 0.8, 0.95], reverse=True, decimals=1),
+    # On-site workers comparison
+    Map("on-site", get_color_grid, _grid("s2_s3_on_site_workers_diff"), "absolute_change", S3_S2,
+        thresholds=[-30.0, -20.0, -9.0, -5.0, -3.0, -1.5, -0.5], reverse=True, decimals=1),
+    Map("on-site", get_color_grid, _grid("s2_s3_on_site_workers_diff"), "percentage_change", S3_S2,
+        levels=[0.25, 0.46, 0.68, 0.8, 0.87, 0.93, 0.97], reverse=True),
+    Map("on-site", get_color_grid, _grid("s1_s2_on_site_workers_diff"), "absolute_change", S2_S1,
+        thresholds=[1, 3, 7, 12, 18, 29, 40], decimals=1),
+    Map("on-site", get_color_grid, _grid("s1_s2_on_site_workers_diff"), "percentage_change", S2_S1,
+        levels=[0.10, 0.25, 0.4, 0.6, 0.75, 0.9, 0.97]),
+    # Car passengers comparison
+    Map("car", get_color_car, _traffic("s2_s3_cars"), "absolute_change", S3_S2,
+        thresholds=[-110.0, -80, -60.0, -40.0, -25.0, -10.0, -5.0], reverse=True, decimals=1, nan_as_max=False),
+    Map("car", get_color_car, _traffic("s2_s3_cars"), "percentage_change", S3_S2,
+        thresholds=[-0.55, -0.45, -0.35, -0.23, -0.10, -0.05, -0.01], reverse=True, nan_as_max=False),
+    Map("car", get_color_car, _traffic("s1_s2_cars"), "absolute_change", S2_S1,
+        thresholds=[10.0, 25.0, 50.0, 75.0, 100.0, 150.0, 200.0], decimals=1, nan_as_max=False),
+    Map("car", get_color_car, _traffic("s1_s2_cars"), "percentage_change", S2_S1,
+        thresholds=[0.2, 0.7, 1.4, 2.0, 3.0, 5.0, 7.0], nan_as_max=False),
+    # Transit passengers comparison
+    Map("transit", get_color_transit, _traffic("s2_s3_transit"), "absolute_change", S3_S2,
+        thresholds=[-200, -50, -15, -7, -2, 0.1, 3], reverse=True, decimals=1, nan_as_max=False),
+    Map("transit", get_color_transit, _traffic("s2_s3_transit"), "percentage_change", S3_S2,
+        thresholds=[-0.45, -0.35, -0.21, -0.1, -0.05, 0.1, 0.3], reverse=True, nan_as_max=False),
+    Map("transit", get_color_transit, _traffic("s1_s2_transit"), "absolute_change", S2_S1,
+        thresholds=[0, 3, 12, 27, 70, 150, 400], decimals=1, nan_as_max=False),
+    Map("transit", get_color_transit, _traffic("s1_s2_transit"), "percentage_change", S2_S1,
+        thresholds=[-0.4, 0, 0.25, 0.45, 0.6, 0.85, 1.2], nan_as_max=False),
+]
+
+MANUAL = [m for m in MAPS if m.thresholds is not None]
+
+
+def _ids(maps):
+    return [m.id for m in maps]
+
+
+def _palette(m, thresholds):
+    return ClassPalette.of(COLOR_PALETTE, [f"{t}" for t in thresholds], m.reverse)
+
+
+def _edge_values(thresholds):
+    """Each threshold and its neighbouring floats, plus the extremes and NaN."""
+    values = [-np.inf, np.inf, np.nan, -1e12, 1e12, 0.0]
+    for t in thresholds:
+        values += [t, np.nextafter(t, -np.inf), np.nextafter(t, np.inf)]
+    return np.array(values, dtype=float)
+
+
+# ==============================================================
+# Tests
+# ==============================================================
+@pytest.mark.parametrize("m", MANUAL, ids=_ids(MANUAL))
+def test_edge_values_match_get_color(m):
+    values = _edge_values(m.thresholds)
+    expected = [m.get_color(v, m.thresholds, COLOR_PALETTE, reverse=m.reverse) for v in values]
+    got = _palette(m, m.thresholds).hex(classify(values, m.thresholds, nan_as_max=m.nan_as_max))
+    assert list(got) == expected
+
+
+@pytest.mark.parametrize("get_color", [get_color_grid, get_color_remote, get_color_car, get_color_transit])
+@pytest.mark.parametrize("reverse", [False, True])
+def test_every_class_matches_get_color(get_color, reverse):
+    thresholds = [-3.0, -1.0, -0.25, 0.0, 0.5, 2.0, 10.0]
+    values = _edge_values(thresholds)
+    values = values[~np.isnan(values)]
+    expected = [get_color(v, thresholds, COLOR_PALETTE, reverse=reverse) for v in values]
+    got = ClassPalette.of(COLOR_PALETTE, thresholds, reverse).hex(classify(values, thresholds))
+    assert list(got) == expected
+    assert set(expected) == set(COLOR_PALETTE)
+
+
+def test_nan_conventions():
+    thresholds = [1, 2, 3, 4, 5, 6, 7]
+    assert classify([np.nan], thresholds)[0] == NO_DATA
+    assert classify([np.nan], thresholds, nan_as_max=True)[0] == 6
+    assert ClassPalette.of(COLOR_PALETTE, thresholds).hex([NO_DATA])[0] == NO_DATA_COLOUR
+    # The grid pages' ladders send NaN past every `<=` to the last colour
+    assert get_color_grid(np.nan, thresholds, COLOR_PALETTE) == COLOR_PALETTE[-1]
+    assert get_color_remote(np.nan, thresholds, COLOR_PALETTE, reverse=True) == COLOR_PALETTE[0]
+    assert get_color_car(np.nan, thresholds, COLOR_PALETTE) == NO_DATA_COLOUR
+
+
+def _slider_samples(scenario, every=5):
+    values = scenario.slider_values()
+    return np.unique(np.concatenate([values[::every], values[-1:]]))
+
+
+@pytest.mark.parametrize("m", MAPS, ids=_ids(MAPS))
+def test_page_colours_match_get_color(m):
+    """The old per-row pipeline of each page against its step matrix and palette."""
+    ds = read_dataset(str(require(m.path)))
+    base = pd.Series(ds[m.column])
+    if m.thresholds is not None:
+        thresholds = m.thresholds
+    else:
+        thresholds = base.quantile(m.levels).tolist()
+        assert ds.quantiles(m.column, m.levels) == thresholds
+    if m.unit != 1:
+        base = base / m.unit
+    if not m.nan_as_max:
+        # The traffic pages dropped the rows without data; the maps now hide them
+        base = base.dropna()
+
+    matrix = build_step_matrix(base.to_numpy(), m.scenario, thresholds, m.decimals, m.nan_as_max)
+    palette = _palette(m, thresholds)
+    for slider_val in _slider_samples(m.scenario):
+        if m.scenario == S3_S2:
+            factor = (47.3 - slider_val) / (47.3 - 24.0)
+        else:
+            factor = slider_val / 24.0
+        values = base * (1 - factor)
+        if m.decimals is not None:
+            values = values.round(m.decimals)
+        expected = values.apply(lambda v: m.get_color(v, thresholds, COLOR_PALETTE, reverse=m.reverse))
+
+        shown, codes = matrix.row(slider_val)
+        assert list(palette.hex(codes)) == expected.tolist(), f"slider {slider_val}"
+        if m.decimals is not None:
+            np.testing.assert_array_equal(shown, values.to_numpy())
+        else:
+            np.testing.assert_allclose(shown, values.to_numpy(), rtol=1e-6)
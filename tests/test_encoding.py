@@ -0,0 +1,84 @@
+# tests/test_encoding.py
+"""
+Geometry encodings: the vectorised WKB (twinning.encoding) against the
+per-row one, and the map component's vertex buffers (twinning.mapview)
+decoded back to the rings and lines they were built from.
+"""
+import numpy as np
+import pytest
+import shapely
+
+from conftest import GRID_DIR, require
+from twinning.datasets import read_dataset
+from twinning.encoding import round_coordinates, wkb_bytes
+from twinning.mapview import encode_geometry
+
+POLYGONS = np.array([
+    shapely.box(24.9, 60.1, 24.95, 60.15),
+    shapely.Polygon([(25, 60), (25.1, 60), (25.1, 60.1), (25, 60)],
+                    holes=[[(25.01, 60.01), (25.05, 60.01), (25.05, 60.05), (25.01, 60.01)]]),
+    shapely.MultiPolygon([shapely.box(24.0, 60.0, 24.1, 60.1), shapely.box(24.2, 60.2, 24.3, 60.3)]),
+])
+LINES = np.array([
+    shapely.LineString([(24.9, 60.1), (24.95, 60.15), (25.0, 60.12)]),
+    shapely.MultiLineString([[(25, 60), (25.1, 60.1)], [(25.2, 60.2), (25.3, 60.3), (25.4, 60.2)]]),
+])
+
+
+def _assert_wkb(geometries):
+    wkb = wkb_bytes(geometries)
+    assert list(wkb) == [geom.wkb for geom in geometries]
+    assert shapely.equals_exact(shapely.from_wkb(wkb), geometries).all()
+
+
+@pytest.mark.parametrize("geometries", [POLYGONS, LINES], ids=["polygons", "lines"])
+def test_wkb_matches_per_row(geometries):
+    _assert_wkb(geometries)
+
+
+def test_wkb_precision():
+    geometries = np.array([shapely.Point(24.123456, 60.987654)])
+    assert round_coordinates(geometries) is geometries
+    assert shapely.from_wkb(wkb_bytes(geometries, precision=2))[0].equals(shapely.Point(24.12, 60.99))
+    assert shapely.from_wkb(wkb_bytes(geometries))[0].equals(geometries[0])
+
+
+def test_wkb_matches_per_row_on_grid():
+    paths = sorted(GRID_DIR.glob("*.gpkg"))
+    if not paths:
+        pytest.skip("no grid datasets in this checkout")
+    _assert_wkb(np.asarray(read_dataset(str(require(paths[0]))).geometry))
+
+
+def _decode(encoded):
+    """[(feature, float32 coordinates of one part)] from the map buffers."""
+    coords = np.frombuffer(encoded.coords, np.float32).reshape(-1, 2)
+    starts = np.frombuffer(encoded.starts, np.uint32)
+    n_parts = len(starts) - 1
+    features = (np.arange(n_parts) if encoded.features is None
+                else np.frombuffer(encoded.features, np.uint32))
+    return [(int(features[i]), coords[starts[i]:starts[i + 1]]) for i in range(n_parts)]
+
+
+@pytest.mark.parametrize("geometries, kind", [(POLYGONS, "polygon"), (LINES, "line")], ids=["polygons", "lines"])
+def test_map_buffers_decode_to_the_geometry(geometries, kind):
+    encoded = encode_geometry(geometries)
+    assert encoded.kind == kind
+    parts, features = shapely.get_parts(geometries, return_index=True)
+    if kind == "polygon":
+        parts = shapely.get_exterior_ring(parts)   # holes are not drawn
+    decoded = _decode(encoded)
+    assert [feature for feature, _ in decoded] == features.tolist()
+    for (_, coords), part in zip(decoded, parts):
+        np.testing.assert_array_equal(coords, shapely.get_coordinates(part).astype(np.float32))
+    assert encode_geometry(geometries).key == encoded.key
+
+
+def test_single_part_features_need_no_feature_buffer():
+    assert encode_geometry(POLYGONS[:2]).features is None
+    assert encode_geometry(POLYGONS).features is not None
+
+
+def test_mixed_geometry_is_rejected():
+    with pytest.raises(ValueError):
+        encode_geometry(np.concatenate([POLYGONS, LINES]))
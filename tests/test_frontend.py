@@ -0,0 +1,73 @@
+# tests/test_frontend.py
+"""
+The map component's page (twinning/frontend/mapview/index.html) loads its
+libraries by exact version, the app's own copy first and the CDN's as the
+fallback; `python -m twinning.basemap` stores that copy. Until it has, the
+basemap's directory does not exist and is not served.
+"""
+import json
+import re
+
+import pytest
+
+import twinning.basemap
+from conftest import ROOT
+from twinning.basemap import CARTO_DARK, _basemap, basemap_style, warm_basemap
+from twinning.components import directory_component, serve
+from twinning.mapview import DECKGL_VERSION, LIBRARY_CDN, LIBRARY_FILES, MAPLIBRE_VERSION
+
+INDEX = ROOT / "twinning" / "frontend" / "mapview" / "index.html"
+PINNED = {"maplibre-gl": MAPLIBRE_VERSION, "deck.gl": DECKGL_VERSION}
+
+
+def test_libraries_are_pinned():
+    html = INDEX.read_text()
+    loaded = re.findall(r"https://unpkg\.com/([\w.-]+)@([^/\"']+)/", html)
+    assert {name for name, _ in loaded} == set(PINNED)
+    for name, version in loaded:
+        assert re.fullmatch(r"\d+\.\d+\.\d+", version), f"{name}@{version} is a range"
+        assert version == PINNED[name]
+
+
+def test_local_copy_first_then_cdn():
+    html = INDEX.read_text()
+    for name in LIBRARY_FILES:
+        local = html.find(f"../{_basemap.name}/vendor/{name}")
+        cdn = html.find(LIBRARY_CDN + name)
+        assert 0 <= local < cdn, name
+    # Nothing else is loaded from outside the app
+    assert set(re.findall(r"https://[^\"']+", html)) == {LIBRARY_CDN + name for name in LIBRARY_FILES}
+
+
+def test_warm_basemap_stores_the_libraries(tmp_path, monkeypatch):
+    style = {"version": 8, "sources": {}, "layers": []}
+
+    def fetch(url):
+        if url == "https://example.com/style.json":
+            return json.dumps(style).encode()
+        assert url.startswith(LIBRARY_CDN), url
+        return f"/* {url} */".encode()
+
+    monkeypatch.setattr(twinning.basemap, "BASEMAP_DIR", tmp_path / "basemap")
+    monkeypatch.setattr(twinning.basemap, "_fetch", fetch)
+    target = warm_basemap("https://example.com/style.json", log=lambda message: None)
+
+    for name in LIBRARY_FILES:
+        assert (target / "vendor" / name).read_text() == f"/* {LIBRARY_CDN + name} */"
+    assert json.loads((target / "basemap.json").read_text())["libraries"] == list(LIBRARY_FILES)
+    assert not (tmp_path / "basemap.tmp").exists()
+
+
+@pytest.mark.parametrize("name", LIBRARY_FILES)
+def test_library_paths_are_versioned(name):
+    package, _, _ = name.partition("/")
+    assert package in {f"{p}@{v}" for p, v in PINNED.items()}
+
+
+def test_missing_directories_are_not_served(tmp_path, monkeypatch):
+    missing = tmp_path / "basemap"
+    monkeypatch.setattr(twinning.basemap, "BASEMAP_DIR", missing)
+    monkeypatch.setattr(twinning.basemap, "_basemap", directory_component("twinning.basemap", "basemap", missing))
+    assert not serve(twinning.basemap._basemap)
+    assert basemap_style() == CARTO_DARK
+    assert not missing.exists()
@@ -0,0 +1,65 @@
+# tests/test_grid.py
+"""
+The YKR grid (twinning.grid): cells rebuilt from their ids against the
+polygons stored in the GeoPackages, and the grid Dataset read without
+geometry I/O against the original read.
+"""
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from conftest import GRID_DIR, require
+from twinning.datasets import read_dataset
+from twinning.grid import cell_geometry, ykr_id_column
+
+# Reprojection rounding, in degrees (~1 mm)
+TOLERANCE = 1e-8
+
+
+def _grid_paths():
+    paths = sorted(GRID_DIR.glob("*.gpkg"))
+    if not paths:
+        pytest.skip("no grid datasets in this checkout")
+    return paths
+
+
+def test_cell_geometry_matches_the_stored_polygons():
+    path = require(_grid_paths()[0])
+    stored = gpd.read_file(path).to_crs(4326)
+    ids = stored[ykr_id_column(stored.columns)].to_numpy(dtype=np.int64)
+
+    cells = cell_geometry(ids, 4326)
+    assert shapely.equals_exact(cells.polygons, stored.geometry.values, tolerance=TOLERANCE).all()
+    np.testing.assert_allclose(cells.bounds, stored.geometry.bounds.to_numpy(), atol=TOLERANCE)
+
+
+def test_cell_geometry_in_3067():
+    path = require(_grid_paths()[0])
+    stored = gpd.read_file(path).to_crs(3067)
+    ids = stored[ykr_id_column(stored.columns)].to_numpy(dtype=np.int64)
+    # Round trip of the stored WGS84 corners, in metres
+    assert shapely.equals_exact(cell_geometry(ids, 3067).polygons, stored.geometry.values, tolerance=1e-3).all()
+
+
+def test_cell_geometry_of_no_cells():
+    cells = cell_geometry(np.empty(0, dtype=np.int64))
+    assert len(cells.polygons) == 0 and cells.centroids.shape == (0, 2) and cells.bounds.shape == (0, 4)
+
+
+def test_cell_geometry_rejects_other_crs():
+    with pytest.raises(ValueError):
+        cell_geometry([0], 3857)
+
+
+@pytest.mark.parametrize("index", range(2))
+def test_read_dataset_matches_the_original_read(index):
+    paths = _grid_paths()
+    path = str(require(paths[index % len(paths)]))
+    original = gpd.read_file(path).to_crs(4326)
+    dataset = read_dataset(path)
+
+    assert dataset.crs.to_epsg() == 4326
+    assert shapely.equals_exact(np.asarray(dataset.geometry), original.geometry.values, tolerance=TOLERANCE).all()
+    for name in original.columns.drop(original.geometry.name):
+        np.testing.assert_array_equal(dataset[name], original[name].to_numpy())
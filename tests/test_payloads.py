@@ -0,0 +1,130 @@
+# tests/test_payloads.py
+"""
+The shared payload cache (twinning.payloads): size-bounded LRU,
+single-flight builds across threads, and the step payloads it holds.
+"""
+import threading
+
+import numpy as np
+import pytest
+
+from twinning.mapview import encode_step, step_key
+from twinning.payloads import PayloadCache, payload_size
+from twinning.scenarios import S2_S1, S3_S2, build_step_matrix
+
+
+def test_payload_size():
+    assert payload_size(b"abc") == 3
+    assert payload_size((b"ab", b"cde", None)) == 5
+    assert payload_size(None) == 0
+
+
+def test_lru_by_size():
+    cache = PayloadCache(max_size=10)
+    for key in "abc":
+        cache.get(key, lambda: b"xxxx")
+    # 12 bytes do not fit in 10: the oldest entry went first
+    assert cache.stats().entries == 2 and cache.stats().size == 8
+    assert cache.get("a", lambda: None) is None
+
+    cache = PayloadCache(max_size=10)
+    cache.get("a", lambda: b"xxxx")
+    cache.get("b", lambda: b"xxxx")
+    cache.get("a", lambda: pytest.fail("a is cached"))   # a is now the most recent
+    cache.get("c", lambda: b"xxxx")
+    assert cache.get("a", lambda: None) == b"xxxx"
+    assert cache.get("b", lambda: None) is None
+
+
+def test_oversized_payload_is_served_uncached():
+    cache = PayloadCache(max_size=10)
+    cache.get("small", lambda: b"xx")
+    assert cache.get("big", lambda: b"x" * 11) == b"x" * 11
+    assert cache.stats().entries == 1 and cache.stats().size == 2
+
+
+def test_stats_and_clear():
+    cache = PayloadCache(max_size=100)
+    cache.get("a", lambda: b"x")
+    cache.get("a", lambda: b"y")
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.waits) == (1, 1, 0)
+    assert stats.hit_rate == 0.5
+    cache.clear()
+    assert cache.stats() == (0, 0, 0, 0, 0, 100)
+
+
+def _concurrent(cache, key, build, n=16):
+    """Call cache.get(key, build) from `n` threads at once; the results (or errors)."""
+    results = [None] * n
+    barrier = threading.Barrier(n)
+
+    def session(i):
+        barrier.wait()
+        try:
+            results[i] = cache.get(key, build)
+        except Exception as error:
+            results[i] = error
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight():
+    cache = PayloadCache(max_size=100)
+    calls = []
+    release = threading.Event()
+
+    def build():
+        calls.append(1)
+        release.wait(5)
+        return b"payload"
+
+    threading.Timer(0.2, release.set).start()
+    results = _concurrent(cache, "k", build)
+    assert len(calls) == 1
+    assert results == [b"payload"] * 16
+    stats = cache.stats()
+    assert stats.misses == 1 and stats.hits + stats.waits == 15
+
+
+def test_failed_build_reaches_every_waiter_and_is_not_cached():
+    cache = PayloadCache(max_size=100)
+    release = threading.Event()
+
+    def build():
+        release.wait(5)
+        raise RuntimeError("broken")
+
+    threading.Timer(0.2, release.set).start()
+    results = _concurrent(cache, "k", build)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache.stats().entries == 0
+    assert cache.get("k", lambda: b"fixed") == b"fixed"
+
+
+def test_step_payloads():
+    base = np.linspace(-50, 50, 1001)
+    base[::97] = np.nan
+    matrix = build_step_matrix(base, S3_S2, [-30, -10, -1, 0, 1, 10, 30], decimals=1, nan_as_max=True)
+    cache = PayloadCache(max_size=2**20)
+    keys = set()
+    for value in S3_S2.slider_values()[::7]:
+        key = step_key(matrix, value)
+        keys.add(key)
+        payload = cache.get(key, lambda: encode_step(matrix, value))
+        values, codes = matrix.row(value)
+        assert payload == encode_step(matrix, value)
+        np.testing.assert_array_equal(np.frombuffer(payload[0], np.float32), values.astype(np.float32))
+        np.testing.assert_array_equal(np.frombuffer(payload[1], np.uint8), codes)
+    assert len(keys) == len(S3_S2.slider_values()[::7])
+
+    # Another build of the same column with other thresholds or scenario is another key
+    other = build_step_matrix(base, S3_S2, [-30, -10, -1, 0, 1, 10, 31], decimals=1, nan_as_max=True)
+    assert step_key(other, 47.3) != step_key(matrix, 47.3)
+    other = build_step_matrix(base, S2_S1, matrix.thresholds, decimals=1, nan_as_max=True)
+    assert step_key(other, 24.0) != step_key(matrix, 24.0)
@@ -0,0 +1,156 @@
+# tests/test_scenarios.py
+"""
+Step matrices and crossing indexes (twinning.scenarios) against
+recomputing the column at every slider step, as the pages did per rerun.
+
+The browser repeats the same arithmetic (frontend/mapview/scenario.js); its
+rows are checked against the matrices under node, when node is installed.
+"""
+import base64
+import json
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import GRID_DIR, ROOT, require
+from twinning.classify import classify
+from twinning.datasets import read_dataset
+from twinning.scenarios import S2_S1, S3_S2, build_crossing_index, build_step_matrix
+
+LEVELS = [0.10, 0.25, 0.40, 0.55, 0.70, 0.85, 0.95]
+SCENARIOS = {"S3_S2": S3_S2, "S2_S1": S2_S1}
+
+
+def _recompute(base, scenario, value, thresholds, decimals, nan_as_max):
+    values = base * (1 - scenario.factor(value))
+    if decimals is not None:
+        values = values.round(decimals)
+    return values, classify(values, thresholds, nan_as_max=nan_as_max)
+
+
+def _assert_rows(matrix, base, thresholds, decimals, nan_as_max=False):
+    for value in matrix.scenario.slider_values():
+        expected_values, expected_codes = _recompute(base, matrix.scenario, value, thresholds, decimals, nan_as_max)
+        values, codes = matrix.row(value)
+        np.testing.assert_array_equal(codes, expected_codes, err_msg=f"slider {value}")
+        if decimals is not None:
+            np.testing.assert_array_equal(values, expected_values, err_msg=f"slider {value}")
+        else:
+            np.testing.assert_allclose(values, expected_values, rtol=1e-6, err_msg=f"slider {value}")
+
+
+def _assert_crossings(matrix):
+    index = build_crossing_index(matrix)
+    slider_values = matrix.scenario.slider_values()
+    pairs = list(zip(slider_values[:-1], slider_values[1:]))
+    # Jumps and moves back, as a dragged slider or a reset gives them
+    pairs += [(slider_values[0], slider_values[-1]), (slider_values[-1], slider_values[0]),
+              (slider_values[len(slider_values) // 3], slider_values[2 * len(slider_values) // 3])]
+    for old, new in pairs:
+        expected = np.flatnonzero(matrix.row(old)[1] != matrix.row(new)[1])
+        np.testing.assert_array_equal(index.changed(old, new), expected, err_msg=f"{old} -> {new}")
+
+
+def test_slider_values():
+    assert S3_S2.n_steps == 234 and S2_S1.n_steps == 241
+    assert S3_S2.slider_values()[[0, -1]].tolist() == [24.0, 47.3]
+    assert S3_S2.factor(S3_S2.full) == 0 and S3_S2.factor(S3_S2.none) == 1
+    assert S2_S1.factor(S2_S1.full) == 0 and S2_S1.factor(S2_S1.none) == 1
+    for scenario in SCENARIOS.values():
+        values = scenario.slider_values()
+        assert [scenario.index(v) for v in values] == list(range(scenario.n_steps))
+    with pytest.raises(ValueError):
+        S3_S2.index(23.9)
+
+
+@pytest.mark.parametrize("nan_as_max", [False, True])
+@pytest.mark.parametrize("decimals", [None, 1])
+@pytest.mark.parametrize("scenario", SCENARIOS.values(), ids=SCENARIOS.keys())
+def test_step_matrix_edge_values(scenario, decimals, nan_as_max):
+    # Infinite percentage changes turn NaN where the change has faded out (inf * 0)
+    base = pd.Series([-np.inf, np.inf, np.nan, 0.0, -0.05, 0.05, 0.25, 1e6, -37.35, 12.44])
+    thresholds = [-30.0, -1.0, 0.0, 0.05, 0.2, 2.0, 20.0]
+    matrix = build_step_matrix(base, scenario, thresholds, decimals, nan_as_max)
+    assert matrix.values.shape == matrix.codes.shape == (scenario.n_steps, len(base))
+    assert not matrix.values.flags.writeable and not matrix.codes.flags.writeable
+    _assert_rows(matrix, base, thresholds, decimals, nan_as_max)
+    _assert_crossings(matrix)
+
+
+GRID_FILES = sorted(GRID_DIR.glob("*.gpkg"))
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS.values(), ids=SCENARIOS.keys())
+@pytest.mark.parametrize("name, decimals", [("absolute_change", 1), ("percentage_change", None)])
+@pytest.mark.parametrize("path", GRID_FILES, ids=[p.stem for p in GRID_FILES])
+def test_step_matrix_matches_recompute(path, name, decimals, scenario):
+    base = pd.Series(read_dataset(str(require(path)))[name])
+    thresholds = base.quantile(LEVELS).tolist()
+    matrix = build_step_matrix(base, scenario, thresholds, decimals)
+    _assert_rows(matrix, base, thresholds, decimals)
+    _assert_crossings(matrix)
+
+
+# ============================================================
+# --- BROWSER PARITY (frontend/mapview/scenario.js) ---
+# ============================================================
+SCENARIO_JS = ROOT / "twinning" / "frontend" / "mapview" / "scenario.js"
+
+# Reads {base (float64 bytes, base64), scenario, thresholds, decimals, nanAsMax, values};
+# writes one {values, codes} (float64 / uint8 bytes, base64) per slider value
+STEP_ROWS_JS = """
+const { stepRow } = require(process.argv[1]);
+const input = JSON.parse(require("fs").readFileSync(0, "utf8"));
+const bytes = Buffer.from(input.base, "base64");
+const base = new Float64Array(bytes.buffer, bytes.byteOffset, bytes.length / 8);
+const rows = input.values.map((value) => {
+  const row = stepRow(base, input.scenario, input.thresholds, input.decimals, input.nanAsMax, value);
+  return { values: Buffer.from(row.values.buffer).toString("base64"),
+           codes: Buffer.from(row.codes.buffer).toString("base64") };
+});
+process.stdout.write(JSON.stringify(rows));
+"""
+
+
+def _step_rows_js(matrix, slider_values):
+    node = shutil.which("node")
+    if node is None:
+        pytest.skip("node is not installed")
+    request = {
+        "base": base64.b64encode(matrix.base.tobytes()).decode(),
+        "scenario": matrix.scenario._asdict(),
+        "thresholds": list(matrix.thresholds),
+        "decimals": matrix.decimals,
+        "nanAsMax": matrix.nan_as_max,
+        "values": [float(v) for v in slider_values],
+    }
+    out = subprocess.run([node, "-e", STEP_ROWS_JS, str(SCENARIO_JS)], input=json.dumps(request),
+                         capture_output=True, text=True, check=True).stdout
+    return [(np.frombuffer(base64.b64decode(row["values"]), np.float64),
+             np.frombuffer(base64.b64decode(row["codes"]), np.uint8)) for row in json.loads(out)]
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS.values(), ids=SCENARIOS.keys())
+@pytest.mark.parametrize("name, decimals, nan_as_max", [("absolute_change", 1, True),
+                                                        ("percentage_change", None, False)])
+def test_browser_step_rows_match_the_matrix(scenario, name, decimals, nan_as_max):
+    paths = sorted(GRID_DIR.glob("*.gpkg"))
+    if not paths:
+        pytest.skip("no grid datasets in this checkout")
+    # A grid column, with NaN and infinite cells whatever the file holds
+    base = np.concatenate([read_dataset(str(require(paths[0])))[name], [np.nan, np.inf, -np.inf, 0.05]])
+    with np.errstate(invalid="ignore"):
+        thresholds = pd.Series(base).quantile(LEVELS).tolist()
+    matrix = build_step_matrix(base, scenario, thresholds, decimals, nan_as_max)
+
+    slider_values = scenario.slider_values()
+    # Both ends (full change, faded out: inf * 0 is NaN) and a few steps between
+    slider_values = slider_values[[0, 1, len(slider_values) // 3, len(slider_values) // 2, -2, -1]]
+    for value, (values, codes) in zip(slider_values, _step_rows_js(matrix, slider_values)):
+        i = scenario.index(value)
+        np.testing.assert_array_equal(codes, matrix.codes[i], err_msg=f"slider {value}")
+        # The component is sent float32 values; the browser's are float64
+        np.testing.assert_array_equal(values.astype(np.float32), matrix.values[i], err_msg=f"slider {value}")
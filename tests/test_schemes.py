@@ -0,0 +1,65 @@
+# tests/test_schemes.py
+"""
+Classification schemes (twinning.schemes): Jenks against an exhaustive
+search, and columns without finite values, which fall back to the page's
+default thresholds.
+"""
+from itertools import combinations
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from twinning.schemes import SCHEMES, equal_interval, natural_breaks, quantile, scheme_classes
+
+PALETTE = ("#000000", "#111111", "#222222", "#333333", "#444444", "#555555", "#666666")
+DEFAULT = (1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0)
+
+
+def _jenks_exhaustive(values, k):
+    """Upper bounds of the k contiguous classes with the least squared deviation."""
+    values = np.sort(values)
+    best, best_bounds = np.inf, None
+    for cuts in combinations(range(1, len(values)), k - 1):
+        classes = np.split(values, cuts)
+        if any(c[-1] == n[0] for c, n in zip(classes, classes[1:])):
+            continue  # equal values stay in one class
+        cost = sum(((c - c.mean()) ** 2).sum() for c in classes)
+        if cost < best - 1e-12:
+            best, best_bounds = cost, [c[-1] for c in classes]
+    return best_bounds
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_natural_breaks_is_optimal(seed):
+    values = np.random.default_rng(seed).normal(size=12).round(1)
+    assert natural_breaks(values, 4) == pytest.approx(_jenks_exhaustive(values, 4))
+
+
+def test_schemes_ignore_non_finite_values():
+    values = [np.nan, -np.inf, 0.0, 1.0, 2.0, 3.0, np.inf]
+    assert equal_interval(values, 3) == [1.0, 2.0, 3.0]
+    assert quantile(values, 3) == pytest.approx([1.0, 2.0, 3.0])
+    assert natural_breaks(values, 3)[-1] == 3.0
+
+
+@pytest.mark.parametrize("scheme", SCHEMES)
+@pytest.mark.parametrize("values", [[], [np.nan, np.nan], [np.inf, -np.inf, np.nan]], ids=["empty", "nan", "inf"])
+def test_no_finite_values_give_no_bounds(scheme, values):
+    assert SCHEMES[scheme](values, 7) == []
+
+
+@pytest.mark.parametrize("scheme", SCHEMES)
+def test_scheme_classes_fall_back_to_default(scheme, tmp_path, no_disk_cache):
+    path = tmp_path / "no_data.gpkg"
+    lines = [shapely.LineString([(24.9 + i / 100, 60.1), (24.9 + i / 100, 60.2)]) for i in range(5)]
+    gpd.GeoDataFrame({"absolute_change": [np.nan] * 5, "percentage_change": [0.1, 0.2, 0.3, 0.4, 0.5]},
+                     geometry=lines, crs="EPSG:4326").to_file(path)
+
+    thresholds, classes = scheme_classes(str(path), "absolute_change", scheme, PALETTE, DEFAULT)
+    assert thresholds == DEFAULT
+    assert len(classes.labels) == len(PALETTE)
+
+    thresholds, _ = scheme_classes(str(path), "percentage_change", scheme, PALETTE, DEFAULT)
+    assert thresholds != DEFAULT and thresholds[-1] == pytest.approx(0.5)
@@ -0,0 +1,60 @@
+# tests/test_warmup.py
+"""
+The warm-up builds what the pages draw: after it, opening every comparison
+page in both modes builds no step matrix (twinning.pagemaps is in step
+with the pages).
+"""
+from pathlib import Path
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import twinning.scenarios
+from conftest import ROOT
+from twinning.pagemaps import PAGE_MAPS, maps_of
+from twinning.pagestate import mode_key
+from twinning.warmup import Warmup, map_datasets
+
+PAGES = sorted({m.page for m in PAGE_MAPS})
+
+
+def test_page_maps_are_map_datasets():
+    datasets = set(map_datasets())
+    for m in PAGE_MAPS:
+        assert (ROOT / m.path).exists() <= (m.path in datasets), m.path
+        assert m in maps_of(m.path)
+
+
+@pytest.fixture(scope="module")
+def warmed():
+    from twinning.datasets import DISK_CACHE
+
+    st.cache_resource.clear()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(DISK_CACHE, "enabled", False)
+        warmup = Warmup(workers=2)
+        warmup.start()
+        assert warmup.wait(300)
+    return warmup
+
+
+@pytest.mark.parametrize("mode", ["S3_S2", "S2_S1"])
+@pytest.mark.parametrize("page", PAGES)
+def test_pages_build_no_step_matrix_after_warmup(page, mode, warmed, no_disk_cache, monkeypatch):
+    missing = [m.path for m in PAGE_MAPS if m.page == page and not (ROOT / m.path).exists()]
+    if missing:
+        pytest.skip(f"{missing[0]} not in this checkout")
+    assert not warmed.status().failed
+
+    def build_step_matrix(*args, **kwargs):
+        raise AssertionError("the page built a step matrix the warm-up did not")
+
+    monkeypatch.setattr(twinning.scenarios, "build_step_matrix", build_step_matrix)
+    monkeypatch.chdir(ROOT)
+    at = AppTest.from_file(str(ROOT / "Main_page.py"), default_timeout=120)
+    at.run()
+    at.switch_page(str(Path("pages") / f"{page}.py"))
+    at.session_state[mode_key(page)] = mode
+    at.run()
+    assert not at.exception, at.exception[0].value
@@ -0,0 +1 @@
+"""Shared data and map helpers for the T-Winning Spaces 2035 interactive tool."""
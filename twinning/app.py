@@ -0,0 +1,62 @@
+# twinning/app.py
+"""
+ASGI entry point for replicas behind a load balancer.
+
+    uvicorn twinning.app:app --host 0.0.0.0 --port 8501      # from the repository root
+
+Serves the same app as `streamlit run Main_page.py`, and at startup begins
+warming every map dataset in the background (twinning.warmup). Two checks:
+
+    /_stcore/health     liveness: the server is up (streamlit's own)
+    /api/ready          readiness: 503 while warming, 200 once every dataset
+                        has been warmed; the body is the warm-up status
+
+Point the load balancer's readiness probe at /api/ready, so a new replica
+gets traffic only once its caches are warm.
+
+The map modules are imported here, before any script runs, and streamlit
+registers a declared component only from a running script: pages reusing
+these modules would find their components unregistered (404 on the map's
+files). `register_components` registers them once the runtime exists.
+"""
+import os
+from contextlib import asynccontextmanager
+
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from streamlit.runtime import get_instance
+from streamlit.starlette import App
+
+from twinning.basemap import _basemap
+from twinning.datasets import ROOT
+from twinning.mapview import _component
+from twinning.tiles import _tiles
+from twinning.warmup import WARMUP, start_warmup
+
+READY_PATH = "/api/ready"
+
+# Components declared by the modules imported above
+COMPONENTS = (_component, _tiles, _basemap)
+
+
+def register_components():
+    """Register COMPONENTS with the running runtime's component registry."""
+    registry = get_instance().component_registry
+    for component in COMPONENTS:
+        if component.abspath is None or os.path.isdir(component.abspath):
+            registry.register_component(component)
+
+
+@asynccontextmanager
+async def _lifespan(app):
+    register_components()
+    start_warmup()
+    yield
+
+
+async def _ready(request):
+    status = WARMUP.status()
+    return JSONResponse(status.as_dict(), status_code=200 if status.ready else 503)
+
+
+app = App(str(ROOT / "Main_page.py"), lifespan=_lifespan, routes=[Route(READY_PATH, _ready)])
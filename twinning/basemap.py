@@ -0,0 +1,217 @@
+# twinning/basemap.py
+"""
+Self-hosted copy of the CARTO Dark Matter basemap for the capital region.
+
+    python -m twinning.basemap                  # download style, sprites, glyphs, tiles and the map libraries
+    python -m twinning.basemap --max-zoom 13    # fewer tiles
+
+Every map used to load its style, sprites, glyphs and tiles from
+basemaps.cartocdn.com on each page load, and MapLibre and deck.gl from
+unpkg.com: slow, and nothing at all without internet (the kiosk). The
+warm-up command stores them once under
+
+    Datasets/compiled/basemap/style.json       sources, sprite and glyphs rewritten to local paths
+    Datasets/compiled/basemap/sprite/...       sprite.json/png, @2x
+    Datasets/compiled/basemap/glyphs/<fontstack>/<range>.pbf
+    Datasets/compiled/basemap/tiles/<source>/<z>/<x>/<y>.pbf
+    Datasets/compiled/basemap/vendor/<package>@<version>/...   the map component's
+                                               pinned libraries (twinning.mapview.LIBRARY_FILES)
+    Datasets/compiled/basemap/basemap.json     what was fetched, and from where
+
+and Streamlit's component file handler serves them. Tiles cover REGION at
+zooms 0 ... MAX_ZOOM; the local style bounds its sources to REGION, so the
+browser never asks for tiles that were not fetched. Paths in style.json are
+relative to it (the server's base path is only known at runtime); the
+frontend resolves them.
+
+Which style the maps use is set by the TWINNING_BASEMAP environment variable:
+
+    auto     the local copy if it was warmed up, else the remote style (default)
+    local    always the local copy
+    remote   always the remote style
+
+The frontend falls back to the remote style when the local one cannot be
+loaded, and to the CDN's libraries when there is no local copy.
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import streamlit as st
+
+from twinning.components import directory_component, serve
+from twinning.datasets import COMPILED_DIR, relative_path
+
+BASEMAP_DIR = COMPILED_DIR / "basemap"
+
+CARTO_DARK = "https://basemaps.cartocdn.com/gl/dark-matter-gl-style/style.json"
+
+# west, south, east, north: the capital region's grid with some margin
+REGION = (24.4, 60.0, 25.4, 60.5)
+MAX_ZOOM = 14          # CARTO's vector tiles stop here; MapLibre overzooms them
+
+# Latin-1 (incl. å ä ö), Latin Extended-A, general punctuation
+GLYPH_RANGES = ("0-255", "256-511", "8192-8447")
+
+WORKERS = 8
+USER_AGENT = "twinning-basemap"
+
+# Bump when the stored layout changes; older copies are then ignored
+BASEMAP_FORMAT = 1
+
+# Serves BASEMAP_DIR once it was warmed up (twinning.components)
+_basemap = directory_component(__name__, "basemap", BASEMAP_DIR)
+
+
+# ============================================================
+# --- WARM-UP ---
+# ============================================================
+def _fetch(url: str) -> bytes:
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT, "Accept-Encoding": "gzip"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        data = response.read()
+    # Tiles are often gzipped whatever the headers say; the file handler serves them as they are
+    return gzip.decompress(data) if data[:2] == b"\x1f\x8b" else data
+
+
+def _write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def region_tiles(region=REGION, max_zoom=MAX_ZOOM, min_zoom=0):
+    """(z, x, y) of every web Mercator tile that intersects `region`."""
+    west, south, east, north = region
+    for z in range(min_zoom, max_zoom + 1):
+        scale = 2 ** z
+        lat = np.radians([north, south])
+        y0, y1 = ((1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * scale).astype(int)
+        x0, x1 = int((west + 180) / 360 * scale), int((east + 180) / 360 * scale)
+        for x in range(x0, min(x1, scale - 1) + 1):
+            for y in range(y0, min(y1, scale - 1) + 1):
+                yield z, x, y
+
+
+def _font_stacks(layers) -> set:
+    """Font stacks named by the style's symbol layers (literal lists only)."""
+    stacks = set()
+    for layer in layers:
+        fonts = layer.get("layout", {}).get("text-font")
+        if isinstance(fonts, list) and fonts and fonts[0] == "literal":
+            fonts = fonts[1]
+        if isinstance(fonts, list) and all(isinstance(font, str) for font in fonts):
+            stacks.add(",".join(fonts))
+    return stacks
+
+
+def warm_basemap(style_url=CARTO_DARK, region=REGION, max_zoom=MAX_ZOOM, workers=WORKERS, log=print) -> Path:
+    """
+    Download `style_url` and everything it needs for `region`, and the map
+    component's libraries, into a fresh BASEMAP_DIR.
+    """
+    from twinning.mapview import LIBRARY_CDN, LIBRARY_FILES
+
+    tmp = BASEMAP_DIR.with_name(BASEMAP_DIR.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    style = json.loads(_fetch(style_url))
+    downloads = [(LIBRARY_CDN + name, tmp / "vendor" / name) for name in LIBRARY_FILES]   # (url, local path)
+
+    if isinstance(style.get("sprite"), str):
+        for suffix in (".json", ".png", "@2x.json", "@2x.png"):
+            downloads.append((style["sprite"] + suffix, tmp / "sprite" / f"sprite{suffix}"))
+        style["sprite"] = "sprite/sprite"
+
+    if style.get("glyphs"):
+        for stack in sorted(_font_stacks(style["layers"])):
+            for glyphs in GLYPH_RANGES:
+                url = style["glyphs"].replace("{fontstack}", urllib.request.quote(stack, safe=",")).replace("{range}", glyphs)
+                downloads.append((url, tmp / "glyphs" / stack / f"{glyphs}.pbf"))
+        style["glyphs"] = "glyphs/{fontstack}/{range}.pbf"
+
+    tile_count = 0
+    for name, source in style["sources"].items():
+        if source.get("type") != "vector":
+            continue
+        tilejson = json.loads(_fetch(source["url"])) if "url" in source else source
+        template = tilejson["tiles"][0]
+        zoom = min(max_zoom, tilejson.get("maxzoom", max_zoom))
+        for z, x, y in region_tiles(region, zoom, tilejson.get("minzoom", 0)):
+            url = template.replace("{z}", str(z)).replace("{x}", str(x)).replace("{y}", str(y))
+            downloads.append((url, tmp / "tiles" / name / str(z) / str(x) / f"{y}.pbf"))
+            tile_count += 1
+        style["sources"][name] = {
+            "type": "vector",
+            "tiles": [f"tiles/{name}/{{z}}/{{x}}/{{y}}.pbf"],
+            "minzoom": tilejson.get("minzoom", 0),
+            "maxzoom": zoom,
+            "bounds": list(region),
+            "attribution": tilejson.get("attribution", ""),
+        }
+
+    log(f"{style_url}: {len(downloads)} files ({tile_count} tiles, zoom <= {max_zoom})")
+    with ThreadPoolExecutor(workers) as pool:
+        for (url, target), data in zip(downloads, pool.map(lambda d: _fetch(d[0]), downloads)):
+            _write(target, data)
+
+    _write(tmp / "style.json", json.dumps(style).encode())
+    _write(tmp / "basemap.json", json.dumps({
+        "format": BASEMAP_FORMAT,
+        "style_url": style_url,
+        "region": list(region),
+        "max_zoom": max_zoom,
+        "files": len(downloads),
+        "tiles": tile_count,
+        "libraries": list(LIBRARY_FILES),
+        "fetched": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }).encode())
+    shutil.rmtree(BASEMAP_DIR, ignore_errors=True)
+    os.replace(tmp, BASEMAP_DIR)
+    return BASEMAP_DIR
+
+
+# ============================================================
+# --- SERVING ---
+# ============================================================
+def local_basemap() -> bool:
+    """Whether a complete local copy was warmed up."""
+    try:
+        meta = json.loads((BASEMAP_DIR / "basemap.json").read_text())
+    except (OSError, ValueError):
+        return False
+    return meta.get("format") == BASEMAP_FORMAT and (BASEMAP_DIR / "style.json").exists()
+
+
+def basemap_style() -> str:
+    """Style URL for the maps, local or remote as TWINNING_BASEMAP says (see the module docstring)."""
+    mode = os.environ.get("TWINNING_BASEMAP", "auto")
+    # The map's libraries are loaded from here too, whichever style is used
+    served = serve(_basemap)
+    if mode == "remote" or (mode == "auto" and not (served and local_basemap())):
+        return CARTO_DARK
+    base = st.get_option("server.baseUrlPath").strip("/")
+    prefix = f"/{base}" if base else ""
+    return f"{prefix}/component/{_basemap.name}/style.json"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m twinning.basemap", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--style", default=CARTO_DARK, help="remote style to copy (default: CARTO Dark Matter)")
+    parser.add_argument("--max-zoom", type=int, default=MAX_ZOOM)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="parallel downloads")
+    args = parser.parse_args(argv)
+
+    BASEMAP_DIR.parent.mkdir(parents=True, exist_ok=True)
+    target = warm_basemap(args.style, max_zoom=args.max_zoom, workers=args.workers)
+    size = sum(f.stat().st_size for f in target.rglob("*") if f.is_file())
+    print(f"-> {relative_path(target)} ({size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
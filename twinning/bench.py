@@ -0,0 +1,402 @@
+# twinning/bench.py
+"""
+Small benchmarks for the data paths behind the map pages.
+
+    python -m twinning.bench startup     # original GeoPackage load vs attribute-only and compiled Arrow loads
+    python -m twinning.bench classify    # per-row get_color vs vectorised classify
+    python -m twinning.bench steps       # per-rerun recompute vs step matrix row lookup (+ check)
+    python -m twinning.bench schemes     # time of each classification scheme per dataset column
+    python -m twinning.bench payloads    # shared step payload cache under concurrent sessions
+    python -m twinning.bench geometry    # per-row GeoJSON vs map buffers, per-row vs vectorised WKB (+ check)
+    python -m twinning.bench interactions  # server time of a slider move: full page (new) vs map fragment
+    python -m twinning.bench restart     # a dataset's artifacts after a restart: empty vs filled disk cache
+
+Timings are the median of --repeat runs, in milliseconds.
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from twinning.build import GRID_DIR, compile_dataset
+from twinning.classify import classify, colours
+from twinning.datasets import find_compiled, load_dataset, read_compiled, read_dataset
+from twinning import timing
+from twinning.encoding import wkb_bytes
+from twinning.grid import GRID_FILE, read_grid
+from twinning.mapview import encode_geometry, encode_step, step_key
+from twinning.pagestate import mode_key
+from twinning.payloads import PayloadCache
+from twinning.scenarios import S2_S1, S3_S2, build_crossing_index, build_step_matrix
+from twinning.schemes import SCHEMES
+
+
+def _median_ms(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def _original_load(path):
+    """How the pages loaded a dataset before twinning.datasets: geometry read and reprojected."""
+    gdf = gpd.read_file(path)
+    if gdf.crs and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(4326)
+    return gdf
+
+
+def bench_startup(repeat):
+    """
+    Cold-load every grid dataset three ways: as the pages originally did
+    (gpd.read_file with geometry, then to_crs), through read_dataset
+    (attributes only, cell polygons rebuilt from the YKR ids) and from the
+    compiled file. Speedups are against the original load. The shared YKR
+    grid table is read once per process and reported separately.
+    """
+    print(f"{'dataset':<36}{'gpkg ms':>10}{'attrs ms':>10}{'compiled ms':>13}{'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for path in sorted(GRID_DIR.glob("*.gpkg")):
+            # Use the real compiled file if it is current, otherwise build a throwaway one
+            target = find_compiled(path) or compile_dataset(path, tmp)
+            gpkg_ms = _median_ms(lambda: _original_load(path), repeat)
+            attrs_ms = _median_ms(lambda: read_dataset(path), repeat)
+            compiled_ms = _median_ms(lambda: read_compiled(target), repeat)
+            print(f"{Path(path).stem:<36}{gpkg_ms:>10.1f}{attrs_ms:>10.1f}{compiled_ms:>13.1f}"
+                  f"{gpkg_ms / compiled_ms:>8.1f}x")
+        grid_ms = _median_ms(lambda: read_grid(Path(target).parent / GRID_FILE), repeat)
+        print(f"{'shared YKR grid (once per process)':<36}{'':>20}{grid_ms:>13.1f}")
+
+
+def _page_get_color(value, thresholds, palette, reverse=False):
+    """The Emissions page's get_color before twinning.classify, timed as the reference."""
+    if reverse:
+        palette = list(reversed(palette))
+    if value <= thresholds[0]: return palette[0]
+    elif value <= thresholds[1]: return palette[1]
+    elif value <= thresholds[2]: return palette[2]
+    elif value <= thresholds[3]: return palette[3]
+    elif value <= thresholds[4]: return palette[4]
+    elif value <= thresholds[5]: return palette[5]
+    elif value <= thresholds[6]: return palette[6]
+    else: return palette[-1]
+
+
+# Any seven distinct colours will do for the comparison
+_PALETTE = ["#000000", "#111111", "#222222", "#333333", "#444444", "#555555", "#666666"]
+_LEVELS = [0.10, 0.25, 0.40, 0.55, 0.70, 0.85, 0.95]
+
+
+def bench_classify(repeat):
+    """
+    Time row-by-row get_color against classify + colours on every grid
+    dataset. That both give the same colours on every page is checked by
+    tests/test_classify.py, against each page's own get_color.
+    """
+    print(f"{'dataset / column':<56}{'apply ms':>10}{'vector ms':>11}{'speedup':>9}")
+    for path in sorted(GRID_DIR.glob("*.gpkg")):
+        ds = load_dataset(str(path))
+        for name in ("absolute_change", "percentage_change"):
+            series = pd.Series(ds[name]).round(1)
+            thresholds = series.quantile(_LEVELS).tolist()
+            apply_ms = _median_ms(lambda: series.apply(lambda v: _page_get_color(v, thresholds, _PALETTE)), repeat)
+            vector_ms = _median_ms(lambda: colours(classify(series, thresholds, nan_as_max=True), _PALETTE), repeat)
+            label = f"{path.stem} / {name}"
+            print(f"{label:<56}{apply_ms:>10.1f}{vector_ms:>11.2f}{apply_ms / vector_ms:>8.0f}x")
+
+
+def bench_steps(repeat):
+    """
+    Time what a slider move used to cost (scale, round, classify a column)
+    against a step-matrix row lookup, and check the lookup gives the same
+    classes at every step and the same values (exactly for rounded columns,
+    to float32 precision otherwise). Also reports how many cells change class
+    per 0.1 step (the crossing index), and checks that against the matrix.
+    Returns the number of mismatches.
+    """
+    mismatches = 0
+    print(f"{'dataset / column / scenario':<64}{'build ms':>10}{'MB':>6}{'rerun ms':>10}{'lookup ms':>11}"
+          f"{'changed/step':>14}")
+    for path in sorted(GRID_DIR.glob("*.gpkg")):
+        ds = load_dataset(str(path))
+        for name, decimals in (("absolute_change", 1), ("percentage_change", None)):
+            base = pd.Series(ds[name])
+            thresholds = base.quantile(_LEVELS).tolist()
+            for label, scenario in (("S3_S2", S3_S2), ("S2_S1", S2_S1)):
+                def recompute(value):
+                    values = base * (1 - scenario.factor(value))
+                    if decimals is not None:
+                        values = values.round(decimals)
+                    return values, classify(values, thresholds)
+
+                start = time.perf_counter()
+                matrix = build_step_matrix(base, scenario, thresholds, decimals)
+                build_ms = (time.perf_counter() - start) * 1000
+                size_mb = (matrix.values.nbytes + matrix.codes.nbytes) / 1e6
+                middle = scenario.slider_values()[scenario.n_steps // 2]
+                rerun_ms = _median_ms(lambda: recompute(middle), repeat)
+                lookup_ms = _median_ms(lambda: matrix.row(middle), repeat)
+                row = f"{path.stem} / {name} / {label}"
+
+                index = build_crossing_index(matrix)
+                slider_values = scenario.slider_values()
+                per_step = []
+                for old, new in zip(slider_values[:-1], slider_values[1:]):
+                    changed = index.changed(old, new)
+                    expected = np.flatnonzero(matrix.row(old)[1] != matrix.row(new)[1])
+                    mismatches += 0 if np.array_equal(changed, expected) else 1
+                    per_step.append(len(changed))
+                print(f"{row:<64}{build_ms:>10.1f}{size_mb:>6.1f}{rerun_ms:>10.2f}{lookup_ms:>11.3f}"
+                      f"{statistics.median(per_step):>14.0f}")
+
+                for value in scenario.slider_values():
+                    expected_values, expected_codes = recompute(value)
+                    values, codes = matrix.row(value)
+                    mismatches += int((codes != expected_codes).sum())
+                    if decimals is not None:
+                        same = (values == expected_values) | (np.isnan(values) & expected_values.isna())
+                    else:
+                        same = np.isclose(values, expected_values, rtol=1e-6, equal_nan=True)
+                    mismatches += int((~np.asarray(same)).sum())
+    print("check:", "OK" if mismatches == 0 else f"{mismatches} mismatching cells")
+    return mismatches
+
+
+def bench_schemes(repeat, k=7):
+    """Time every classification scheme on every grid dataset column (k classes)."""
+    names = list(SCHEMES)
+    print(f"{'dataset / column':<56}" + "".join(f"{name + ' ms':>20}" for name in names))
+    for path in sorted(GRID_DIR.glob("*.gpkg")):
+        ds = load_dataset(str(path))
+        for column in ("absolute_change", "percentage_change"):
+            times = [_median_ms(lambda: SCHEMES[name](ds[column], k), repeat) for name in names]
+            label = f"{path.stem} / {column}"
+            print(f"{label:<56}" + "".join(f"{ms:>20.1f}" for ms in times))
+
+
+def bench_payloads(repeat, sessions=32, max_mb=64):
+    """
+    Replay slider requests from `sessions` concurrent threads against a fresh
+    PayloadCache: most visitors stay at the default position, the rest pick
+    random steps. Reports the hit rate, and checks that single-flight built
+    each step at most once and that cached payloads equal fresh encodings.
+    Returns the number of failed checks.
+    """
+    rng = np.random.default_rng(0)
+    path = GRID_DIR / "s2_s3_emissions_diff.gpkg"
+    base = load_dataset(str(path))["absolute_change"] / 1000
+    matrix = build_step_matrix(base, S3_S2, np.nanquantile(base, _LEVELS).tolist(), decimals=1)
+    steps = S3_S2.slider_values()
+    cache = PayloadCache(max_size=max_mb * 2**20)
+    builds = {}
+    builds_lock = threading.Lock()
+
+    def build(value):
+        with builds_lock:
+            builds[value] = builds.get(value, 0) + 1
+        return encode_step(matrix, value)
+
+    requests = [
+        [S3_S2.full if rng.random() < 0.6 else float(rng.choice(steps)) for _ in range(10 * repeat)]
+        for _ in range(sessions)
+    ]
+    barrier = threading.Barrier(sessions)
+
+    def session(values):
+        barrier.wait()  # everyone starts together, on a cold cache
+        for value in values:
+            cache.get(step_key(matrix, value), lambda: build(value))
+
+    threads = [threading.Thread(target=session, args=(values,)) for values in requests]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    stats = cache.stats()
+    print(f"{path.stem} / absolute_change / S3_S2, {sessions} sessions x {10 * repeat} requests")
+    print(f"  hits {stats.hits}, waited on another build {stats.waits}, built {stats.misses}"
+          f" -> hit rate {stats.hit_rate:.1%}")
+    print(f"  {stats.entries} entries, {stats.size / 2**20:.2f} of {stats.max_size / 2**20:.0f} MiB, {elapsed_ms:.0f} ms total")
+
+    failures = sum(1 for count in builds.values() if count > 1)
+    for value in builds:
+        cached = cache.get(step_key(matrix, value), lambda: None)
+        failures += 0 if cached == encode_step(matrix, value) else 1
+    print("single-flight and content check:", "OK" if failures == 0 else f"{failures} failures")
+    return failures
+
+
+def bench_geometry(repeat):
+    """
+    Encode every dataset's geometry as the pages used to (GeoJSON per row,
+    for kepler.gl) and as it is encoded now: the map component's vertex
+    buffers (twinning.mapview) and the build step's WKB, per row and in one
+    vectorised call. Checks that the vectorised WKB is byte for byte the
+    per-row WKB and decodes to the same geometry. Returns the number of
+    failed checks.
+    """
+    from twinning.tiles import TRAFFIC_DIR
+
+    print(f"{'dataset':<48}{'rows':>7}{'geojson ms':>12}{'map ms':>9}{'speedup':>9}"
+          f"{'row wkb ms':>12}{'wkb ms':>9}{'speedup':>9}{'MB geojson':>12}{'MB map':>9}")
+    failures = 0
+    for path in sorted(GRID_DIR.glob("*.gpkg")) + sorted(TRAFFIC_DIR.glob("*.gpkg")):
+        geometries = np.asarray(load_dataset(str(path)).geometry)
+        legacy_ms = _median_ms(lambda: [json.dumps(geom.__geo_interface__) for geom in geometries], repeat)
+        map_ms = _median_ms(lambda: encode_geometry(geometries), repeat)
+        row_wkb_ms = _median_ms(lambda: [geom.wkb for geom in geometries], repeat)
+        wkb_ms = _median_ms(lambda: wkb_bytes(geometries), repeat)
+
+        legacy = sum(len(json.dumps(geom.__geo_interface__)) for geom in geometries) / 1e6
+        encoded = encode_geometry(geometries)
+        buffers = sum(len(part or b"") for part in (encoded.coords, encoded.starts, encoded.features)) / 1e6
+        print(f"{path.stem:<48}{len(geometries):>7}{legacy_ms:>12.1f}{map_ms:>9.1f}{legacy_ms / map_ms:>8.1f}x"
+              f"{row_wkb_ms:>12.1f}{wkb_ms:>9.1f}{row_wkb_ms / wkb_ms:>8.1f}x{legacy:>12.2f}{buffers:>9.2f}")
+
+        wkb = wkb_bytes(geometries)
+        same = list(wkb) == [geom.wkb for geom in geometries]
+        same &= bool(shapely.equals_exact(shapely.from_wkb(wkb), geometries).all())
+        failures += 0 if same else 1
+    print("check:", "OK" if failures == 0 else f"{failures} datasets differ")
+    return failures
+
+
+# Map pages, named as twinning.timing records them (their file names)
+MAP_PAGES = [
+    "Emissions comparison",
+    "Remote workers comparison",
+    "On-site workers comparison",
+    "Car passengers comparison",
+    "Transit passengers comparison",
+]
+
+
+def bench_interactions(repeat):
+    """
+    Move the remote-working slider of every map page (both modes) `repeat`
+    times with streamlit's AppTest and compare the recorded server times
+    (twinning.timing): a full run of the current page, what a move would
+    cost if the maps were not a fragment, against a run of the map
+    fragment, what a move costs. Both columns measure the current page, not
+    the page before the fragment. AppTest always runs the whole script, so the
+    fragment's time is its body's; a live fragment rerun also skips sending
+    everything else.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    from twinning.datasets import ROOT
+    from twinning.pagemaps import PAGE_MAPS
+
+    print(f"{'page / mode':<44}{'full page (new) ms':>20}{'fragment ms':>13}{'ratio':>9}")
+    for page in MAP_PAGES:
+        missing = [m.path for m in PAGE_MAPS if m.page == page and not (ROOT / m.path).exists()]
+        if missing:
+            print(f"{page:<44}skipped: {missing[0]} not in this checkout")
+            continue
+        for mode in ("S3_S2", "S2_S1"):
+            app = AppTest.from_file(str(ROOT / "Main_page.py"), default_timeout=120)
+            app.run()
+            app.switch_page(f"pages/{page}.py")
+            app.session_state[mode_key(page)] = mode
+            app.run()
+            slider = app.slider[0]
+            values = np.linspace(slider.min, slider.max, repeat + 2)[1:-1]
+            timing.clear()
+            for value in values:
+                app.slider[0].set_value(round(float(value), 1))
+                app.run()
+            runs = timing.timings()
+            page_ms, fragment_ms = runs[page, "page"].median_ms, runs[page, "fragment"].median_ms
+            print(f"{page + ' / ' + mode:<44}{page_ms:>20.1f}{fragment_ms:>13.1f}{page_ms / fragment_ms:>8.1f}x")
+
+
+def bench_restart(repeat, k=7):
+    """
+    What a new process pays for everything a map page derives from a
+    dataset (dataset, map geometry and raster, natural-breaks thresholds, a
+    step matrix), with the disk cache empty and filled. The in-memory caches
+    are cleared before each run, as by a restart. Uses a throwaway cache
+    directory; compiled grid datasets are memory-mapped and not cached again.
+    """
+    import streamlit as st
+
+    from twinning.datasets import DISK_CACHE
+    from twinning.prefetch import warm
+    from twinning.scenarios import step_matrix
+    from twinning.schemes import scheme_thresholds
+    from twinning.tiles import TRAFFIC_DIR
+
+    def artifacts(path):
+        st.cache_resource.clear()
+        warm(path)
+        thresholds = scheme_thresholds(path, "absolute_change", "natural_breaks", k)
+        step_matrix(path, "absolute_change", S3_S2, thresholds)
+
+    def cold(path):
+        DISK_CACHE.clear()
+        artifacts(path)
+
+    print(f"{'dataset':<48}{'empty ms':>10}{'filled ms':>11}{'speedup':>9}{'MB on disk':>12}")
+    directory = DISK_CACHE.directory
+    with tempfile.TemporaryDirectory() as tmp:
+        DISK_CACHE.directory = Path(tmp)
+        try:
+            for path in sorted(GRID_DIR.glob("*.gpkg")) + sorted(TRAFFIC_DIR.glob("*.gpkg")):
+                cold_ms = _median_ms(lambda: cold(str(path)), repeat)
+                filled_ms = _median_ms(lambda: artifacts(str(path)), repeat)
+                size = sum(size for _, size in DISK_CACHE.usage().values()) / 2**20
+                print(f"{path.stem:<48}{cold_ms:>10.1f}{filled_ms:>11.1f}{cold_ms / filled_ms:>8.1f}x{size:>12.1f}")
+        finally:
+            DISK_CACHE.clear()
+            DISK_CACHE.directory = directory
+            DISK_CACHE.evict()   # rescans the real directory's size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m twinning.bench", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (default: %(default)s)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("startup", help="dataset load time, original GeoPackage load vs attribute-only vs compiled")
+    sub.add_parser("classify", help="colour classification time, per-row vs vectorised")
+    sub.add_parser("steps", help="slider move cost, recompute vs precomputed step matrices")
+    sub.add_parser("schemes", help="classification scheme run times")
+    sub.add_parser("payloads", help="step payload cache hit rate under concurrent sessions")
+    sub.add_parser("geometry", help="geometry encoding time, per-row vs vectorised")
+    sub.add_parser("interactions", help="server time of a slider move, full page (new) vs map fragment")
+    sub.add_parser("restart", help="artifact build time after a restart, empty vs filled disk cache")
+    args = parser.parse_args(argv)
+
+    if args.command == "startup":
+        bench_startup(args.repeat)
+    elif args.command == "classify":
+        bench_classify(args.repeat)
+    elif args.command == "steps":
+        sys.exit(1 if bench_steps(args.repeat) else 0)
+    elif args.command == "schemes":
+        bench_schemes(args.repeat)
+    elif args.command == "payloads":
+        sys.exit(1 if bench_payloads(args.repeat) else 0)
+    elif args.command == "geometry":
+        sys.exit(1 if bench_geometry(args.repeat) else 0)
+    elif args.command == "interactions":
+        bench_interactions(args.repeat)
+    elif args.command == "restart":
+        bench_restart(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# twinning/build.py
+"""
+Offline build step: compile the grid GeoPackages into memory-mappable Arrow files.
+
+    python -m twinning.build                     # every file in Datasets/Grid maps
+    python -m twinning.build path/to/file.gpkg   # only the given files
+
+Grid datasets are reduced to (ykr_id, absolute_change, percentage_change);
+the set of cells goes once into a shared `ykr_grid.arrow` table keyed by YKR
+id (polygons are rebuilt from the ids, see twinning.grid). Other datasets
+keep their attribute columns plus the geometry as WKB (twinning.encoding).
+Every file carries per-column quantiles (levels 0.00 ... 1.00) for the
+metric columns. The app picks these files up automatically and falls back
+to the GeoPackage when a compiled copy is missing or out of date.
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from twinning.datasets import (
+    COMPILED_DIR,
+    COMPILED_FORMAT,
+    METRIC_COLUMNS,
+    ROOT,
+    compiled_path,
+    file_digest,
+    read_dataset,
+    relative_path,
+)
+from twinning.encoding import wkb_bytes
+from twinning.grid import GRID_FILE, YkrGrid, read_grid, write_grid
+
+GRID_DIR = ROOT / "Datasets" / "Grid maps"
+
+# Quantile levels stored for every metric column: 0.00, 0.01, ..., 1.00.
+# i / 100 gives exactly the same floats as the literals used on the pages.
+QUANTILE_LEVELS = [i / 100 for i in range(101)]
+
+
+def _to_arrow(values: np.ndarray) -> pa.Array:
+    if values.dtype != object:
+        return pa.array(values)
+    return pa.array([None if pd.isna(v) else str(v) for v in values], type=pa.string())
+
+
+def _write_table(table, target):
+    tmp = target.with_suffix(".arrow.tmp")
+    # Uncompressed IPC so the file can be memory-mapped without decoding
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, target)
+
+
+def _compiled_table(ds, path) -> pa.Table:
+    if "ykr_id" in ds:
+        # Geometry lives in the shared grid table
+        arrays = {name: pa.array(ds[name]) for name in ("ykr_id",) + METRIC_COLUMNS}
+    else:
+        arrays = {name: _to_arrow(ds[name]) for name in ds.columns}
+        arrays["geometry_wkb"] = pa.array(wkb_bytes(ds.geometry), type=pa.binary())
+
+    # pandas quantiles, so thresholds match what the pages compute themselves
+    # (inf - inf between infinite percentage changes is expected)
+    with np.errstate(invalid="ignore"):
+        quantiles = {
+            name: pd.Series(ds[name]).quantile(QUANTILE_LEVELS).tolist()
+            for name in METRIC_COLUMNS
+            if name in ds
+        }
+    meta = {
+        "format": COMPILED_FORMAT,
+        "source": relative_path(path),
+        "source_sha1": file_digest(path),
+        "crs": ds.crs.to_string(),
+        "rows": len(ds),
+        "quantile_levels": QUANTILE_LEVELS,
+        "quantiles": quantiles,
+    }
+    if "ykr_id" in ds:
+        meta["grid"] = GRID_FILE
+    return pa.table(arrays).replace_schema_metadata({"twinning": json.dumps(meta)})
+
+
+def compile_datasets(paths, out_dir=COMPILED_DIR) -> list:
+    """Compile GeoPackages (and update the shared grid table); returns the written files."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    datasets = [(path, read_dataset(path)) for path in paths]
+
+    grid_path = out_dir / GRID_FILE
+    grid = read_grid(grid_path) if grid_path.exists() else YkrGrid.empty()
+    cells = len(grid)
+    for _, ds in datasets:
+        if "ykr_id" in ds:
+            grid = grid.merge(ds["ykr_id"])
+    if len(grid) != cells or not grid_path.exists():
+        write_grid(grid, grid_path)
+
+    targets = []
+    for path, ds in datasets:
+        target = out_dir / compiled_path(path).name
+        _write_table(_compiled_table(ds, path), target)
+        targets.append(target)
+    return targets
+
+
+def compile_dataset(path, out_dir=COMPILED_DIR) -> Path:
+    """Compile one GeoPackage and return the path of the written Arrow file."""
+    return compile_datasets([path], out_dir)[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m twinning.build", description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="*", help="GeoPackages to compile (default: all grid maps)")
+    parser.add_argument("--out", default=str(COMPILED_DIR), help="output directory (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    paths = args.paths or sorted(GRID_DIR.glob("*.gpkg"))
+    for path, target in zip(paths, compile_datasets(paths, args.out)):
+        print(f"{relative_path(path)} -> {relative_path(target)} ({target.stat().st_size / 1e6:.2f} MB)")
+    grid_path = Path(args.out) / GRID_FILE
+    if grid_path.exists():
+        print(f"shared YKR grid -> {relative_path(grid_path)} ({grid_path.stat().st_size / 1e6:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# twinning/classify.py
+"""
+Vectorised threshold classification shared by all map pages.
+
+Replaces the per-page `get_color` if/elif ladders applied row by row. Values
+are turned into uint8 class codes with one `np.searchsorted`. The maps are
+sent those codes, not colours: a `ClassPalette` holds the colour and legend
+label of every code, and feeds both the map component and the legend, so
+data, map and legend cannot disagree.
+
+Semantics (identical to the old `get_color` on every page):
+    * class 0 is `value <= thresholds[0]`, class i is
+      `thresholds[i-1] < value <= thresholds[i]`
+    * values above the last threshold share the top class
+      (there are as many classes as thresholds, i.e. palette colours)
+    * `reverse=True` only flips the palette: class 0 gets the last colour
+    * NaN gets NO_DATA (drawn with the no-data colour) unless `nan_as_max`
+      is set, in which case it falls in the top class as it always did on
+      the grid pages (NaN fails every `<=` test)
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+NO_DATA = 255
+NO_DATA_COLOUR = "#888888"
+
+
+def classify(values, thresholds, n_classes=None, nan_as_max=False) -> np.ndarray:
+    """uint8 class code per value (see module docstring for the rules)."""
+    values = np.asarray(values, dtype=float)
+    thresholds = np.asarray(thresholds, dtype=float)
+    if n_classes is None:
+        n_classes = len(thresholds)
+
+    codes = np.searchsorted(thresholds, values, side="left")
+    np.minimum(codes, n_classes - 1, out=codes)
+    codes = codes.astype(np.uint8)
+
+    nan = np.isnan(values)
+    if nan.any():
+        codes[nan] = n_classes - 1 if nan_as_max else NO_DATA
+    return codes
+
+
+def palette_for(palette, reverse=False) -> list:
+    """Colour of each class code, in code order."""
+    return list(reversed(palette)) if reverse else list(palette)
+
+
+def colours(codes, palette, reverse=False, no_data=NO_DATA_COLOUR) -> np.ndarray:
+    """Hex colour per class code (object array)."""
+    lut = np.full(256, no_data, dtype=object)
+    lut[: len(palette)] = palette_for(palette, reverse)
+    return lut[np.asarray(codes, dtype=np.uint8)]
+
+
+class ClassPalette(NamedTuple):
+    """Colour and legend label of every class code."""
+
+    colours: tuple   # colours[code]
+    labels: tuple    # labels[code]
+    no_data: str = NO_DATA_COLOUR
+
+    @classmethod
+    def of(cls, palette, labels, reverse=False, no_data=NO_DATA_COLOUR) -> "ClassPalette":
+        """Classes of `palette` (flipped if `reverse`), labelled in class order."""
+        return cls(tuple(palette_for(palette, reverse)), tuple(labels), no_data)
+
+    def legend(self):
+        """(colour, label) pairs, in class order."""
+        return list(zip(self.colours, self.labels))
+
+    def hex(self, codes) -> np.ndarray:
+        """Hex colour per class code."""
+        return colours(codes, self.colours, no_data=self.no_data)
@@ -0,0 +1,33 @@
+# twinning/components.py
+"""
+Components that only serve a directory of built files through streamlit's
+component file handler: the vector tiles (twinning.tiles) and the
+self-hosted basemap (twinning.basemap). They are never rendered.
+
+Both directories exist only once `python -m twinning.tiles` or
+`python -m twinning.basemap` has run, and streamlit refuses to register a
+missing component directory (`declare_component` from a running script
+raises). So these are declared without being registered, and `serve`
+registers one the first time a page needs its files, also when they were
+built after the server started. Importing the modules writes nothing.
+"""
+import os
+
+from streamlit.components.v1.custom_component import CustomComponent
+from streamlit.runtime import Runtime
+
+
+def directory_component(module: str, name: str, path) -> CustomComponent:
+    """Component `module.name` over `path`, named as `declare_component` in `module` would."""
+    return CustomComponent(name=f"{module}.{name}", path=str(path), module_name=module)
+
+
+def serve(component: CustomComponent) -> bool:
+    """Register `component` with the running server if its directory exists; whether it does."""
+    if not os.path.isdir(component.abspath):
+        return False
+    if Runtime.exists():
+        registry = Runtime.instance().component_registry
+        if registry.get_component_path(component.name) is None:
+            registry.register_component(component)
+    return True
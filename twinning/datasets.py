@@ -0,0 +1,260 @@
+# twinning/datasets.py
+"""
+Process-wide, read-only store for the map datasets.
+
+Every map page used to define its own `@st.cache_data load_dataset`, which
+un-pickles a full GeoDataFrame copy on each rerun and caches the same file
+again under every page. Here each file is loaded once per process
+(`st.cache_resource`) and every session gets the same immutable columns.
+
+If `python -m twinning.build` has compiled a dataset into `Datasets/compiled/`,
+the compiled Arrow file is memory-mapped instead of parsing the GeoPackage.
+Otherwise the parsed dataset is kept in the disk cache (`DISK_CACHE`, see
+twinning.diskcache), so only the first process after a change parses it.
+"""
+import hashlib
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+import streamlit as st
+
+from twinning.diskcache import DiskCache
+from twinning.grid import cell_geometry, read_grid, take_geometry, ykr_id_column
+
+ROOT = Path(__file__).resolve().parent.parent
+COMPILED_DIR = ROOT / "Datasets" / "compiled"
+
+# Columns every map page reads as numbers (some traffic files store them as text)
+METRIC_COLUMNS = ("absolute_change", "percentage_change")
+
+# Bump when the compiled file layout changes; older files are then ignored
+COMPILED_FORMAT = 3
+
+# Size cap of the disk cache in MB (TWINNING_DISK_CACHE_MB; 0 turns it off)
+DISK_CACHE_MB = 1024
+
+
+def _read_only(values: np.ndarray) -> np.ndarray:
+    """Return a view of `values` that cannot be written to."""
+    view = values.view()
+    view.flags.writeable = False
+    return view
+
+
+class Dataset:
+    """
+    Immutable, shared view over one map dataset (already in WGS84).
+
+    Columns are handed out as read-only numpy arrays, so a page can never
+    modify data that other sessions are looking at. Derived values must be
+    computed into new arrays.
+    """
+
+    __slots__ = ("path", "crs", "geometry", "meta", "_columns", "_quantiles")
+
+    def __init__(self, path, crs, geometry, columns, meta=None):
+        self.path = path
+        self.crs = crs
+        self.meta = meta or {}
+        self.geometry = geometry
+        self._columns = {name: _read_only(values) for name, values in columns.items()}
+        self._quantiles = {}
+
+    def __len__(self):
+        return len(self.geometry)
+
+    def __reduce__(self):
+        # Unpickled columns are made read-only again by __init__
+        return Dataset, (self.path, self.crs, self.geometry, self._columns, self.meta)
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, name) -> np.ndarray:
+        return self._columns[name]
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def quantiles(self, name, levels) -> list:
+        """
+        Quantiles of a column at `levels` (same values as pandas' quantile).
+        Read from the table stored by the build step when it has all the
+        levels, otherwise computed once and kept with the dataset.
+        """
+        key = (name, tuple(levels))
+        if key not in self._quantiles:
+            stored = self.meta.get("quantiles", {}).get(name)
+            stored_levels = self.meta.get("quantile_levels", [])
+            if stored is not None and all(level in stored_levels for level in levels):
+                values = [stored[stored_levels.index(level)] for level in levels]
+            else:
+                # inf - inf between infinite percentage changes is expected
+                with np.errstate(invalid="ignore"):
+                    values = pd.Series(self[name]).quantile(list(levels)).tolist()
+            self._quantiles[key] = values
+        return list(self._quantiles[key])
+
+
+def _columns(frame: pd.DataFrame) -> dict:
+    """The attribute columns of `frame` as numpy arrays (metrics as float, text as object)."""
+    columns = {}
+    for name in frame.columns:
+        if isinstance(frame, gpd.GeoDataFrame) and name == frame.geometry.name:
+            continue
+        if name in METRIC_COLUMNS:
+            columns[name] = frame[name].astype(float).to_numpy()
+        elif pd.api.types.is_numeric_dtype(frame[name]):
+            columns[name] = frame[name].to_numpy()
+        else:
+            columns[name] = frame[name].to_numpy(dtype=object)
+    return columns
+
+
+def read_dataset(path: str) -> Dataset:
+    """
+    Load a GeoPackage and reproject to WGS84 if needed.
+
+    Grid datasets skip geometry I/O altogether: only the attributes are read
+    (through Arrow) and the cell polygons are rebuilt from the YKR ids, in
+    WGS84 directly, so there is nothing to reproject.
+    """
+    attributes = gpd.read_file(path, ignore_geometry=True, use_arrow=True)
+    id_column = ykr_id_column(attributes.columns)
+
+    if id_column is not None:
+        columns = _columns(attributes)
+        # Grid datasets: expose the cell id under one name, whatever the file calls it
+        columns["ykr_id"] = columns[id_column].astype(np.int64)
+        polygons = cell_geometry(columns["ykr_id"], 4326).polygons
+        geometry = gpd.array.from_shapely(polygons, crs="EPSG:4326")
+        return Dataset(path, geometry.crs, geometry, columns)
+
+    gdf = gpd.read_file(path, use_arrow=True)
+    # Ensure WGS84 for the maps
+    if gdf.crs and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(4326)
+    return Dataset(path, gdf.crs, gdf.geometry.values, _columns(gdf))
+
+
+def file_digest(path) -> str:
+    """SHA-1 of a file's contents (used to tell whether a compiled copy is stale)."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _digest_at(path: str, mtime_ns: int) -> str:
+    return file_digest(path)
+
+
+def dataset_version(path) -> str:
+    """
+    Content hash of a dataset file, for cache keys: hashed again only when
+    the file's modification time changes.
+    """
+    return _digest_at(str(path), os.stat(path).st_mtime_ns)
+
+
+def relative_path(path) -> str:
+    """Path as the pages spell it (relative to the repository root)."""
+    try:
+        return Path(path).resolve().relative_to(ROOT).as_posix()
+    except ValueError:
+        return str(path)
+
+
+def compiled_path(path) -> Path:
+    """Where `python -m twinning.build` writes the compiled copy of `path`."""
+    return COMPILED_DIR / (Path(path).stem + ".arrow")
+
+
+# Derived artifacts of the datasets, kept across restarts
+DISK_CACHE = DiskCache(
+    COMPILED_DIR / "cache",
+    max_size=int(os.environ.get("TWINNING_DISK_CACHE_MB", DISK_CACHE_MB)) * 2**20,
+    version=dataset_version,
+)
+
+
+@st.cache_resource(show_spinner=False)
+def _shared_grid(path: str, mtime_ns: int):
+    """YKR grid table, read once per process (and again if the file is rebuilt)."""
+    return read_grid(path)
+
+
+def read_compiled(path) -> Dataset:
+    """
+    Memory-map a compiled Arrow file. Numeric columns are zero-copy views
+    into the mapped file; only text columns are materialised.
+
+    Grid datasets store only `ykr_id` and the metrics; their geometry comes
+    from the shared YKR grid table, so all six share the same cell objects.
+    """
+    # The mapping stays open for as long as the table's buffers are alive
+    table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+    meta = json.loads(table.schema.metadata[b"twinning"])
+
+    columns = {}
+    for name in table.column_names:
+        if name == "geometry_wkb":
+            continue
+        column = table.column(name).combine_chunks()
+        if pa.types.is_floating(column.type) or pa.types.is_integer(column.type):
+            columns[name] = column.to_numpy(zero_copy_only=column.null_count == 0)
+        else:
+            columns[name] = np.array(column.to_pylist(), dtype=object)
+
+    if "grid" in meta:
+        grid_path = Path(path).parent / meta["grid"]
+        grid = _shared_grid(str(grid_path), grid_path.stat().st_mtime_ns)
+        geometry = take_geometry(grid, columns["ykr_id"], crs=meta["crs"])
+    else:
+        wkb = table.column("geometry_wkb").combine_chunks().to_numpy(zero_copy_only=False)
+        geometry = gpd.array.from_shapely(shapely.from_wkb(wkb), crs=meta["crs"])
+    return Dataset(meta["source"], geometry.crs, geometry, columns, meta)
+
+
+def find_compiled(path, version=None):
+    """Compiled copy of `path` if one exists and was built from the same file (its `version`)."""
+    target = compiled_path(path)
+    if not target.exists():
+        return None
+    with pa.memory_map(str(target)) as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    meta = json.loads(metadata.get(b"twinning", b"{}"))
+    if meta.get("format") != COMPILED_FORMAT or meta.get("source_sha1") != (version or dataset_version(path)):
+        return None
+    return target
+
+
+@st.cache_resource(show_spinner="Loading dataset...", max_entries=32)
+def _load_dataset(path: str, version: str) -> Dataset:
+    target = find_compiled(path, version)
+    if target is not None:
+        try:
+            return read_compiled(target)
+        except (KeyError, OSError):
+            pass  # grid table missing or older than the metric file
+    return DISK_CACHE.get("dataset", path, version, (), lambda: read_dataset(path))
+
+
+def load_dataset(path: str, version: str = None) -> Dataset:
+    """
+    Shared dataset for `path`, loaded once per server process and file
+    version (`dataset_version`, the current one by default). Caches of
+    derived values take the version too, so a rewritten file is never
+    served from what was derived from the old one.
+    """
+    return _load_dataset(str(path), version or dataset_version(path))
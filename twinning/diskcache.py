@@ -0,0 +1,230 @@
+# twinning/diskcache.py
+"""
+Derived artifacts on disk, kept across restarts and redeploys.
+
+The in-memory caches (`st.cache_resource`) start empty in every new process,
+so each restart parsed the GeoPackages and encoded the geometry again.
+`DiskCache.get(kind, path, version, params, build)` keeps what `build()`
+returns in a pickle under `Datasets/compiled/cache/<kind>/`, addressed by a
+hash of
+
+    the dataset's content       `version`, the file's SHA-1 the value was built from
+    the code version            the twinning sources and library versions
+    kind and params             what was derived, and how
+
+so a changed file in `Datasets/` or a changed module is simply a new key:
+nothing stale is ever read, and old entries age out. A value is not stored
+if the file changed while it was built (`version(path)` no longer matches). The directory is
+capped at `max_size` bytes; reading an entry marks it used (its mtime), and
+the least recently used entries are deleted first. Values come back with
+their numpy arrays read-only, like the shared in-memory copies.
+
+What is cached (see DISK_CACHE in twinning.datasets): loaded datasets
+without a compiled copy, map geometry, scheme thresholds and step
+matrices (the values and class codes of every slider step).
+
+    python -m twinning.diskcache            # entries and size per kind
+    python -m twinning.diskcache --clear
+"""
+import argparse
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+SUFFIX = ".pkl"
+
+# Libraries whose objects end up in the pickles
+_LIBRARIES = ("numpy", "pandas", "shapely", "geopandas", "pyproj", "pyarrow")
+
+
+def code_version(package_dir=Path(__file__).resolve().parent) -> str:
+    """Hash of the package's sources, the Python version and the libraries' versions."""
+    digest = hashlib.sha1(sys.version.encode())
+    for name in _LIBRARIES:
+        module = sys.modules.get(name) or __import__(name)
+        digest.update(f"{name} {module.__version__}".encode())
+    for source in sorted(package_dir.glob("*.py")):
+        digest.update(source.name.encode())
+        digest.update(source.read_bytes())
+    return digest.hexdigest()
+
+
+def _freeze(value):
+    """Make the numpy arrays in `value` (and in its tuples, lists, dicts) read-only."""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            _freeze(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _freeze(item)
+    return value
+
+
+class DiskCacheStats(NamedTuple):
+    hits: int
+    misses: int
+    writes: int
+    evicted: int
+    errors: int        # unreadable or unwritable entries (served by building)
+    size: int          # bytes on disk, as of the last scan plus writes since
+    max_size: int
+
+
+class DiskCache:
+    def __init__(self, directory, max_size: int, version, code=None):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.version = version
+        self.code = code or code_version()
+        self.enabled = max_size > 0
+        self._size = None                 # scanned on first write
+        self._counts = dict(hits=0, misses=0, writes=0, evicted=0, errors=0)
+        self._lock = threading.Lock()
+
+    def entry(self, kind: str, path, version: str, params=()) -> Path:
+        """File of one artifact: `kind` derived from version `version` of the dataset at `path`, with `params`."""
+        key = repr((self.code, kind, str(path), version, params))
+        return self.directory / kind / (hashlib.sha1(key.encode()).hexdigest() + SUFFIX)
+
+    def get(self, kind: str, path, version: str, params, build):
+        """
+        The stored artifact, or `build()`'s result (built from version
+        `version` of the dataset), stored for the next process.
+        """
+        if not self.enabled:
+            return build()
+        entry = self.entry(kind, path, version, params)
+        try:
+            with open(entry, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            _logger.warning("unreadable cache entry %s, rebuilding", entry, exc_info=True)
+            self._count("errors")
+        else:
+            self._touch(entry)
+            self._count("hits")
+            _logger.debug("disk cache hit: %s %s", kind, Path(path).stem)
+            return _freeze(value)
+
+        self._count("misses")
+        value = build()
+        if self.version(path) == version:
+            self._store(entry, value)
+        else:
+            _logger.info("%s changed while building %s, not stored", path, kind)
+        return value
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    @staticmethod
+    def _touch(entry):
+        try:
+            os.utime(entry)
+        except OSError:
+            pass  # evicted meanwhile, or a read-only cache
+
+    def _store(self, entry, value):
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = tmp.stat().st_size
+            os.replace(tmp, entry)
+        except Exception:
+            _logger.warning("could not write cache entry %s", entry, exc_info=True)
+            tmp.unlink(missing_ok=True)
+            self._count("errors")
+            return
+        with self._lock:
+            self._counts["writes"] += 1
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += size
+            over = self._size > self.max_size
+        if over:
+            self.evict()
+
+    def _entries(self):
+        """(path, size, mtime) of every entry on disk."""
+        entries = []
+        for entry in self.directory.glob(f"*/*{SUFFIX}"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((entry, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def evict(self, max_size=None):
+        """Delete least recently used entries until the cache fits in `max_size` (default: the cap)."""
+        max_size = self.max_size if max_size is None else max_size
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            size = sum(e[1] for e in entries)
+            evicted = 0
+            for entry, entry_size, _ in entries:
+                if size <= max_size:
+                    break
+                entry.unlink(missing_ok=True)
+                size -= entry_size
+                evicted += 1
+            self._size = size
+            self._counts["evicted"] += evicted
+        if evicted:
+            _logger.info("disk cache: evicted %d entries, %.1f MB left", evicted, size / 2**20)
+        return evicted
+
+    def usage(self) -> dict:
+        """{kind: (entries, bytes)} on disk."""
+        usage = defaultdict(lambda: [0, 0])
+        for entry, size, _ in self._entries():
+            usage[entry.parent.name][0] += 1
+            usage[entry.parent.name][1] += size
+        return {kind: tuple(counts) for kind, counts in sorted(usage.items())}
+
+    def clear(self):
+        self.evict(max_size=0)
+
+    def stats(self) -> DiskCacheStats:
+        with self._lock:
+            size = self._size if self._size is not None else sum(e[1] for e in self._entries())
+            return DiskCacheStats(size=size, max_size=self.max_size, **self._counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m twinning.diskcache", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clear", action="store_true", help="delete every entry")
+    args = parser.parse_args(argv)
+
+    from twinning.datasets import DISK_CACHE
+
+    if args.clear:
+        DISK_CACHE.clear()
+    print(f"{DISK_CACHE.directory}  (cap {DISK_CACHE.max_size / 2**20:.0f} MB, code {DISK_CACHE.code[:12]})")
+    usage = DISK_CACHE.usage()
+    for kind, (entries, size) in usage.items():
+        print(f"  {kind:<16}{entries:>6} entries{size / 2**20:>10.1f} MB")
+    total = sum(size for _, size in usage.values())
+    print(f"  {'total':<16}{sum(n for n, _ in usage.values()):>6} entries{total / 2**20:>10.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+# twinning/encoding.py
+"""
+Geometry serialisation, vectorised with shapely 2.
+
+Datasets used to carry a GeoJSON string per feature, built at load time
+with `json.dumps(geom.__geo_interface__)` row by row (for kepler.gl) and
+stored again in every compiled file. The maps now get flat vertex buffers
+(twinning.mapview) or vector tiles (twinning.tiles), so the only encoding
+left is the WKB the build step stores, one GEOS call for the whole column:
+
+    wkb_bytes(geometries, precision)   WKB per feature
+
+`precision` is the number of decimals kept in the coordinates (None keeps
+them all). `python -m twinning.bench geometry` compares this with the
+per-row encoding.
+"""
+import numpy as np
+import shapely
+
+
+def round_coordinates(geometries, precision=None) -> np.ndarray:
+    """`geometries` with coordinates rounded to `precision` decimals (None: unchanged)."""
+    geometries = np.asarray(geometries)
+    if precision is None:
+        return geometries
+    return shapely.transform(geometries, lambda coords: np.round(coords, precision))
+
+
+def wkb_bytes(geometries, precision=None) -> np.ndarray:
+    """WKB per geometry (object array of bytes); lossless unless `precision` is given."""
+    return shapely.to_wkb(round_coordinates(geometries, precision))
@@ -0,0 +1,511 @@
+// twinning/frontend/mapview/main.js
+//
+// Map component (see twinning/mapview.py). The geometry arrives once and is
+// shared by every view; a new slider step only brings a value and a class
+// code per feature and view, or, in client mode, nothing at all: the
+// component's own slider recomputes the views with scenario.js. Reruns that
+// change only the style (opacity, colours, line width) restyle the layers
+// already drawn. A grid can also come as an image (raster mode): one pixel
+// per cell, painted here from the class codes. With vector tiles the browser
+// fetches the features in view; they carry only their row, the id that
+// looks up their value and code. The basemap is CARTO's or the app's own
+// copy (twinning/basemap.py), falling back to CARTO's if that fails.
+// Speaks the Streamlit component protocol over postMessage directly, so
+// there is no build step.
+"use strict";
+
+// ============================================================
+// --- STREAMLIT PROTOCOL ---
+// ============================================================
+function sendMessage(type, data) {
+  window.parent.postMessage(Object.assign({ isStreamlitMessage: true, type: type }, data), "*");
+}
+
+function setFrameHeight(height) {
+  sendMessage("streamlit:setFrameHeight", { height: height });
+}
+
+var reported;
+
+// Report the component value, only when it changes (every report is a rerun)
+function report(value) {
+  var text = JSON.stringify(value);
+  if (text !== reported) {
+    reported = text;
+    sendMessage("streamlit:setComponentValue", { value: value, dataType: "json" });
+  }
+}
+
+// Typed array over a copy of a bytes arg (Streamlit hands out views into a larger buffer)
+function typed(bytes, Type) {
+  return new Type(bytes.slice().buffer);
+}
+
+// ============================================================
+// --- GEOMETRY & STYLE ---
+// ============================================================
+var geometry = null;   // {key, kind, coords, starts, features, data}, or a raster / tile set
+var panes = [];        // one per view: {map, overlay, style, base, current}
+var options = null;    // {opacity, lineWidth} from the last render
+
+function loadGeometry(args) {
+  if (args.kind === "raster") {
+    loadRaster(args);
+    return;
+  }
+  if (args.kind === "tiles") {
+    geometry = { key: args.geometry_key, kind: "tiles", tiles: args.tiles };
+    return;
+  }
+  var starts = typed(args.starts, Uint32Array);
+  geometry = {
+    key: args.geometry_key,
+    kind: args.kind,
+    coords: typed(args.coords, Float32Array),
+    starts: starts,
+    features: args.features ? typed(args.features, Uint32Array) : null,
+    // One object per part is never built: deck.gl iterates indices
+    data: { length: starts.length - 1 },
+  };
+}
+
+// The image is placed in blocks, each stretched between its own corners (twinning.grid.CellRaster)
+function loadRaster(args) {
+  var layout = args.raster;
+  var pixels = typed(args.pixels, Uint32Array);
+  var pixelFeature = new Int32Array(layout.width * layout.height).fill(-1);
+  for (var i = 0; i < pixels.length; i++) pixelFeature[pixels[i]] = i;
+
+  var corners = typed(args.coords, Float32Array);
+  var columns = layout.edges_x.length;
+  var corner = function (iy, ix) {
+    var k = 2 * (iy * columns + ix);
+    return [corners[k], corners[k + 1]];
+  };
+  var blocks = [];
+  for (var iy = 0; iy + 1 < layout.edges_y.length; iy++) {
+    for (var ix = 0; ix + 1 < columns; ix++) {
+      blocks.push({
+        x: layout.edges_x[ix],
+        y: layout.edges_y[iy],
+        width: layout.edges_x[ix + 1] - layout.edges_x[ix],
+        height: layout.edges_y[iy + 1] - layout.edges_y[iy],
+        // bottom-left, top-left, top-right, bottom-right
+        bounds: [corner(iy + 1, ix), corner(iy, ix), corner(iy, ix + 1), corner(iy + 1, ix + 1)],
+      });
+    }
+  }
+  geometry = {
+    key: args.geometry_key,
+    kind: "raster",
+    width: layout.width,
+    height: layout.height,
+    pixels: pixels,
+    pixelFeature: pixelFeature,
+    blocks: blocks,
+  };
+}
+
+// Feature a drawn part belongs to
+function featureOf(part) {
+  return geometry.features ? geometry.features[part] : part;
+}
+
+// Feature under the pointer, -1 if none
+function pickedFeature(info) {
+  if (!info.layer) return -1;
+  if (geometry.kind === "tiles") return info.object ? info.object.properties.id : -1;
+  if (geometry.kind !== "raster") return info.index < 0 ? -1 : featureOf(info.index);
+  if (!info.bitmap) return -1;
+  var block = geometry.blocks[Number(info.layer.id.split("-")[1])];
+  var x = Math.min(block.x + info.bitmap.pixel[0], geometry.width - 1);
+  var y = Math.min(block.y + info.bitmap.pixel[1], geometry.height - 1);
+  return geometry.pixelFeature[y * geometry.width + x];
+}
+
+function rgba(hex) {
+  var n = parseInt(hex.slice(1), 16);
+  return [(n >> 16) & 255, (n >> 8) & 255, n & 255, 255];
+}
+
+// Colour of every class code; no-data codes get the no-data colour, or nothing
+function colourTable(colours, noData, hideNoData) {
+  var table = [];
+  for (var code = 0; code < 256; code++) {
+    if (code < colours.length) table.push(rgba(colours[code]));
+    else table.push(hideNoData ? [0, 0, 0, 0] : rgba(noData));
+  }
+  return table;
+}
+
+function formatValue(value, tooltip) {
+  if (!isFinite(value)) return String(value);
+  return (value * tooltip.scale).toFixed(tooltip.decimals) + tooltip.suffix;
+}
+
+// ============================================================
+// --- VIEWS ---
+// ============================================================
+var EMPTY_STYLE = { version: 8, sources: {}, layers: [] };
+var basemaps = {};   // style URL -> promise of the style to use
+
+// Absolute form of a URL in a self-hosted style (twinning/basemap.py), whose
+// sprite, glyphs and tiles are relative to style.json. String concatenation,
+// not URL(): the {z}/{fontstack} placeholders must stay as they are.
+function absoluteUrl(url, base) {
+  if (/^[a-z]+:/i.test(url)) return url;
+  if (url.charAt(0) === "/") return location.origin + url;
+  return base + url;
+}
+
+// A style served by the app, with its URLs made absolute; the remote
+// `fallback` style if it cannot be loaded
+function loadBasemap(url, fallback) {
+  if (!basemaps[url]) {
+    var base = absoluteUrl(url.slice(0, url.lastIndexOf("/") + 1), "");
+    basemaps[url] = fetch(url)
+      .then(function (response) {
+        if (!response.ok) throw new Error(response.status + " " + response.statusText);
+        return response.json();
+      })
+      .then(function (style) {
+        if (typeof style.sprite === "string") style.sprite = absoluteUrl(style.sprite, base);
+        if (style.glyphs) style.glyphs = absoluteUrl(style.glyphs, base);
+        Object.keys(style.sources).forEach(function (name) {
+          var source = style.sources[name];
+          if (source.url) source.url = absoluteUrl(source.url, base);
+          if (source.tiles) {
+            source.tiles = source.tiles.map(function (tile) {
+              return absoluteUrl(tile, base);
+            });
+          }
+        });
+        return style;
+      })
+      .catch(function (error) {
+        console.warn("local basemap " + url + " failed (" + error.message + "), using " + fallback);
+        return fallback;
+      });
+  }
+  return basemaps[url];
+}
+
+var syncing = false;
+
+// Panning or zooming one view moves the others
+function syncFrom(source) {
+  if (syncing) return;
+  syncing = true;
+  panes.forEach(function (pane) {
+    if (pane.map !== source) {
+      pane.map.jumpTo({
+        center: source.getCenter(),
+        zoom: source.getZoom(),
+        bearing: source.getBearing(),
+        pitch: source.getPitch(),
+      });
+    }
+  });
+  syncing = false;
+}
+
+function createPane(container, args) {
+  var element = document.createElement("div");
+  element.className = "pane";
+  container.appendChild(element);
+
+  var pane = { map: null, overlay: null, style: null, base: null, current: null };
+  var local = args.style.charAt(0) === "/";
+  pane.map = new maplibregl.Map({
+    container: element,
+    style: local ? EMPTY_STYLE : args.style,
+    center: [args.view.longitude, args.view.latitude],
+    zoom: args.view.zoom,
+  });
+  pane.overlay = new deck.MapboxOverlay({
+    layers: [],
+    getTooltip: function (info) {
+      var feature = pane.current ? pickedFeature(info) : -1;
+      if (feature < 0) return null;
+      var tooltip = pane.style.tooltip;
+      return { text: tooltip.title + ": " + formatValue(pane.current.values[feature], tooltip) };
+    },
+  });
+  pane.map.addControl(pane.overlay);
+  if (local) {
+    loadBasemap(args.style, args.style_fallback).then(function (style) {
+      pane.map.setStyle(style);
+    });
+  }
+  pane.map.on("move", function () {
+    syncFrom(pane.map);
+  });
+  return pane;
+}
+
+function createPanes(args) {
+  var container = document.getElementById("maps");
+  panes.forEach(function (pane) {
+    pane.map.remove();
+  });
+  container.innerHTML = "";
+  panes = args.views.map(function () {
+    return createPane(container, args);
+  });
+}
+
+// (Re)build the view's layers; colours are only recomputed when the codes or the colour table changed
+function draw(pane, values, codes) {
+  var current = pane.current;
+  var recolour = !current || current.codes !== codes || current.table !== pane.style.table;
+  pane.current = {
+    values: values,
+    codes: codes,
+    table: pane.style.table,
+    version: current ? current.version + (recolour ? 1 : 0) : 0,
+  };
+  var layers;
+  if (geometry.kind === "raster") layers = rasterLayers(pane);
+  else if (geometry.kind === "tiles") layers = [tileLayer(pane)];
+  else layers = [vectorLayer(pane)];
+  pane.overlay.setProps({ layers: layers });
+}
+
+function vectorLayer(pane) {
+  var coords = geometry.coords;
+  var starts = geometry.starts;
+  var table = pane.style.table;
+  var codes = pane.current.codes;
+  var vertices = function (_, info) {
+    return coords.subarray(2 * starts[info.index], 2 * starts[info.index + 1]);
+  };
+  var colour = function (_, info) {
+    return table[codes[featureOf(info.index)]];
+  };
+  var common = {
+    id: "features",
+    data: geometry.data,
+    positionFormat: "XY",
+    opacity: options.opacity,
+    pickable: true,
+  };
+
+  if (geometry.kind === "line") {
+    return new deck.PathLayer(Object.assign(common, {
+      getPath: vertices,
+      getColor: colour,
+      getWidth: options.lineWidth,
+      widthUnits: "pixels",
+      updateTriggers: { getPath: geometry.key, getColor: pane.current.version },
+    }));
+  }
+  return new deck.SolidPolygonLayer(Object.assign(common, {
+    getPolygon: vertices,
+    getFillColor: colour,
+    updateTriggers: { getPolygon: geometry.key, getFillColor: pane.current.version },
+  }));
+}
+
+// Features come from the tiles in view; colours are joined by the row id they carry
+function tileLayer(pane) {
+  var tiles = geometry.tiles;
+  var table = pane.style.table;
+  var codes = pane.current.codes;
+  var colour = function (feature) {
+    return table[codes[feature.properties.id]];
+  };
+  var version = pane.current.version;
+  return new deck.MVTLayer({
+    id: "tiles",
+    data: tiles.url,
+    minZoom: tiles.min_zoom,
+    maxZoom: tiles.max_zoom,
+    extent: tiles.bounds,
+    binary: false,
+    filled: tiles.kind === "polygon",
+    stroked: tiles.kind === "line",
+    getFillColor: colour,
+    getLineColor: colour,
+    getLineWidth: options.lineWidth,
+    lineWidthUnits: "pixels",
+    opacity: options.opacity,
+    pickable: true,
+    updateTriggers: { getFillColor: version, getLineColor: version },
+  });
+}
+
+// Paint one pixel per cell, then cut the image into its blocks
+function paintRaster(codes, table) {
+  var image = new ImageData(geometry.width, geometry.height);   // transparent
+  var data = image.data;
+  var pixels = geometry.pixels;
+  for (var i = 0; i < pixels.length; i++) {
+    var colour = table[codes[i]];
+    var k = 4 * pixels[i];
+    data[k] = colour[0];
+    data[k + 1] = colour[1];
+    data[k + 2] = colour[2];
+    data[k + 3] = colour[3];
+  }
+  var full = document.createElement("canvas");
+  full.width = geometry.width;
+  full.height = geometry.height;
+  full.getContext("2d").putImageData(image, 0, 0);
+
+  return geometry.blocks.map(function (block) {
+    var canvas = document.createElement("canvas");
+    canvas.width = block.width;
+    canvas.height = block.height;
+    canvas.getContext("2d").drawImage(full, block.x, block.y, block.width, block.height, 0, 0, block.width, block.height);
+    return canvas;
+  });
+}
+
+var NEAREST = { 10241: 9728, 10240: 9728 };   // GL.TEXTURE_MIN/MAG_FILTER: GL.NEAREST, crisp cells
+
+function rasterLayers(pane) {
+  var current = pane.current;
+  if (!pane.raster || pane.raster.version !== current.version || pane.raster.key !== geometry.key) {
+    pane.raster = { key: geometry.key, version: current.version, images: paintRaster(current.codes, current.table) };
+  }
+  return geometry.blocks.map(function (block, b) {
+    return new deck.BitmapLayer({
+      id: "block-" + b,
+      bounds: block.bounds,
+      image: pane.raster.images[b],
+      textureParameters: NEAREST,
+      opacity: options.opacity,
+      pickable: true,
+    });
+  });
+}
+
+// ============================================================
+// --- CLIENT-SIDE SLIDER ---
+// ============================================================
+var SLIDER_HEIGHT = 44;   // px, as in index.html
+var slider = document.getElementById("slider");
+var sliderInput = document.getElementById("slider-input");
+var sliderLabel = document.getElementById("slider-label");
+var sliderValue = document.getElementById("slider-value");
+var client = null;     // {scenario, steps, dataKey}
+
+function setStep(index) {
+  sliderInput.value = index;
+  var value = client.steps[index];
+  sliderValue.textContent = value.toFixed(1);
+  panes.forEach(function (pane) {
+    var view = pane.style.view;
+    var row = stepRow(pane.base.values, view.scenario, view.thresholds, view.round_to, view.nan_as_max, value);
+    draw(pane, row.values, row.codes);
+  });
+}
+
+sliderInput.addEventListener("input", function () {
+  setStep(Number(sliderInput.value));
+});
+
+function showSlider(show) {
+  var display = show ? "flex" : "none";
+  if (slider.style.display !== display) {
+    slider.style.display = display;
+    panes.forEach(function (pane) {
+      pane.map.resize();
+    });
+  }
+}
+
+function restyle() {
+  panes.forEach(function (pane) {
+    draw(pane, pane.current.values, pane.current.codes);
+  });
+}
+
+function renderClient(args) {
+  // Every view of a component follows the same slider
+  var scenario = args.views[0].scenario;
+  var dataKey = JSON.stringify([
+    args.base_keys,
+    args.views.map(function (view) {
+      return [view.scenario, view.thresholds, view.round_to, view.nan_as_max];
+    }),
+  ]);
+  showSlider(true);
+  sliderLabel.textContent = args.slider_label;
+  if (client && client.dataKey === dataKey) {
+    restyle();   // same steps as before
+    return;
+  }
+
+  var changed = !client || JSON.stringify(client.scenario) !== JSON.stringify(scenario);
+  client = { scenario: scenario, steps: sliderValues(scenario), dataKey: dataKey };
+  sliderInput.max = client.steps.length - 1;
+
+  // Keep the dragged position across reruns (opacity, classification, ...)
+  var index = Number(sliderInput.value);
+  if (changed) index = client.steps.indexOf(args.slider_value);
+  setStep(index < 0 ? 0 : index);
+}
+
+// ============================================================
+// --- RENDER ---
+// ============================================================
+var bases = [];   // {key, values} per view, client mode
+var rows = [];    // {key, values, codes} per view, server mode
+
+function onRender(args) {
+  var clientMode = Boolean(args.base_keys);
+  setFrameHeight(args.height + (clientMode ? SLIDER_HEIGHT : 0));
+  if (args.coords || args.tiles) loadGeometry(args);
+  if (clientMode) {
+    args.base_keys.forEach(function (key, i) {
+      var bytes = args["base_" + i];
+      if (bytes) bases[i] = { key: key, values: typed(bytes, Float64Array) };
+    });
+  } else {
+    args.row_keys.forEach(function (key, i) {
+      var values = args["values_" + i];
+      if (values) rows[i] = { key: key, values: typed(values, Float32Array), codes: args["codes_" + i].slice() };
+    });
+  }
+
+  // The page thinks we hold data we do not have (reloaded iframe): ask again
+  var hasGeometry = Boolean(geometry) && geometry.key === args.geometry_key;
+  var held = function (store, keys) {
+    return (keys || []).map(function (key, i) {
+      return store[i] && store[i].key === key ? key : null;
+    });
+  };
+  var heldBases = held(bases, args.base_keys);
+  var heldRows = held(rows, args.row_keys);
+  report({ geometry: hasGeometry ? geometry.key : null, bases: heldBases, rows: heldRows });
+  if (!hasGeometry || heldBases.concat(heldRows).indexOf(null) >= 0) return;
+
+  if (panes.length !== args.views.length) createPanes(args);
+  options = { opacity: args.opacity, lineWidth: args.line_width };
+  panes.forEach(function (pane, i) {
+    var view = args.views[i];
+    var tableKey = JSON.stringify([view.colours, view.no_data, args.hide_no_data]);
+    var table = pane.style && pane.style.tableKey === tableKey
+      ? pane.style.table
+      : colourTable(view.colours, view.no_data, args.hide_no_data);
+    pane.style = { view: view, tooltip: view.tooltip, table: table, tableKey: tableKey };
+    pane.base = clientMode ? bases[i] : null;
+  });
+
+  if (clientMode) {
+    renderClient(args);
+  } else {
+    client = null;
+    showSlider(false);
+    panes.forEach(function (pane, i) {
+      draw(pane, rows[i].values, rows[i].codes);
+    });
+  }
+}
+
+window.addEventListener("message", function (event) {
+  if (event.data && event.data.type === "streamlit:render") onRender(event.data.args);
+});
+
+sendMessage("streamlit:componentReady", { apiVersion: 1 });
@@ -0,0 +1,70 @@
+// twinning/frontend/mapview/scenario.js
+//
+// The slider arithmetic of twinning/scenarios.py and twinning/classify.py,
+// for maps that move their slider in the browser. Every step is the same
+// float64 operation numpy does, so values and classes match the server's
+// step matrices exactly (including numpy's round-half-to-even).
+"use strict";
+
+var NO_DATA = 255;
+
+// numpy.rint: round half to even
+function rint(x) {
+  var r = Math.round(x);
+  if (Math.abs(x % 1) === 0.5) r = 2 * Math.round(x / 2);
+  return r;
+}
+
+// numpy.round(x, decimals)
+function roundTo(x, decimals) {
+  var scale = Math.pow(10, decimals);
+  return rint(x * scale) / scale;
+}
+
+function nSteps(scenario) {
+  return Math.round((scenario.maximum - scenario.minimum) / scenario.step) + 1;
+}
+
+// Scenario.slider_values()
+function sliderValues(scenario) {
+  var decimals = Math.max(0, -Math.floor(Math.log10(scenario.step)));
+  var values = [];
+  for (var i = 0; i < nSteps(scenario); i++) {
+    values.push(roundTo(scenario.minimum + scenario.step * i, decimals));
+  }
+  return values;
+}
+
+// Scenario.factor()
+function factor(scenario, value) {
+  var none = scenario.full === scenario.maximum ? scenario.minimum : scenario.maximum;
+  return (value - scenario.full) / (none - scenario.full);
+}
+
+// One row of build_step_matrix: values (float64) and class codes at slider `value`
+function stepRow(base, scenario, thresholds, decimals, nanAsMax, value) {
+  var f = 1 - factor(scenario, value);
+  var n = base.length;
+  var k = thresholds.length;
+  var values = new Float64Array(n);
+  var codes = new Uint8Array(n);
+  for (var i = 0; i < n; i++) {
+    var v = base[i] * f;
+    if (decimals !== null) v = roundTo(v, decimals);
+    values[i] = v;
+
+    if (v !== v) {
+      codes[i] = nanAsMax ? k - 1 : NO_DATA;
+      continue;
+    }
+    // searchsorted(side="left"): number of thresholds below v
+    var code = 0;
+    while (code < k && thresholds[code] < v) code++;
+    codes[i] = Math.min(code, k - 1);
+  }
+  return { values: values, codes: codes };
+}
+
+if (typeof module !== "undefined") {
+  module.exports = { rint: rint, roundTo: roundTo, sliderValues: sliderValues, factor: factor, stepRow: stepRow };
+}
@@ -0,0 +1,278 @@
+# twinning/mapview.py
+"""
+Map component that keeps the geometry in the browser.
+
+With kepler.gl every slider tick rebuilt the maps: each feature's GeoJSON
+string was embedded again in a new iframe, once per map. This component is
+mounted once per page section and keeps its iframe across reruns. It draws
+one or more views side by side (e.g. absolute and percentage change) over a
+single copy of the geometry; the views pan and zoom together in the browser.
+What crosses the wire is
+
+    first render    the vertices (float32 lon/lat) and a geometry key; for
+                    a grid drawn as an image (raster mode) only each cell's
+                    pixel index and the image's corners; for vector tiles
+                    (twinning.tiles) only the tile URL, the browser then
+                    fetches the tiles in view
+    every new step  one float32 value and one uint8 class code per feature
+                    and view
+
+i.e. ~5 bytes per feature instead of a few hundred. In client mode the
+component instead gets each view's float64 base column once, plus the
+scenario and class breaks, and moves its own slider: every step is computed
+in the browser (frontend/mapview/scenario.js repeats twinning.scenarios
+exactly) and dragging causes no rerun at all.
+
+The component reports the geometry, base column and row keys it holds as
+its value. The page sends them again only when the browser does not have
+them: first load, another dataset or slider step, or an iframe that was
+reloaded. Style-only arguments (opacity, colours, line width) travel as a
+few hundred bytes of JSON: changing them restyles the layers already in the
+browser and ships no data. Encoded steps are shared by all sessions
+(`STEP_PAYLOADS`, see twinning.payloads).
+
+The frontend (twinning/frontend/mapview) is plain JavaScript on deck.gl and
+MapLibre, loaded by exact version (MAPLIBRE_VERSION, DECKGL_VERSION): the
+app's own copy when `python -m twinning.basemap` stored one (the offline
+kiosk), else the CDN's. There is no build step.
+"""
+import hashlib
+from functools import partial
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import numpy as np
+import shapely
+import streamlit as st
+import streamlit.components.v1 as components
+
+from twinning.basemap import CARTO_DARK, basemap_style
+from twinning.classify import ClassPalette
+from twinning.datasets import DISK_CACHE, dataset_version, load_dataset
+from twinning.grid import cell_raster
+from twinning.payloads import PayloadCache
+from twinning.scenarios import StepMatrix
+from twinning.tiles import TileSource, tile_source
+
+_component = components.declare_component(
+    "twinning_map", path=str(Path(__file__).resolve().parent / "frontend" / "mapview")
+)
+
+# Pinned in frontend/mapview/index.html: a bundle URL never changes content,
+# so browsers and CDN edges cache it for good, and an upgrade is a deliberate edit
+MAPLIBRE_VERSION = "3.6.2"
+DECKGL_VERSION = "8.9.36"
+
+# The frontend's library files, as paths on LIBRARY_CDN. `python -m twinning.basemap`
+# stores a copy of each under the basemap's vendor/; index.html loads that copy
+# and falls back to the CDN's when it is missing.
+LIBRARY_CDN = "https://unpkg.com/"
+LIBRARY_FILES = (
+    f"maplibre-gl@{MAPLIBRE_VERSION}/dist/maplibre-gl.css",
+    f"maplibre-gl@{MAPLIBRE_VERSION}/dist/maplibre-gl.js",
+    f"deck.gl@{DECKGL_VERSION}/dist.min.js",
+)
+
+# Initial view of every map (the old kepler.gl mapState)
+HELSINKI_VIEW = {"latitude": 60.259889999999984, "longitude": 25.2, "zoom": 8.6}
+
+# Encoded (values, codes) of recently shown steps, by row key; ~36 kB per grid step
+STEP_PAYLOADS = PayloadCache(max_size=64 * 2**20)
+
+# shapely type ids
+_LINES = (1, 2)     # LineString, LinearRing
+_POLYGON = 3
+
+
+class MapGeometry(NamedTuple):
+    key: str                   # content hash; equal keys mean identical geometry
+    kind: str                  # "polygon" (exterior rings), "line", "raster" or "tiles"
+    coords: Optional[bytes]    # float32 lon, lat of every vertex (raster: of every block corner)
+    starts: Optional[bytes]    # uint32 first vertex of each part, then the vertex count
+    features: Optional[bytes]  # uint32 feature of each part; None if every feature is one part
+    raster: Optional[dict] = None   # raster only: width, height and block edges (twinning.grid.CellRaster)
+    pixels: Optional[bytes] = None  # raster only: uint32 pixel of each feature
+    tiles: Optional[dict] = None    # tiles only: twinning.tiles.TileSource fields
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def encode_geometry(geometries) -> MapGeometry:
+    """
+    Flat vertex buffers for `geometries`, all polygonal or all linear.
+    Multi-part features are split into parts; polygon holes are dropped.
+    """
+    geometries = np.asarray(geometries)
+    parts, features = shapely.get_parts(geometries, return_index=True)
+    types = shapely.get_type_id(parts)
+    if np.all(types == _POLYGON):
+        kind, parts = "polygon", shapely.get_exterior_ring(parts)
+    elif np.all(np.isin(types, _LINES)):
+        kind = "line"
+    else:
+        raise ValueError("map geometry must be all polygons or all lines")
+
+    coords = shapely.get_coordinates(parts).astype(np.float32).tobytes()
+    counts = shapely.get_num_coordinates(parts)
+    starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.uint32).tobytes()
+    single = np.array_equal(features, np.arange(len(geometries)))
+    features = None if single else features.astype(np.uint32).tobytes()
+    key = _digest(kind.encode() + coords + starts + (features or b""))
+    return MapGeometry(key, kind, coords, starts, features)
+
+
+def encode_raster(ids, block=32) -> MapGeometry:
+    """
+    YKR cells `ids` as an image, one pixel per cell: ~4 bytes per cell instead
+    of five vertices. The browser paints the pixels from the class codes and
+    looks hovered pixels up by cell index.
+    """
+    raster = cell_raster(ids, block)
+    coords = raster.corners.astype(np.float32).tobytes()
+    pixels = raster.pixels.tobytes()
+    layout = {
+        "width": raster.width,
+        "height": raster.height,
+        "edges_x": raster.edges_x.tolist(),
+        "edges_y": raster.edges_y.tolist(),
+    }
+    key = _digest(b"raster" + coords + pixels)
+    return MapGeometry(key, "raster", coords, None, None, layout, pixels)
+
+
+def tiled_geometry(source: TileSource) -> MapGeometry:
+    """A tile set: features are fetched by the browser, values joined by feature id."""
+    key = _digest(f"tiles {source.url} {source.key}".encode())
+    return MapGeometry(key, "tiles", None, None, None, tiles=source._asdict())
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _encoded_geometry(path: str, version: str, raster: bool) -> MapGeometry:
+    def build():
+        dataset = load_dataset(path, version)
+        if raster:
+            return encode_raster(dataset["ykr_id"])
+        return encode_geometry(dataset.geometry)
+    return DISK_CACHE.get("map_geometry", path, version, (raster,), build)
+
+
+def map_geometry(path: str, raster=False, tiles=False) -> MapGeometry:
+    """
+    Geometry of a dataset for map_view, encoded once per dataset version. `raster=True`
+    draws a grid dataset's cells as an image instead of polygons. `tiles=True`
+    uses the dataset's vector tiles when `python -m twinning.tiles` has built
+    a current set, and the encoded geometry otherwise.
+    """
+    if tiles:
+        source = tile_source(path)
+        if source is not None:
+            return tiled_geometry(source)
+    return _encoded_geometry(path, dataset_version(path), raster)
+
+
+class MapLayer(NamedTuple):
+    """What one view shows: a step matrix at the slider position, and its classes."""
+
+    title: str              # tooltip label
+    matrix: StepMatrix
+    classes: ClassPalette
+    scale: float = 1        # the tooltip shows value * scale ...
+    decimals: int = 1       # ... with this many decimals ...
+    suffix: str = ""        # ... followed by this
+
+
+def step_key(matrix: StepMatrix, slider_value) -> str:
+    """
+    Identifies the values and codes of one step: the dataset column's content
+    (its version), how the matrix was built, and the slider step.
+    """
+    step = matrix.scenario.index(slider_value)
+    built_from = repr((matrix.scenario, matrix.thresholds, matrix.decimals, matrix.nan_as_max, step))
+    return _digest(matrix.base.tobytes() + built_from.encode())
+
+
+def encode_step(matrix: StepMatrix, slider_value):
+    """(float32 values, uint8 codes) bytes of one step, as the component reads them."""
+    values, codes = matrix.row(slider_value)
+    return values.astype(np.float32).tobytes(), codes.tobytes()
+
+
+def _held(keys, i):
+    return keys[i] if i < len(keys) else None
+
+
+def map_view(geometry: MapGeometry, layers, slider_value, opacity=0.8, client=False, slider_label="",
+             hide_no_data=False, line_width=1, style=None, view=HELSINKI_VIEW, height=380, key=None):
+    """
+    Draw `layers` side by side over one copy of `geometry`, at `slider_value`.
+    `key` must be unique on the page.
+
+    With `client=True` the component gets its own slider and computes every
+    step in the browser from the matrices' base columns: dragging it causes
+    no rerun. `hide_no_data` leaves features without a value (class NO_DATA)
+    undrawn instead of painting them in the no-data colour. `line_width` is
+    in pixels, for line geometry. `style` defaults to the basemap chosen by
+    twinning.basemap (self-hosted if warmed up, else CARTO Dark Matter).
+    """
+    held = st.session_state.get(key) or {}
+    send_geometry = held.get("geometry") != geometry.key
+    held_bases = held.get("bases") or []
+    held_rows = held.get("rows") or []
+
+    args = dict(
+        geometry_key=geometry.key,
+        kind=geometry.kind,
+        coords=geometry.coords if send_geometry else None,
+        starts=geometry.starts if send_geometry else None,
+        features=geometry.features if send_geometry else None,
+        raster=geometry.raster if send_geometry else None,
+        pixels=geometry.pixels if send_geometry else None,
+        tiles=geometry.tiles if send_geometry else None,
+        views=[
+            {
+                "colours": list(layer.classes.colours),
+                "no_data": layer.classes.no_data,
+                "tooltip": {"title": layer.title, "scale": layer.scale, "decimals": layer.decimals, "suffix": layer.suffix},
+            }
+            for layer in layers
+        ],
+        opacity=opacity,
+        hide_no_data=hide_no_data,
+        line_width=line_width,
+        style=style or basemap_style(),
+        style_fallback=CARTO_DARK,
+        view=view,
+        height=height,
+    )
+
+    if client:
+        # Base columns are sent once, like the geometry
+        base_keys = []
+        for i, layer in enumerate(layers):
+            matrix = layer.matrix
+            base = matrix.base.tobytes()
+            base_keys.append(_digest(base))
+            args[f"base_{i}"] = base if _held(held_bases, i) != base_keys[i] else None
+            args["views"][i].update(
+                scenario=matrix.scenario._asdict(),
+                thresholds=list(matrix.thresholds),
+                round_to=matrix.decimals,
+                nan_as_max=matrix.nan_as_max,
+            )
+        args.update(base_keys=base_keys, slider_value=slider_value, slider_label=slider_label)
+    else:
+        # A step the browser already shows is not sent again (style-only reruns)
+        row_keys = []
+        for i, layer in enumerate(layers):
+            row_keys.append(step_key(layer.matrix, slider_value))
+            if _held(held_rows, i) == row_keys[i]:
+                args[f"values_{i}"] = args[f"codes_{i}"] = None
+            else:
+                values, codes = STEP_PAYLOADS.get(row_keys[i], partial(encode_step, layer.matrix, slider_value))
+                args[f"values_{i}"] = values
+                args[f"codes_{i}"] = codes
+        args.update(row_keys=row_keys)
+
+    _component(**args, key=key, default=None)
@@ -0,0 +1,103 @@
+# twinning/pagemaps.py
+"""
+The maps each comparison page draws under the "default" scheme.
+
+A page builds one step matrix per map (twinning.scenarios.step_matrix)
+from its own thresholds: manual lists, or quantiles of the column. The
+warm-up and the prefetcher (twinning.warmup, twinning.prefetch) build the
+same matrices ahead of the first visitor, so they need the same
+arguments; they are listed here, as each page spells them. Keep this table
+in step with the pages: tests/test_warmup.py runs every page after a
+warm-up and fails if a page still has to build a matrix.
+"""
+from typing import NamedTuple, Optional
+
+from twinning.datasets import load_dataset
+from twinning.scenarios import S2_S1, S3_S2, Scenario, StepMatrix, step_matrix
+
+
+class PageMap(NamedTuple):
+    page: str
+    path: str                          # as the page spells it
+    column: str
+    scenario: Scenario
+    thresholds: Optional[tuple] = None     # the page's manual thresholds, or
+    levels: Optional[tuple] = None         # the quantile levels of the column it uses
+    unit: int = 1
+    decimals: Optional[int] = None
+    nan_as_max: bool = False
+
+    def default_thresholds(self) -> list:
+        if self.thresholds is not None:
+            return list(self.thresholds)
+        return load_dataset(self.path).quantiles(self.column, self.levels)
+
+    def step_matrix(self) -> StepMatrix:
+        """The shared step matrix the page draws this map from."""
+        return step_matrix(self.path, self.column, self.scenario, self.default_thresholds(),
+                           self.unit, self.decimals, self.nan_as_max)
+
+
+_GRID = "Datasets/Grid maps/"
+_TRAFFIC = "Datasets/Traffic changes/"
+
+PAGE_MAPS = [
+    # ==============================================================
+    # Emissions comparison
+    # ==============================================================
+    PageMap("Emissions comparison", _GRID + "s2_s3_emissions_diff.gpkg", "absolute_change", S3_S2,
+            thresholds=(-32.0, -22.0, -12.0, -6.0, -3.0, -0.5, 2), unit=1000, decimals=1, nan_as_max=True),
+    PageMap("Emissions comparison", _GRID + "s2_s3_emissions_diff.gpkg", "percentage_change", S3_S2,
+            thresholds=tuple(v / 100.0 for v in (-40, -30, -22, -15, -8, -2, 5)), nan_as_max=True),
+    PageMap("Emissions comparison", _GRID + "s1_s2_emissions_diff.gpkg", "absolute_change", S2_S1,
+            thresholds=(2, 4, 8, 13.0, 21.0, 30.0, 41), unit=1000, decimals=1, nan_as_max=True),
+    PageMap("Emissions comparison", _GRID + "s1_s2_emissions_diff.gpkg", "percentage_change", S2_S1,
+            thresholds=tuple(v / 100.0 for v in (2.5, 5, 11, 18, 25, 35, 45)), nan_as_max=True),
+    # ==============================================================
+    # Remote workers comparison
+    # ==============================================================
+    PageMap("Remote workers comparison", _GRID + "s2_s3_remote_workers_diff.gpkg", "absolute_change", S3_S2,
+            levels=(0.25, 0.4, 0.6, 0.74, 0.8, 0.9, 0.97), decimals=1, nan_as_max=True),
+    PageMap("Remote workers comparison", _GRID + "s2_s3_remote_workers_diff.gpkg", "percentage_change", S3_S2,
+            thresholds=(0.15, 0.25, 0.4, 0.6, 0.85, 1, 1.15), nan_as_max=True),
+    PageMap("Remote workers comparison", _GRID + "s1_s2_remote_workers_diff.gpkg", "absolute_change", S2_S1,
+            levels=(0.05, 0.15, 0.25, 0.4, 0.6, 0.8, 0.95), decimals=1, nan_as_max=True),
+    # ==============================================================
+    # On-site workers comparison
+    # ==============================================================
+    PageMap("On-site workers comparison", _GRID + "s2_s3_on_site_workers_diff.gpkg", "absolute_change", S3_S2,
+            thresholds=(-30.0, -20.0, -9.0, -5.0, -3.0, -1.5, -0.5), decimals=1, nan_as_max=True),
+    PageMap("On-site workers comparison", _GRID + "s2_s3_on_site_workers_diff.gpkg", "percentage_change", S3_S2,
+            levels=(0.25, 0.46, 0.68, 0.8, 0.87, 0.93, 0.97), nan_as_max=True),
+    PageMap("On-site workers comparison", _GRID + "s1_s2_on_site_workers_diff.gpkg", "absolute_change", S2_S1,
+            thresholds=(1, 3, 7, 12, 18, 29, 40), decimals=1, nan_as_max=True),
+    PageMap("On-site workers comparison", _GRID + "s1_s2_on_site_workers_diff.gpkg", "percentage_change", S2_S1,
+            levels=(0.10, 0.25, 0.4, 0.6, 0.75, 0.9, 0.97), nan_as_max=True),
+    # ==============================================================
+    # Car passengers comparison
+    # ==============================================================
+    PageMap("Car passengers comparison", _TRAFFIC + "s2_s3_cars_difference_rebounds_abs_change.gpkg",
+            "absolute_change", S3_S2, thresholds=(-110.0, -80, -60.0, -40.0, -25.0, -10.0, -5.0), decimals=1),
+    PageMap("Car passengers comparison", _TRAFFIC + "s2_s3_cars_difference_rebounds_abs_change.gpkg",
+            "percentage_change", S3_S2, thresholds=(-0.55, -0.45, -0.35, -0.23, -0.10, -0.05, -0.01)),
+    PageMap("Car passengers comparison", _TRAFFIC + "s1_s2_cars_difference_rebounds_abs_change.gpkg",
+            "absolute_change", S2_S1, thresholds=(10.0, 25.0, 50.0, 75.0, 100.0, 150.0, 200.0), decimals=1),
+    PageMap("Car passengers comparison", _TRAFFIC + "s1_s2_cars_difference_rebounds_abs_change.gpkg",
+            "percentage_change", S2_S1, thresholds=(0.2, 0.7, 1.4, 2.0, 3.0, 5.0, 7.0)),
+    # ==============================================================
+    # Transit passengers comparison
+    # ==============================================================
+    PageMap("Transit passengers comparison", _TRAFFIC + "s2_s3_transit_difference_rebounds_abs_change.gpkg",
+            "absolute_change", S3_S2, thresholds=(-200, -50, -15, -7, -2, 0.1, 3), decimals=1),
+    PageMap("Transit passengers comparison", _TRAFFIC + "s2_s3_transit_difference_rebounds_abs_change.gpkg",
+            "percentage_change", S3_S2, thresholds=(-0.45, -0.35, -0.21, -0.1, -0.05, 0.1, 0.3)),
+    PageMap("Transit passengers comparison", _TRAFFIC + "s1_s2_transit_difference_rebounds_abs_change.gpkg",
+            "absolute_change", S2_S1, thresholds=(0, 3, 12, 27, 70, 150, 400), decimals=1),
+    PageMap("Transit passengers comparison", _TRAFFIC + "s1_s2_transit_difference_rebounds_abs_change.gpkg",
+            "percentage_change", S2_S1, thresholds=(-0.4, 0, 0.25, 0.45, 0.6, 0.85, 1.2)),
+]
+
+
+def maps_of(path) -> list:
+    """The page maps drawn from the dataset at `path`."""
+    return [m for m in PAGE_MAPS if m.path == str(path)]
@@ -0,0 +1,58 @@
+# twinning/pagestate.py
+"""
+Navigation state of the map pages, one per page.
+
+All map pages used to share one `st.session_state.mode`: switching to
+"S2 vs S1" on the Emissions page flipped the Car passengers page as well,
+whose next visit then loaded and drew the other GeoPackage. Now
+
+  - each page keeps its own mode (`page_mode(page)`), under `mode_key(page)`;
+  - the mode is mirrored in the URL (`?mode=S2_S1`), so a reload or a
+    shared link opens the same comparison;
+  - a page loads only the dataset it shows, and `prefetch` warms the other
+    mode's dataset in the background (twinning.prefetch), so the switch
+    button finds it in the shared caches.
+"""
+import streamlit as st
+
+from twinning.prefetch import PREFETCHER
+
+MODES = ("S3_S2", "S2_S1")
+DEFAULT_MODE = "S3_S2"
+
+
+def mode_key(page: str) -> str:
+    """Session state key of `page`'s mode."""
+    return f"mode:{page}"
+
+
+def page_mode(page: str) -> str:
+    """`page`'s mode: from the URL on the first visit of the session, then its own state."""
+    key = mode_key(page)
+    if key not in st.session_state:
+        requested = st.query_params.get("mode")
+        st.session_state[key] = requested if requested in MODES else DEFAULT_MODE
+    mode = st.session_state[key]
+    if st.query_params.get("mode") != mode:
+        st.query_params["mode"] = mode
+    return mode
+
+
+def set_page_mode(page: str, mode: str):
+    """Switch `page` to `mode` (the caller reruns)."""
+    st.session_state[mode_key(page)] = mode
+    st.query_params["mode"] = mode
+
+
+def prefetch(path: str, shown: str = None):
+    """
+    Warm `path` in the background (returns immediately). `shown` is the
+    dataset the page draws: whether it had been prefetched is logged once
+    per session.
+    """
+    if shown is not None:
+        seen = st.session_state.setdefault("prefetch:shown", set())
+        if shown not in seen:
+            seen.add(shown)
+            PREFETCHER.shown(shown)
+    PREFETCHER.submit(path)
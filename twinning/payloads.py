@@ -0,0 +1,115 @@
+# twinning/payloads.py
+"""
+Process-wide cache of encoded map payloads.
+
+Most visitors look at the same few slider positions (the defaults 47.3 and
+0.0, the scenario values 24.0 ...), and every session used to encode them
+again. `PayloadCache` keeps the encoded bytes shared between sessions:
+
+  - bounded by total size in bytes, least recently used entries go first;
+  - thread-safe (Streamlit runs every session in its own thread);
+  - single-flight: sessions asking for a key that is being built wait for
+    that build instead of starting their own;
+  - counts hits and misses, see `stats()` and `python -m twinning.bench payloads`.
+"""
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int        # builds started
+    waits: int         # misses answered by another session's build
+    entries: int
+    size: int          # bytes
+    max_size: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses + self.waits
+        return (self.hits + self.waits) / lookups if lookups else 0.0
+
+
+def payload_size(payload) -> int:
+    """Bytes held by a payload: a bytes object or a tuple of them (None counts 0)."""
+    if isinstance(payload, (tuple, list)):
+        return sum(payload_size(part) for part in payload)
+    return len(payload) if payload is not None else 0
+
+
+class _Flight:
+    """A build in progress; other threads wait on it."""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class PayloadCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()   # key -> (payload, size), oldest first
+        self._flights = {}
+        self._size = 0
+        self._hits = self._misses = self._waits = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """The payload for `key`, calling `build()` only if no entry or build exists."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self._misses += 1
+                owner = True
+            else:
+                self._waits += 1
+                owner = False
+
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = build()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None:
+                    self._store(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def _store(self, key, payload):
+        size = payload_size(payload)
+        if size > self.max_size:
+            return  # would evict everything else; serve it uncached
+        self._entries[key] = (payload, size)
+        self._size += size
+        while self._size > self.max_size:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._size -= evicted
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._waits, len(self._entries), self._size, self.max_size)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._hits = self._misses = self._waits = 0
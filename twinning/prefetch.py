@@ -0,0 +1,137 @@
+# twinning/prefetch.py
+"""
+Background warm-up of datasets a visitor is likely to open next.
+
+A map page shows one comparison; the other one ("S2 vs S1" next to
+"S3 vs S2") is a button click away, and used to load only after that click
+and its rerun. `PREFETCHER.submit(path)` warms it in a small thread pool
+after the page has drawn:
+
+    the dataset              load_dataset (compiled Arrow or GeoPackage)
+    its map geometry         vectors, and the raster for grid datasets
+    its tile set             the staleness check of twinning.tiles
+    its step matrices        the maps its page draws under the "default"
+                             scheme, with their thresholds (twinning.pagemaps)
+
+into the shared process-wide caches, where the page finds them later.
+Bounded: at most WORKERS threads and MAX_PENDING queued paths (more are
+dropped, not queued), a path is warmed once, and the record of warmed
+paths is capped at MAX_WARMED; visitors add no memory beyond the caches.
+
+Whether prefetching pays off is logged to `twinning.prefetch` at INFO, per
+path a page shows (`shown`): a hit (warmed before it was asked for), late
+(still warming) or a miss (never submitted). `stats()` has the counts.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from twinning.datasets import load_dataset
+from twinning.mapview import map_geometry
+from twinning.pagemaps import maps_of
+from twinning.tiles import tile_source
+
+WORKERS = 2
+MAX_PENDING = 8
+MAX_WARMED = 64
+
+_logger = logging.getLogger(__name__)
+
+
+class _QuietPrefetch(logging.Filter):
+    """Drops streamlit's missing-ScriptRunContext warnings from the prefetch and warm-up threads (no session, on purpose)."""
+
+    def filter(self, record):
+        return not record.threadName.startswith(("prefetch", "warmup"))
+
+
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(_QuietPrefetch())
+
+
+class PrefetchStats(NamedTuple):
+    hits: int
+    late: int          # asked for while still warming
+    misses: int
+    warmed: int
+    dropped: int       # not queued, MAX_PENDING reached
+    failed: int
+    pending: int
+
+
+def warm(path: str):
+    """Fill the shared caches a map page reads for `path`."""
+    dataset = load_dataset(path)
+    map_geometry(path)
+    if "ykr_id" in dataset:
+        map_geometry(path, raster=True)
+    tile_source(path)
+    for page_map in maps_of(path):
+        page_map.step_matrix()
+
+
+class Prefetcher:
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING, max_warmed=MAX_WARMED, warm=warm):
+        self.max_pending = max_pending
+        self.max_warmed = max_warmed
+        self._warm = warm
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="prefetch")
+        self._pending = {}               # path -> submit time
+        self._warmed = OrderedDict()     # path -> time warmed, oldest first
+        self._counts = dict(hits=0, late=0, misses=0, warmed=0, dropped=0, failed=0)
+        self._lock = threading.Lock()
+
+    def submit(self, path: str) -> bool:
+        """Warm `path` in the background unless it is warmed, warming or the queue is full."""
+        with self._lock:
+            if path in self._warmed or path in self._pending:
+                return False
+            if len(self._pending) >= self.max_pending:
+                self._counts["dropped"] += 1
+                _logger.info("prefetch dropped %s (%d pending)", Path(path).stem, len(self._pending))
+                return False
+            self._pending[path] = time.perf_counter()
+        self._pool.submit(self._run, path)
+        return True
+
+    def _run(self, path: str):
+        started = time.perf_counter()
+        try:
+            self._warm(path)
+        except Exception:
+            with self._lock:
+                del self._pending[path]
+                self._counts["failed"] += 1
+            _logger.exception("prefetch of %s failed", path)
+            return
+        with self._lock:
+            del self._pending[path]
+            self._warmed[path] = time.perf_counter()
+            while len(self._warmed) > self.max_warmed:
+                self._warmed.popitem(last=False)
+            self._counts["warmed"] += 1
+        _logger.info("prefetched %s in %.0f ms", Path(path).stem, (time.perf_counter() - started) * 1000)
+
+    def shown(self, path: str) -> str:
+        """Record that a page shows `path`; returns "hit", "late" or "miss"."""
+        with self._lock:
+            if path in self._warmed:
+                outcome, detail = "hit", f"warmed {time.perf_counter() - self._warmed[path]:.1f} s before"
+            elif path in self._pending:
+                outcome, detail = "late", f"submitted {time.perf_counter() - self._pending[path]:.1f} s before"
+            else:
+                outcome, detail = "miss", "never submitted"
+            self._counts[{"hit": "hits", "late": "late", "miss": "misses"}[outcome]] += 1
+        _logger.info("prefetch %s: %s (%s)", outcome, Path(path).stem, detail)
+        return outcome
+
+    def stats(self) -> PrefetchStats:
+        with self._lock:
+            return PrefetchStats(pending=len(self._pending), **self._counts)
+
+
+# Shared by all sessions
+PREFETCHER = Prefetcher()
@@ -0,0 +1,164 @@
+# twinning/scenarios.py
+"""
+Slider scenarios and per-step value/class matrices for the grid map pages.
+
+Every map shows `base * (1 - factor)`, where `factor` depends only on the
+slider position, and the slider moves in 0.1 steps. So each comparison has a
+few hundred possible states per dataset column. `step_matrix` computes all of
+them once (and keeps them on disk across restarts, twinning.diskcache):
+
+    values[step, cell]   float32, the value shown for the cell
+    codes[step, cell]    uint8, its colour class (twinning.classify)
+
+and a slider move is a row lookup instead of recomputing the column.
+`build_crossing_index` lists, per slider move, only the cells whose class
+changes; `python -m twinning.bench steps` uses it to report how few they are.
+
+Class codes are computed from the float64 values, exactly as the pages did;
+only the stored values are narrowed to float32. A matrix also keeps the
+float64 base column and thresholds it was built from, so the browser can
+repeat the same computation (twinning.mapview, client-side slider).
+"""
+from typing import NamedTuple, Optional
+
+import numpy as np
+import streamlit as st
+
+from twinning.classify import classify
+from twinning.datasets import DISK_CACHE, dataset_version, load_dataset
+
+
+class Scenario(NamedTuple):
+    """A comparison slider: its range, and the position showing the full change."""
+
+    minimum: float
+    maximum: float
+    full: float        # slider value at which factor == 0
+    step: float = 0.1
+
+    @property
+    def none(self) -> float:
+        """Slider value at which the change has faded out (factor == 1)."""
+        return self.minimum if self.full == self.maximum else self.maximum
+
+    @property
+    def n_steps(self) -> int:
+        return int(round((self.maximum - self.minimum) / self.step)) + 1
+
+    def slider_values(self) -> np.ndarray:
+        """Every value the slider can take, as Streamlit returns them."""
+        decimals = max(0, -int(np.floor(np.log10(self.step))))
+        return np.round(self.minimum + self.step * np.arange(self.n_steps), decimals)
+
+    def factor(self, value):
+        """Share of the change removed at slider `value` (0 = full change, 1 = none)."""
+        return (value - self.full) / (self.none - self.full)
+
+    def index(self, value) -> int:
+        """Row of the step matrices for slider `value`."""
+        i = int(round((value - self.minimum) / self.step))
+        if not 0 <= i < self.n_steps:
+            raise ValueError(f"slider value {value} outside {self.minimum}..{self.maximum}")
+        return i
+
+
+# Remote-working share of the population: S3 = 47.3 %, S2 = 24 %, S1 = 0 %
+S3_S2 = Scenario(24.0, 47.3, full=47.3)
+S2_S1 = Scenario(0.0, 24.0, full=0.0)
+
+
+class StepMatrix(NamedTuple):
+    scenario: Scenario
+    values: np.ndarray          # float32 [step, cell]
+    codes: np.ndarray           # uint8 [step, cell]
+    decimals: Optional[int]
+    # What the matrix was built from, for clients that compute steps themselves
+    base: np.ndarray            # float64 [cell]
+    thresholds: tuple
+    nan_as_max: bool
+
+    def row(self, slider_value):
+        """(values, codes) at `slider_value`; values as float64 again."""
+        i = self.scenario.index(slider_value)
+        values = self.values[i].astype(float)
+        if self.decimals is not None:
+            # float32 keeps ~7 digits, so this restores the exact rounded value
+            values = values.round(self.decimals)
+        return values, self.codes[i]
+
+
+def build_step_matrix(base, scenario: Scenario, thresholds, decimals=None, nan_as_max=False) -> StepMatrix:
+    """Values and class codes of `base * (1 - factor)` at every slider step."""
+    base = np.asarray(base, dtype=float)
+    factors = scenario.factor(scenario.slider_values())
+    # inf * 0 at the faded-out end gives NaN, as it did on the pages
+    with np.errstate(invalid="ignore"):
+        scaled = base[np.newaxis, :] * (1 - factors[:, np.newaxis])
+    if decimals is not None:
+        scaled = scaled.round(decimals)
+
+    codes = classify(scaled, thresholds, nan_as_max=nan_as_max)
+    values = scaled.astype(np.float32)
+    base = base.copy()
+    for array in (values, codes, base):
+        array.flags.writeable = False
+    return StepMatrix(scenario, values, codes, decimals, base, tuple(float(t) for t in thresholds), nan_as_max)
+
+
+# Bounded: every classification scheme gets its own matrices (~7 MB each)
+@st.cache_resource(show_spinner="Preparing slider steps...", max_entries=64)
+def _step_matrix(path: str, version: str, column: str, scenario: Scenario, thresholds: tuple,
+                 unit, decimals, nan_as_max) -> StepMatrix:
+    def build():
+        base = load_dataset(path, version)[column]
+        if unit != 1:
+            base = base / unit
+        return build_step_matrix(base, scenario, thresholds, decimals, nan_as_max)
+    return DISK_CACHE.get("step_matrix", path, version, (column, scenario, thresholds, unit, decimals, nan_as_max), build)
+
+
+def step_matrix(path: str, column: str, scenario: Scenario, thresholds: tuple,
+                unit=1, decimals=None, nan_as_max=False) -> StepMatrix:
+    """
+    Shared step matrix for one dataset column (divided by `unit` first),
+    built once per dataset version for each set of thresholds and kept on
+    disk across restarts. Thresholds are keyed as floats, so `[2, 4.0]` and
+    `(2.0, 4.0)` share a matrix.
+    """
+    thresholds = tuple(float(t) for t in thresholds)
+    return _step_matrix(path, dataset_version(path), column, scenario, thresholds, unit, decimals, nan_as_max)
+
+
+class CrossingIndex(NamedTuple):
+    """
+    Class changes of a step matrix as (step, cell) events, sorted by step.
+
+    Each cell's value is linear (then rounded) in the slider factor, so its
+    class changes at only a handful of slider positions; an event at step k
+    means the cell's class differs between steps k - 1 and k.
+    """
+
+    scenario: Scenario
+    steps: np.ndarray   # int32, sorted
+    cells: np.ndarray   # int32 row positions
+    codes: np.ndarray   # uint8 [step, cell], the matrix the events come from
+
+    def changed(self, old_value, new_value) -> np.ndarray:
+        """Sorted positions of the cells whose class differs between two slider values."""
+        old, new = self.scenario.index(old_value), self.scenario.index(new_value)
+        lo, hi = min(old, new), max(old, new)
+        start, stop = np.searchsorted(self.steps, [lo + 1, hi + 1])
+        cells = np.unique(self.cells[start:stop])
+        # A cell may cross back within the range (rounding, NaN at the ends)
+        return cells[self.codes[old, cells] != self.codes[new, cells]]
+
+    def breakpoints(self, cell) -> np.ndarray:
+        """Sorted slider factors at which `cell` changes class."""
+        steps = self.steps[self.cells == cell]
+        return self.scenario.factor(self.scenario.slider_values()[steps])
+
+
+def build_crossing_index(matrix: StepMatrix) -> CrossingIndex:
+    steps, cells = np.nonzero(matrix.codes[1:] != matrix.codes[:-1])
+    # np.nonzero walks row by row, so events are already sorted by step
+    return CrossingIndex(matrix.scenario, (steps + 1).astype(np.int32), cells.astype(np.int32), matrix.codes)
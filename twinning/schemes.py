@@ -0,0 +1,179 @@
+# twinning/schemes.py
+"""
+Classification schemes for the map colour classes.
+
+A scheme turns a dataset column into `k` ascending class upper bounds, in
+the form twinning.classify expects (class i is `<= thresholds[i]`, values
+above the last bound fall in the top class):
+
+    default          the page's own thresholds (manual lists or page quantiles)
+    natural_breaks   Jenks natural breaks
+    equal_interval   k equal-width classes between the minimum and maximum
+    quantile         k classes with the same number of cells
+
+Only finite values are used (percentage changes from zero are infinite).
+A column with no finite values has no bounds (`[]`) under any scheme, and
+`scheme_classes` keeps the page's default thresholds for it.
+
+Thresholds are memoised per (dataset, column, scheme, k), in memory and on
+disk (twinning.diskcache).
+"""
+import numpy as np
+import streamlit as st
+
+from twinning.classify import ClassPalette
+from twinning.datasets import DISK_CACHE, dataset_version, load_dataset
+
+
+def _finite(values) -> np.ndarray:
+    values = np.asarray(values, dtype=float)
+    return values[np.isfinite(values)]
+
+
+def equal_interval(values, k) -> list:
+    values = _finite(values)
+    if not len(values):
+        return []
+    low, high = values.min(), values.max()
+    return [low + (high - low) * i / k for i in range(1, k)] + [high]
+
+
+def quantile(values, k) -> list:
+    values = _finite(values)
+    if not len(values):
+        return []
+    return np.quantile(values, [i / k for i in range(1, k + 1)]).tolist()
+
+
+def _class_cost(cw, cwx, cwxx, first, last):
+    """Weighted squared deviation of points[first..last] from their mean."""
+    w = cw[last + 1] - cw[first]
+    s = cwx[last + 1] - cwx[first]
+    return (cwxx[last + 1] - cwxx[first]) - s * s / w
+
+
+def _segment_argmin(values, offsets, lengths):
+    """Position of the first minimum of each run values[offsets[t]:offsets[t] + lengths[t]]."""
+    minima = np.minimum.reduceat(values, offsets)
+    positions = np.arange(len(values))
+    is_min = values == np.repeat(minima, lengths)
+    return np.minimum.reduceat(np.where(is_min, positions, len(values)), offsets)
+
+
+def natural_breaks(values, k) -> list:
+    """
+    Jenks natural breaks (exact): the k classes with the least total
+    within-class squared deviation.
+
+    Dynamic programming over the distinct values (weighted by count). The
+    best start of the last class never moves left as the end moves right,
+    so each of the k - 1 rounds is solved by divide and conquer in
+    O(m log m); all subproblems at one recursion depth are evaluated
+    together as flat numpy arrays. O(k * m log m) overall.
+    """
+    points, weights = np.unique(_finite(values), return_counts=True)
+    m = len(points)
+    if m == 0:
+        return []
+    if m <= k:
+        return points.tolist() + [points[-1]] * (k - m)
+
+    # Prefix sums of the centred points give any class cost in O(1)
+    x = points - np.average(points, weights=weights)
+    zero = np.zeros(1)
+    cw = np.concatenate([zero, np.cumsum(weights)])
+    cwx = np.concatenate([zero, np.cumsum(weights * x)])
+    cwxx = np.concatenate([zero, np.cumsum(weights * x * x)])
+
+    # best[j]: least cost of points[0..j] in c + 1 classes; start[c][j]: first point of the last class
+    ends = np.arange(m)
+    best = _class_cost(cw, cwx, cwxx, np.zeros(m, dtype=np.int64), ends)
+    starts = []
+    for c in range(1, k):
+        new_best = np.full(m, np.inf)
+        start = np.zeros(m, dtype=np.int64)
+        # Open tasks: ends lo..hi, whose last class starts within first_lo..first_hi
+        lo, hi = np.array([c]), np.array([m - 1])
+        first_lo, first_hi = np.array([c]), np.array([m - 1])
+        while len(lo):
+            mid = (lo + hi) // 2
+            top = np.minimum(mid, first_hi)
+            lengths = top - first_lo + 1
+            offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            task = np.repeat(np.arange(len(mid)), lengths)
+            first = first_lo[task] + np.arange(lengths.sum()) - offsets[task]
+            total = best[first - 1] + _class_cost(cw, cwx, cwxx, first, mid[task])
+
+            chosen = _segment_argmin(total, offsets, lengths)
+            new_best[mid] = total[chosen]
+            start[mid] = first[chosen]
+
+            # Left halves keep the lower bound, right halves start from the chosen split
+            left, right = lo <= mid - 1, mid + 1 <= hi
+            lo, hi, first_lo, first_hi = (
+                np.concatenate([lo[left], mid[right] + 1]),
+                np.concatenate([mid[left] - 1, hi[right]]),
+                np.concatenate([first_lo[left], start[mid][right]]),
+                np.concatenate([start[mid][left], first_hi[right]]),
+            )
+        best = new_best
+        starts.append(start)
+
+    # Walk back from the last point; each class ends just before the next one starts
+    bounds = [points[-1]]
+    end = m - 1
+    for start in reversed(starts):
+        end = start[end] - 1
+        bounds.append(points[end])
+    return sorted(bounds)
+
+
+SCHEMES = {
+    "natural_breaks": natural_breaks,
+    "equal_interval": equal_interval,
+    "quantile": quantile,
+}
+
+SCHEME_LABELS = {
+    "default": "Default",
+    "natural_breaks": "Natural breaks (Jenks)",
+    "equal_interval": "Equal interval",
+    "quantile": "Quantile",
+}
+
+
+@st.cache_resource(show_spinner=False)
+def _scheme_thresholds(path: str, version: str, column: str, scheme: str, k: int, unit) -> tuple:
+    def build():
+        values = load_dataset(path, version)[column]
+        if unit != 1:
+            values = values / unit
+        return tuple(float(v) for v in SCHEMES[scheme](values, k))
+    return DISK_CACHE.get("thresholds", path, version, (column, scheme, k, unit), build)
+
+
+def scheme_thresholds(path: str, column: str, scheme: str, k: int, unit=1) -> tuple:
+    """Class upper bounds for a dataset column (divided by `unit`), computed once per dataset version."""
+    return _scheme_thresholds(path, dataset_version(path), column, scheme, k, unit)
+
+
+@st.cache_resource(show_spinner=False)
+def _scheme_classes(path: str, version: str, column: str, scheme: str, palette: tuple, default: tuple,
+                    label, reverse, unit):
+    if scheme == "default":
+        thresholds = tuple(default)
+    else:
+        # A column without finite values has no bounds; keep the page's own
+        thresholds = _scheme_thresholds(path, version, column, scheme, len(palette), unit) or tuple(default)
+    return thresholds, ClassPalette.of(palette, [label.format(v) for v in thresholds], reverse)
+
+
+def scheme_classes(path: str, column: str, scheme: str, palette: tuple, default: tuple,
+                   label="≤ {:.1f}", reverse=False, unit=1):
+    """
+    (thresholds, ClassPalette) for one map under `scheme`, with as many
+    classes as `palette` has colours. "default" keeps the page's own
+    `default` thresholds, as does any scheme on a column without finite
+    values.
+    """
+    return _scheme_classes(path, dataset_version(path), column, scheme, palette, default, label, reverse, unit)
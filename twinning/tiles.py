@@ -0,0 +1,300 @@
+# twinning/tiles.py
+"""
+Vector tiles for the map layers, built offline and served as static files.
+
+    python -m twinning.tiles                     # grid maps and traffic layers
+    python -m twinning.tiles path/to/file.gpkg   # only the given files
+
+Each dataset becomes a zoom pyramid of Mapbox Vector Tiles in a directory,
+
+    Datasets/compiled/tiles/<dataset>/<z>/<x>/<y>.pbf
+    Datasets/compiled/tiles/<dataset>/tiles.json      bounds, zooms, source hash
+
+served by Streamlit's component file handler, so the browser fetches only
+the tiles in view. A feature carries nothing but its row in the dataset (as
+feature id and as an `id` property): the scenario values and class codes
+still come from the page per slider step and are joined in the browser, so
+the tiles never change when the slider moves.
+
+A directory rather than one PMTiles archive: the file handler can serve it
+as it is, where a PMTiles archive needs a server answering range requests.
+Tiles are written without compression; tiles in the dataset's bounds that
+hold no feature are empty files, so the browser never sees a 404.
+"""
+import argparse
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import numpy as np
+import shapely
+import streamlit as st
+
+from twinning.build import GRID_DIR
+from twinning.components import directory_component, serve
+from twinning.datasets import COMPILED_DIR, ROOT, dataset_version, load_dataset, relative_path
+
+TILES_DIR = COMPILED_DIR / "tiles"
+TRAFFIC_DIR = ROOT / "Datasets" / "Traffic changes"
+
+LAYER = "features"
+EXTENT = 4096          # tile coordinate units per tile side
+BUFFER = 64            # clip this far outside the tile, so lines meet across tile edges
+MIN_ZOOM = 7
+MAX_ZOOM = 12          # deeper zooms reuse (overzoom) these tiles
+
+# Bump when the tile layout changes; older tile sets are then ignored
+TILES_FORMAT = 1
+
+# Serves TILES_DIR once tile sets were built (twinning.components)
+_tiles = directory_component(__name__, "tiles", TILES_DIR)
+
+
+# ============================================================
+# --- MVT ENCODING ---
+# ============================================================
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _message(number: int, payload: bytes) -> bytes:
+    """Length-delimited protobuf field."""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _uint(number: int, n: int) -> bytes:
+    """Varint protobuf field."""
+    return _varint(number << 3) + _varint(n)
+
+
+def _command(command: int, count: int) -> int:
+    return (command & 0x7) | (count << 3)
+
+
+_MOVE_TO, _LINE_TO, _CLOSE_PATH = 1, 2, 7
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    return (values << 1) ^ (values >> 63)
+
+
+def _path_commands(points: np.ndarray, cursor: np.ndarray, ring: bool):
+    """
+    Commands for one line or ring of integer tile coordinates, starting from
+    `cursor`. Returns (commands, new cursor), or (None, cursor) if the part
+    collapses at this zoom.
+    """
+    if ring:
+        points = points[:-1]  # the closing point is implied by ClosePath
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+    points = points[keep]
+    if len(points) < (3 if ring else 2):
+        return None, cursor
+
+    deltas = _zigzag(np.diff(np.vstack([cursor, points]), axis=0)).ravel()
+    commands = [_command(_MOVE_TO, 1), *deltas[:2].tolist(), _command(_LINE_TO, len(points) - 1), *deltas[2:].tolist()]
+    if ring:
+        commands.append(_command(_CLOSE_PATH, 1))
+    return commands, points[-1]
+
+
+def _signed_area(points: np.ndarray) -> float:
+    x, y = points[:, 0].astype(float), points[:, 1].astype(float)
+    return float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])) / 2
+
+
+def _geometry_commands(geometry, kind: str):
+    """MVT geometry commands of one clipped feature in tile coordinates."""
+    commands, cursor = [], np.zeros(2, dtype=np.int64)
+    for part in shapely.get_parts(geometry):
+        if shapely.get_type_id(part) not in ((1, 2) if kind == "line" else (3,)):
+            continue  # clipping can leave stray points or edges
+        if kind == "line":
+            rings = [(shapely.get_coordinates(part), False)]
+        else:
+            # Exterior rings wind with positive area in tile coordinates (y down), holes negative
+            rings = [(shapely.get_coordinates(part.exterior), True)]
+            rings += [(shapely.get_coordinates(interior), False) for interior in part.interiors]
+        for index, (coords, exterior) in enumerate(rings):
+            points = np.rint(coords).astype(np.int64)
+            if kind != "line":
+                area = _signed_area(points)
+                if area == 0:
+                    if index == 0:
+                        break  # the whole polygon collapses at this zoom
+                    continue
+                if (area > 0) != exterior:
+                    points = points[::-1]
+            part_commands, cursor = _path_commands(points, cursor, ring=kind != "line")
+            if part_commands is None:
+                if index == 0 and kind != "line":
+                    break
+                continue
+            commands += part_commands
+    return commands
+
+
+def encode_tile(ids, geometries, kind: str) -> bytes:
+    """One MVT layer of features `ids` with `geometries` in tile coordinates (0 ... EXTENT)."""
+    geom_type = 2 if kind == "line" else 3
+    features, values = [], []
+    for feature_id, geometry in zip(ids, geometries):
+        commands = _geometry_commands(geometry, kind)
+        if not commands:
+            continue
+        # Every feature has a different id value: value i belongs to the i-th feature
+        tags = b"".join(_varint(n) for n in (0, len(values)))
+        values.append(_message(4, _uint(5, int(feature_id))))
+        features.append(_message(2, (
+            _uint(1, int(feature_id))
+            + _message(2, tags)
+            + _uint(3, geom_type)
+            + _message(4, b"".join(_varint(int(n)) for n in commands))
+        )))
+    if not features:
+        return b""
+    layer = (
+        _uint(15, 2)
+        + _message(1, LAYER.encode())
+        + b"".join(features)
+        + _message(3, b"id")
+        + b"".join(values)
+        + _uint(5, EXTENT)
+    )
+    return _message(3, layer)
+
+
+# ============================================================
+# --- TILING ---
+# ============================================================
+def _to_world(coords: np.ndarray) -> np.ndarray:
+    """lon, lat -> web Mercator world coordinates, 0 ... 1 with y down (north at 0)."""
+    lon, lat = coords[:, 0], np.radians(np.clip(coords[:, 1], -85.0511, 85.0511))
+    x = (lon + 180) / 360
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2
+    return np.column_stack([x, y])
+
+
+def _dataset_kind(geometries) -> str:
+    types = shapely.get_type_id(shapely.get_parts(geometries))
+    if np.all(types == 3):
+        return "polygon"
+    if np.all(np.isin(types, (1, 2))):
+        return "line"
+    raise ValueError("tiled geometry must be all polygons or all lines")
+
+
+def tile_geometries(geometries, out_dir, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM) -> dict:
+    """Write the tile pyramid of `geometries` (WGS84) to `out_dir`; returns the tile set's metadata."""
+    geometries = np.asarray(geometries)
+    kind = _dataset_kind(geometries)
+    world = shapely.transform(geometries, _to_world)
+    tree = shapely.STRtree(world)
+    minx, miny, maxx, maxy = shapely.total_bounds(world)
+    out_dir = Path(out_dir)
+    count = 0
+
+    for z in range(min_zoom, max_zoom + 1):
+        scale = 2 ** z
+        buffer = BUFFER / EXTENT / scale
+        for x in range(int(minx * scale), int(maxx * scale) + 1):
+            for y in range(int(miny * scale), int(maxy * scale) + 1):
+                box = (x / scale - buffer, y / scale - buffer, (x + 1) / scale + buffer, (y + 1) / scale + buffer)
+                ids = np.sort(tree.query(shapely.box(*box), predicate="intersects"))
+                clipped = shapely.clip_by_rect(world[ids], *box)
+                local = shapely.transform(clipped, lambda c: (c * scale - (x, y)) * EXTENT)
+                present = ~shapely.is_empty(local)
+                target = out_dir / str(z) / str(x) / f"{y}.pbf"
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(encode_tile(ids[present], local[present], kind))
+                count += 1
+
+    west, south, east, north = shapely.total_bounds(geometries)
+    return {
+        "format": TILES_FORMAT,
+        "kind": kind,
+        "features": len(geometries),
+        "bounds": [west, south, east, north],
+        "min_zoom": min_zoom,
+        "max_zoom": max_zoom,
+        "tiles": count,
+    }
+
+
+def tiles_dir(path) -> Path:
+    """Where `python -m twinning.tiles` writes the tile set of `path`."""
+    return TILES_DIR / Path(path).stem
+
+
+def build_tiles(path, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM) -> Path:
+    """Tile one dataset into a fresh directory; returns the directory."""
+    target = tiles_dir(path)
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    # Tile what the pages show: the dataset as loaded (compiled or not)
+    version = dataset_version(path)
+    meta = tile_geometries(load_dataset(str(path), version).geometry, tmp, min_zoom, max_zoom)
+    meta["source_sha1"] = version
+    (tmp / "tiles.json").write_text(json.dumps(meta))
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return target
+
+
+# ============================================================
+# --- SERVING ---
+# ============================================================
+class TileSource(NamedTuple):
+    key: str             # changes whenever the tile set is rebuilt from another file
+    url: str             # template with {z}/{x}/{y}
+    kind: str            # "polygon" or "line"
+    features: int
+    bounds: list         # west, south, east, north
+    min_zoom: int
+    max_zoom: int
+
+
+def tile_source(path) -> Optional[TileSource]:
+    """The current tile set of `path`, or None if it was not built or is out of date."""
+    meta_path = tiles_dir(path) / "tiles.json"
+    try:
+        meta = json.loads(meta_path.read_text())
+        digest = dataset_version(path)
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != TILES_FORMAT or meta.get("source_sha1") != digest or not serve(_tiles):
+        return None
+
+    base = st.get_option("server.baseUrlPath").strip("/")
+    prefix = f"/{base}" if base else ""
+    url = f"{prefix}/component/{_tiles.name}/{tiles_dir(path).name}/{{z}}/{{x}}/{{y}}.pbf"
+    return TileSource(digest[:16], url, meta["kind"], meta["features"], meta["bounds"],
+                      meta["min_zoom"], meta["max_zoom"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m twinning.tiles", description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="*", help="GeoPackages to tile (default: grid maps and traffic layers)")
+    parser.add_argument("--min-zoom", type=int, default=MIN_ZOOM)
+    parser.add_argument("--max-zoom", type=int, default=MAX_ZOOM)
+    args = parser.parse_args(argv)
+
+    paths = args.paths or sorted(GRID_DIR.glob("*.gpkg")) + sorted(TRAFFIC_DIR.glob("*.gpkg"))
+    TILES_DIR.mkdir(parents=True, exist_ok=True)
+    for path in paths:
+        target = build_tiles(path, args.min_zoom, args.max_zoom)
+        meta = json.loads((target / "tiles.json").read_text())
+        size = sum(f.stat().st_size for f in target.rglob("*.pbf"))
+        print(f"{relative_path(path)} -> {relative_path(target)} ({meta['tiles']} tiles, {size / 1e6:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# twinning/timing.py
+"""
+Server time per interaction on the map pages.
+
+Every slider move used to rerun the whole page script: the CSS blocks, the
+sidebar, headings and buttons, then the data and the maps. The map pages now
+put their sliders, maps and legends in a fragment (`timed_fragment`) that
+reruns on its own when one of its widgets changes. Two kinds of runs are
+timed, per page:
+
+    page        a full run of the page script (first load, sidebar widgets,
+                mode buttons); what a slider move would cost without
+                the fragment
+    fragment    one run of the map fragment's body, alone (slider, opacity,
+                map component) or as part of a page run
+
+The last WINDOW runs of each are kept in memory (`timings()`) and logged at
+DEBUG level to `twinning.timing`. `python -m twinning.bench interactions`
+moves the sliders of every page and compares the two.
+"""
+import functools
+import logging
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from typing import NamedTuple
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+WINDOW = 200
+
+_logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_runs = defaultdict(lambda: deque(maxlen=WINDOW))   # (page, kind) -> ms
+
+
+class Timing(NamedTuple):
+    runs: int
+    median_ms: float
+    max_ms: float
+
+
+def record(page: str, kind: str, started: float):
+    """Record a run of `kind` on `page` that started at `started` (perf_counter)."""
+    ms = (time.perf_counter() - started) * 1000
+    ctx = get_script_run_ctx()
+    alone = bool(ctx and ctx.fragment_ids_this_run)
+    with _lock:
+        _runs[page, kind].append(ms)
+    _logger.debug("%s: %s %.1f ms%s", page, kind, ms, " (fragment rerun)" if alone else "")
+
+
+class PageRun:
+    """Times one run of a page script: create it at the top, call done() at the end."""
+
+    def __init__(self, page: str):
+        self.page = page
+        self.started = time.perf_counter()
+
+    def done(self):
+        record(self.page, "page", self.started)
+
+
+def timed_fragment(page: str):
+    """`st.fragment` whose runs are recorded as `page`'s fragment runs."""
+    def decorate(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(page, "fragment", started)
+        return st.fragment(run)
+    return decorate
+
+
+def timings() -> dict:
+    """{(page, kind): Timing} over the last WINDOW runs of each."""
+    with _lock:
+        runs = {key: list(values) for key, values in _runs.items() if values}
+    return {key: Timing(len(values), statistics.median(values), max(values)) for key, values in runs.items()}
+
+
+def clear():
+    with _lock:
+        _runs.clear()
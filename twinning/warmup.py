@@ -0,0 +1,136 @@
+# twinning/warmup.py
+"""
+Warm-up phase: load every map dataset before the first visitor does.
+
+    python -m twinning.warmup          # warm in this process, print what each dataset took
+    uvicorn twinning.app:app           # serve, warming at startup (see twinning.app)
+
+The first visitor after a deploy used to pay for reading, reprojecting and
+encoding every dataset they opened, and for building its step matrices.
+`start_warmup()` runs twinning.prefetch.warm for every grid and traffic
+dataset on a thread pool, in the background: the dataset, its map geometry
+(and raster), the tile-set check, and the thresholds and step matrices of
+the maps the pages draw under the "default" scheme (twinning.pagemaps).
+It flips a readiness flag when all are done. twinning.app answers
+`/api/ready` from it (503 until warm, then 200), so a load balancer routes
+traffic only to warm replicas; `/_stcore/health` stays the liveness check.
+
+A dataset that fails to warm is reported but does not keep the replica
+unready: its page loads it on demand, as before.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from twinning.build import GRID_DIR
+from twinning.datasets import relative_path
+from twinning.prefetch import warm
+from twinning.tiles import TRAFFIC_DIR
+
+WORKERS = min(4, os.cpu_count() or 1)
+
+_logger = logging.getLogger(__name__)
+
+
+class WarmupStatus(NamedTuple):
+    started: bool
+    ready: bool
+    datasets: int
+    warmed: int
+    failed: list       # paths
+    seconds: float     # since the start, or what the whole warm-up took
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+def map_datasets() -> list:
+    """Every dataset a map page can show, as the pages spell their paths."""
+    return [relative_path(path) for path in sorted(GRID_DIR.glob("*.gpkg")) + sorted(TRAFFIC_DIR.glob("*.gpkg"))]
+
+
+class Warmup:
+    def __init__(self, paths=None, workers=WORKERS):
+        self.paths = list(paths) if paths is not None else map_datasets()
+        self.workers = workers
+        self.times = {}          # path -> ms
+        self.failed = []
+        self._started = None
+        self._finished = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        """Start warming in the background (once); returns False if already started."""
+        with self._lock:
+            if self._started is not None:
+                return False
+            self._started = time.perf_counter()
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+        return True
+
+    def _warm_one(self, path):
+        started = time.perf_counter()
+        try:
+            warm(path)
+        except Exception:
+            _logger.exception("warm-up of %s failed", path)
+            with self._lock:
+                self.failed.append(path)
+            return
+        ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.times[path] = ms
+        _logger.info("warmed %s in %.0f ms", Path(path).stem, ms)
+
+    def _run(self):
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="warmup") as pool:
+            list(pool.map(self._warm_one, self.paths))
+        self._finished = time.perf_counter()
+        self._ready.set()
+        status = self.status()
+        _logger.info("warm-up done: %d of %d datasets in %.1f s", status.warmed, status.datasets, status.seconds)
+
+    def wait(self, timeout=None) -> bool:
+        """Block until warm (or `timeout` seconds); returns readiness."""
+        return self._ready.wait(timeout)
+
+    def status(self) -> WarmupStatus:
+        with self._lock:
+            started, finished = self._started, self._finished
+            warmed, failed = len(self.times), list(self.failed)
+        seconds = 0.0 if started is None else (finished or time.perf_counter()) - started
+        return WarmupStatus(started is not None, self._ready.is_set(), len(self.paths), warmed, failed, round(seconds, 3))
+
+
+# The process's warm-up
+WARMUP = Warmup()
+
+
+def start_warmup() -> bool:
+    return WARMUP.start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m twinning.warmup", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=WORKERS, help="datasets warmed in parallel (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    warmup = Warmup(workers=args.workers)
+    warmup.start()
+    warmup.wait()
+    for path in warmup.paths:
+        ms = warmup.times.get(path)
+        print(f"{path:<80}{'failed' if ms is None else f'{ms:8.0f} ms'}")
+    status = warmup.status()
+    print(f"{status.warmed} of {status.datasets} datasets warm in {status.seconds:.1f} s ({args.workers} workers)")
+    raise SystemExit(1 if status.failed else 0)
+
+
+if __name__ == "__main__":
+    main()